@@ -1,16 +1,45 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, g
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, g, session, Response, send_file, abort, has_request_context, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from twilio.request_validator import RequestValidator
 import os
+import hashlib
+import hmac
 import json
-from twilio.rest import Client
+import mimetypes
+import queue
+import shlex
+import sys
+import threading
+import time
+import uuid
+from functools import lru_cache
+from types import SimpleNamespace
+from markupsafe import Markup
+from basedatos import url_base_datos, opciones_motor
+from eventos import crear_bus_eventos, formato_sse
+from cache import CacheMemoria, crear_cache
+from twilio_envio import ClienteTwilio, ErrorEnvio, LimitadorTasa
+from media import AlmacenMedia, ErrorDescarga
+from metricas import RegistroMetricas, ConsultasPeticion, LIMITES_CONSULTAS
+from archivo_mensajes import comprimir, descomprimir, agrupar_en_bloques, CAMPOS as CAMPOS_ARCHIVO
+from respuestas import ProveedorJSON, respuesta_json_lista, comprimir_respuesta
+from estaticos import RecursosEstaticos, RECURSOS_CDN
+from busqueda import (ddl_busqueda, ddl_busqueda_archivo, expresion_busqueda, indexar_archivados,
+                      desindexar_archivados, resaltar, INICIO_RESALTADO, FIN_RESALTADO)
+from informes import (CAMPOS_RESUMEN, COLUMNAS_CSV, recalcular_dias, informe_ingresos, informe_ocupacion,
+                      ingresos_por_mes, ocupacion_fines_de_semana, reservas_detalle, lineas_csv)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'tu-clave-secreta-cambiar-en-produccion')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///finca_reservas.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = url_base_datos(os.environ.get('DATABASE_URL', 'sqlite:///finca_reservas.db'))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones_motor(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.json = ProveedorJSON(app)  # orjson si está instalado
 
 db = SQLAlchemy(app)
 login_manager = LoginManager()
@@ -21,16 +50,277 @@ login_manager.login_view = 'login'
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', '')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', '')
 TWILIO_WHATSAPP_NUMBER = os.environ.get('TWILIO_WHATSAPP_NUMBER', 'whatsapp:+14155238886')
+TWILIO_API_URL = os.environ.get('TWILIO_API_URL', 'https://api.twilio.com')  # Permite un Twilio falso local
+
+# Cola de envío de WhatsApp (hilos en segundo plano)
+COLA_ENVIO_ACTIVA = os.environ.get('COLA_ENVIO_ACTIVA', '1') == '1'
+COLA_ENVIO_HILOS = int(os.environ.get('COLA_ENVIO_HILOS', 2))
+COLA_ENVIO_TASA = float(os.environ.get('COLA_ENVIO_TASA', 5))  # mensajes por segundo y proceso
+COLA_ENVIO_MAX_INTENTOS = 5
+COLA_ENVIO_ESPERA_BASE = 2  # segundos; se duplica en cada reintento
+COLA_ENVIO_ESPERA_MAX = 300
+COLA_ENVIO_BLOQUEO = 60  # segundos que un hilo se reserva un mensaje
+COLA_ENVIO_INTERVALO = 2  # segundos entre búsquedas de mensajes pendientes
+
+# Procesado diferido del webhook de Twilio
+PROCESADOR_WEBHOOK_ACTIVO = os.environ.get('PROCESADOR_WEBHOOK_ACTIVO', '1') == '1'
+PROCESADOR_WEBHOOK_LOTE = 100  # entradas por transacción
+PROCESADOR_WEBHOOK_BLOQUEO = 60  # segundos que un proceso se reserva un lote
+PROCESADOR_WEBHOOK_INTERVALO = 1  # segundos entre búsquedas de entradas pendientes
+WEBHOOK_RETENCION_DIAS = 7  # días que se conservan las entradas para detectar reintentos
+# Firma X-Twilio-Signature del webhook: solo se desactiva en desarrollo (WEBHOOK_VALIDAR_FIRMA=0)
+WEBHOOK_VALIDAR_FIRMA = os.environ.get('WEBHOOK_VALIDAR_FIRMA', '1') == '1'
+# URL pública configurada en Twilio, si detrás del proxy request.url no coincide con ella
+WEBHOOK_URL_PUBLICA = os.environ.get('WEBHOOK_URL_PUBLICA', '')
+validador_twilio = RequestValidator(TWILIO_AUTH_TOKEN)
+
+# Caché local de archivos multimedia recibidos
+MEDIA_ACTIVO = os.environ.get('MEDIA_ACTIVO', '1') == '1'
+MEDIA_DIR = os.environ.get('MEDIA_DIR', os.path.join(app.instance_path, 'media'))
+MEDIA_TAMANO_MAX = int(os.environ.get('MEDIA_TAMANO_MAX_MB', 500)) * 1024 * 1024  # expulsión LRU por encima
+MEDIA_MAX_INTENTOS = 3
+MEDIA_BLOQUEO = 120  # segundos que un hilo se reserva una descarga
+MEDIA_CACHE_SEGUNDOS = 365 * 24 * 3600  # el contenido nunca cambia para un mismo hash
+# Orígenes de los que se descargan las MediaUrl del webhook (y a los que se envían las credenciales)
+MEDIA_ORIGENES = ('https://api.twilio.com', 'https://*.twiliocdn.com', TWILIO_API_URL.rstrip('/'))
+almacen_media = AlmacenMedia(MEDIA_DIR, MEDIA_ORIGENES)
+
+# Prefijo por defecto para teléfonos nacionales sin código de país
+TELEFONO_PREFIJO_PAIS = os.environ.get('TELEFONO_PREFIJO_PAIS', '34')
+
+# Paginación de conversaciones
+MENSAJES_POR_PAGINA = 50
+MENSAJES_POR_PAGINA_MAX = 200
+
+# Archivo de mensajes antiguos (python archivar.py, por ejemplo cada noche desde cron)
+# Los mensajes archivados salen de la tabla mensaje y se guardan comprimidos en
+# bloque_mensajes; la conversación los lee al retroceder más allá de los recientes
+ARCHIVO_DIAS = int(os.environ.get('ARCHIVO_DIAS', 180))  # antigüedad mínima para archivar
+ARCHIVO_CONSERVAR = MENSAJES_POR_PAGINA  # mensajes más recientes de cada conversación que no se archivan
+ARCHIVO_MENSAJES_POR_BLOQUE = 500
+ARCHIVO_LOTE = 2000  # mensajes archivados por transacción
+
+# Paginación del listado de reservas
+RESERVAS_POR_PAGINA = 50
+
+# Búsqueda de texto completo (/api/buscar)
+BUSQUEDA_POR_PAGINA = 20
+BUSQUEDA_POR_PAGINA_MAX = 50
+BUSQUEDA_CANDIDATOS = 1000  # coincidencias más recientes que se ordenan por relevancia
+
+# Disponibilidad de la finca
+ESTADOS_QUE_OCUPAN = ('confirmada',)  # estados de reserva que bloquean su horario
+DURACION_MAX_RESERVA = timedelta(days=1)  # una reserva acaba como mucho al día siguiente
+DISPONIBILIDAD_DIAS_MAX = 400  # días por consulta de huecos libres
+
+# Estadísticas del panel principal
+# Se invalidan al crear, borrar o cambiar de estado una reserva; la clave lleva
+# la versión de la tabla reserva, así que los cambios hechos por otros workers
+# también las invalidan. La caducidad cubre los mensajes enviados
+ESTADISTICAS_CACHE_SEGUNDOS = int(os.environ.get('ESTADISTICAS_CACHE_SEGUNDOS', 60))
+PROXIMAS_RESERVAS_PANEL = 5
+
+# Notificaciones en tiempo real (SSE)
+# EVENTOS_BACKEND=redis comparte los eventos entre varios workers de gunicorn
+EVENTOS_BACKEND = os.environ.get('EVENTOS_BACKEND', 'memoria')
+EVENTOS_DURACION_MAX = int(os.environ.get('EVENTOS_DURACION_MAX', 300))  # segundos por conexión
+EVENTOS_KEEPALIVE = 15  # segundos entre comentarios keep-alive
+# Cada conexión ocupa un hilo del worker: por encima del límite se responde 503
+# y el navegador sigue con el polling (dejar hilos libres para el resto de peticiones)
+EVENTOS_CONEXIONES_MAX = int(os.environ.get('EVENTOS_CONEXIONES_MAX', 8))  # por proceso
+bus_eventos = crear_bus_eventos(EVENTOS_BACKEND, os.environ.get('REDIS_URL'))
+
+# Caché de contactos (teléfono -> reserva y nombre) y de reservas por id
+# Se invalida al crear, modificar o borrar una reserva. En memoria cada worker
+# tiene la suya y ve los cambios de los demás al caducar; CACHE_BACKEND=redis
+# la comparte entre todos los workers (usa REDIS_URL)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memoria')
+CACHE_SEGUNDOS = int(os.environ.get('CACHE_SEGUNDOS', 60))
+CACHE_MAX_ELEMENTOS = 10000  # entradas por proceso con la caché en memoria (LRU)
+
+# Fragmentos HTML del listado de reservas (tarjeta o fila de cada reserva)
+# La clave lleva el updated_at de la reserva: al modificarla se renderiza de nuevo
+FRAGMENTOS_SEGUNDOS = int(os.environ.get('FRAGMENTOS_SEGUNDOS', 3600))
+FRAGMENTOS_MAX_ELEMENTOS = 5000  # fragmentos por proceso (LRU)
+
+# Sesiones de usuario
+# La cookie (firmada, pero legible) solo lleva el id del usuario y su versión
+# de sesión; el nombre y los permisos se leen de la caché de datos. Cambiar la
+# contraseña o los permisos sube la versión en la base de datos y revoca las
+# sesiones abiertas. Con CACHE_BACKEND=redis la revocación es inmediata en
+# todos los workers; con la caché en memoria, los demás workers tardan como
+# mucho CACHE_SEGUNDOS. La versión se comprueba en la base de datos cada
+# USUARIO_SESION_SEGUNDOS en cualquier caso.
+USUARIO_SESION_SEGUNDOS = int(os.environ.get('USUARIO_SESION_SEGUNDOS', 60))
+USER_AGENTS_CACHE = 512  # clasificaciones móvil/escritorio memorizadas por proceso
+RUTAS_SIN_DISPOSITIVO = ('static', 'recurso_empaquetado', 'service_worker', 'whatsapp_webhook', 'exponer_metricas')  # no renderizan plantillas
+
+# Compresión de las respuestas (gzip, o brotli si está instalado)
+COMPRESION_ACTIVA = os.environ.get('COMPRESION_ACTIVA', '1') == '1'  # desactivar si ya comprime el proxy
+COMPRESION_MINIMO = 1024  # bytes; las respuestas más pequeñas se envían tal cual
+COMPRESION_NIVEL_GZIP = 5
+COMPRESION_NIVEL_BROTLI = 4
+
+# Paquetes de CSS y JS por plantilla (python construir_estaticos.py en cada despliegue)
+RECURSOS_CACHE_SEGUNDOS = 365 * 24 * 3600  # el nombre lleva el hash del contenido
+
+# Métricas de rendimiento (/metrics en formato Prometheus)
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')  # 'Authorization: Bearer <token>' para Prometheus; sin él, solo con sesión
+METRICAS_CABECERA = os.environ.get('METRICAS_CABECERA', '0') == '1'  # cabecera Server-Timing en cada respuesta
+SQL_LENTA_MS = int(os.environ.get('SQL_LENTA_MS', 200))  # consultas más lentas se registran en el log
+SQL_REPETICIONES_N_MAS_1 = int(os.environ.get('SQL_REPETICIONES_N_MAS_1', 10))  # misma consulta en una petición
+
+
+# ============= MÉTRICAS DE RENDIMIENTO =============
+
+metricas = RegistroMetricas()
+metrica_peticiones = metricas.histograma(
+    'http_peticion_segundos', 'Duración de las peticiones HTTP', ('endpoint', 'metodo', 'estado')
+)
+metrica_consultas = metricas.histograma(
+    'http_peticion_consultas_sql', 'Consultas SQL por petición', ('endpoint',), LIMITES_CONSULTAS
+)
+metrica_tiempo_sql = metricas.histograma(
+    'http_peticion_sql_segundos', 'Tiempo en consultas SQL por petición', ('endpoint',)
+)
+metrica_sql_lentas = metricas.contador(
+    'sql_consultas_lentas_total', f'Consultas SQL de más de {SQL_LENTA_MS} ms', ('endpoint',)
+)
+metrica_n_mas_1 = metricas.contador(
+    'sql_patron_n_mas_1_total', 'Peticiones que repiten una misma consulta SQL', ('endpoint',)
+)
+metrica_twilio = metricas.histograma(
+    'twilio_peticion_segundos', 'Duración de las llamadas a Twilio', ('operacion',)
+)
+metrica_twilio_errores = metricas.contador(
+    'twilio_errores_total', 'Llamadas a Twilio con error', ('operacion',)
+)
+metrica_cache = metricas.contador(
+    'cache_lecturas_total', 'Lecturas de la caché de datos por resultado (acierto o fallo)', ('espacio', 'resultado')
+)
+metrica_render = metricas.histograma(
+    'plantilla_render_segundos', 'Duración del renderizado de las plantillas', ('plantilla',)
+)
+
+
+def endpoint_actual():
+    """Nombre del endpoint para las etiquetas ('segundo_plano' fuera de una petición)"""
+    if not has_request_context():
+        return 'segundo_plano'
+    return request.endpoint or 'sin_ruta'
+
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def iniciar_medicion_sql(conn, cursor, sentencia, parametros, contexto, executemany):
+    conn.info.setdefault('inicio_consultas', []).append(time.perf_counter())
+
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def registrar_medicion_sql(conn, cursor, sentencia, parametros, contexto, executemany):
+    segundos = time.perf_counter() - conn.info['inicio_consultas'].pop()
+    
+    if has_request_context() and 'consultas_sql' in g:
+        g.consultas_sql.registrar(sentencia, segundos)
+    
+    if segundos * 1000 >= SQL_LENTA_MS:
+        endpoint = endpoint_actual()
+        metrica_sql_lentas.inc(endpoint=endpoint)
+        app.logger.warning('🐢 Consulta lenta (%.0f ms) en %s: %s', segundos * 1000, endpoint, ' '.join(sentencia.split())[:500])
+
+
+@app.before_request
+def iniciar_medicion_peticion():
+    g.inicio_peticion = time.perf_counter()
+    g.consultas_sql = ConsultasPeticion()
+
+
+@app.after_request
+def registrar_medicion_peticion(response):
+    if 'inicio_peticion' not in g:
+        return response
+    
+    segundos = time.perf_counter() - g.inicio_peticion
+    consultas = g.consultas_sql
+    endpoint = endpoint_actual()
+    
+    metrica_peticiones.observar(segundos, endpoint=endpoint, metodo=request.method, estado=response.status_code)
+    metrica_consultas.observar(consultas.total, endpoint=endpoint)
+    metrica_tiempo_sql.observar(consultas.segundos, endpoint=endpoint)
+    
+    repetidas = consultas.repetidas(SQL_REPETICIONES_N_MAS_1)
+    if repetidas:
+        metrica_n_mas_1.inc(endpoint=endpoint)
+        sentencia, veces = repetidas[0]
+        app.logger.warning('⚠️  Posible N+1 en %s: %d veces la misma consulta: %s', endpoint, veces, sentencia[:300])
+    
+    if METRICAS_CABECERA or app.debug:
+        response.headers['Server-Timing'] = (
+            f'app;dur={segundos * 1000:.1f}, '
+            f'sql;dur={consultas.segundos * 1000:.1f};desc="{consultas.total} consultas"'
+        )
+    return response
+
+
+# ============= COMPRESIÓN DE RESPUESTAS =============
+
+@app.after_request
+def comprimir_respuestas(response):
+    if COMPRESION_ACTIVA:
+        comprimir_respuesta(
+            response, request.accept_encodings, COMPRESION_MINIMO, COMPRESION_NIVEL_GZIP, COMPRESION_NIVEL_BROTLI
+        )
+    return response
+
+
+# ============= RECURSOS ESTÁTICOS =============
+
+recursos = RecursosEstaticos(app.static_folder).cargar()
+if recursos.desactualizados:
+    print(f"⚠️  Paquetes estáticos desactualizados, se sirven los originales: "
+          f"{', '.join(recursos.desactualizados)} (ejecuta python construir_estaticos.py)")
+
+
+@app.template_global()
+def urls_paquete(nombre):
+    """URLs del CSS o JS de una plantilla: el paquete construido o, si no lo hay, sus originales"""
+    archivo = None if app.debug else recursos.archivo(nombre)
+    if archivo:
+        return [url_for('recurso_empaquetado', archivo=archivo)]
+    return [url_for('static', filename=origen) for origen in recursos.origenes(nombre)]
 
 
 # ============= DETECCIÓN DE MÓVIL =============
 
+MOBILE_KEYWORDS = ('mobile', 'android', 'iphone', 'ipad', 'ipod', 'blackberry', 'windows phone')
+
+
+@lru_cache(maxsize=USER_AGENTS_CACHE)
+def es_user_agent_movil(user_agent):
+    """Clasificar un User-Agent (memorizado: los navegadores se repiten mucho)"""
+    user_agent = user_agent.lower()
+    return any(keyword in user_agent for keyword in MOBILE_KEYWORDS)
+
+
 @app.before_request
 def detect_mobile():
     """Detectar si el usuario está en un dispositivo móvil"""
-    user_agent = request.headers.get('User-Agent', '').lower()
-    mobile_keywords = ['mobile', 'android', 'iphone', 'ipad', 'ipod', 'blackberry', 'windows phone']
-    g.is_mobile = any(keyword in user_agent for keyword in mobile_keywords)
+    if request.endpoint in RUTAS_SIN_DISPOSITIVO:
+        g.is_mobile = False
+        return
+    g.is_mobile = es_user_agent_movil(request.headers.get('User-Agent', ''))
+
+
+# ============= RENDERIZADO DE PLANTILLAS =============
+
+# Las plantillas disponibles se listan una vez al arrancar: saber si existe la
+# versión móvil no cuesta un intento de renderizado fallido en cada petición
+PLANTILLAS_DISPONIBLES = frozenset(app.jinja_env.list_templates())
+
+
+def renderizar(plantilla, **context):
+    """render_template midiendo la duración (plantilla_render_segundos en /metrics)"""
+    with metrica_render.medir(plantilla=plantilla):
+        return render_template(plantilla, **context)
 
 
 def render_mobile_or_desktop(desktop_template, mobile_template=None, **context):
@@ -38,72 +328,1705 @@ def render_mobile_or_desktop(desktop_template, mobile_template=None, **context):
     Renderiza la plantilla móvil o desktop según el dispositivo
     Si no existe plantilla móvil, usa la desktop
     """
-    if g.is_mobile and mobile_template:
+    if g.is_mobile and mobile_template in PLANTILLAS_DISPONIBLES:
+        return renderizar(mobile_template, **context)
+    return renderizar(desktop_template, **context)
+
+
+# Aspecto de cada estado en el listado de reservas (otro estado se muestra como cancelada)
+ESTADOS_RESERVA = {
+    'confirmada': {'color': 'success', 'icono': 'bi-check-circle', 'texto': 'Confirmada', 'simbolo': '✓'},
+    'pendiente': {'color': 'warning', 'icono': 'bi-clock', 'texto': 'Pendiente', 'simbolo': '⏰'},
+    'cancelada': {'color': 'danger', 'icono': 'bi-x-circle', 'texto': 'Cancelada', 'simbolo': '✕'},
+}
+app.jinja_env.globals['ESTADOS_RESERVA'] = ESTADOS_RESERVA
+
+cache_fragmentos = CacheMemoria(FRAGMENTOS_MAX_ELEMENTOS, FRAGMENTOS_SEGUNDOS, metrica_cache)
+
+
+@app.template_global()
+def fragmentos_reservas(reservas):
+    """
+    HTML de cada reserva del listado: tarjeta en móvil, fila de tabla en escritorio
+    Se guarda por id y updated_at, así que una reserva modificada se renderiza
+    de nuevo sin invalidar nada; las versiones antiguas salen por la LRU.
+    """
+    espacio, plantilla = ('tarjeta_reserva', '_reserva_tarjeta.html') if g.is_mobile \
+        else ('fila_reserva', '_reserva_fila.html')
+    por_clave = {f'{r.id}:{r.updated_at.isoformat() if r.updated_at else ""}': r for r in reservas}
+
+    def cargar(claves):
+        with metrica_render.medir(plantilla=plantilla):
+            fragmento = app.jinja_env.get_template(plantilla)
+            return {clave: Markup(fragmento.render(reserva=por_clave[clave])) for clave in claves}
+
+    fragmentos = cache_fragmentos.leer(espacio, list(por_clave), cargar)
+    return [fragmentos[clave] for clave in por_clave]
+
+# ============= MODELOS DE BASE DE DATOS =============
+
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password_hash = db.Column(db.String(200), nullable=False)
+    is_admin = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Se incrementa al cambiar la contraseña o los permisos: revoca las sesiones abiertas
+    version_sesion = db.Column(db.Integer, nullable=False, default=1)
+
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+
+
+class Reserva(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cliente_nombre = db.Column(db.String(100), nullable=False)
+    cliente_telefono = db.Column(db.String(20), nullable=False)
+    cliente_email = db.Column(db.String(120))
+    fecha_evento = db.Column(db.Date, nullable=False)
+    hora_inicio = db.Column(db.Time, nullable=False)
+    hora_fin = db.Column(db.Time, nullable=False)
+    num_invitados = db.Column(db.Integer)
+    tipo_celebracion = db.Column(db.String(50))
+    precio = db.Column(db.Float)
+    anticipo = db.Column(db.Float, default=0)
+    estado = db.Column(db.String(20), default='confirmada')
+    notas = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    telefono_norm = db.Column(db.String(20), index=True)  # Teléfono en formato E.164
+    inicio_at = db.Column(db.DateTime)  # Intervalo ocupado (fecha + horas; puede acabar al día siguiente)
+    fin_at = db.Column(db.DateTime)
+
+    mensajes = db.relationship('Mensaje', backref='reserva', lazy=True, cascade='all, delete-orphan')
+
+    __table_args__ = (
+        # Consultas del calendario por ventana de fechas
+        db.Index('ix_reserva_estado_fecha_evento', 'estado', 'fecha_evento'),
+        # Listado de reservas ordenado por fecha (el id va implícito en SQLite)
+        db.Index('ix_reserva_fecha_evento', 'fecha_evento'),
+        # Búsqueda de solapes y huecos libres por intervalo
+        db.Index('ix_reserva_estado_inicio_fin', 'estado', 'inicio_at', 'fin_at'),
+    )
+
+
+class Mensaje(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    reserva_id = db.Column(db.Integer, db.ForeignKey('reserva.id'), nullable=True)  # Puede ser NULL
+    telefono_destino = db.Column(db.String(20), nullable=False)
+    telefono_origen = db.Column(db.String(20))
+    contenido = db.Column(db.Text, nullable=False)
+    tipo = db.Column(db.String(20), default='whatsapp')
+    direccion = db.Column(db.String(20), default='saliente')  # 'saliente' o 'entrante'
+    estado = db.Column(db.String(20), default='enviado')
+    twilio_sid = db.Column(db.String(100), index=True)
+    num_media = db.Column(db.Integer, default=0)  # Número de archivos multimedia
+    media_urls = db.Column(db.Text)  # URLs de archivos multimedia (JSON)
+    media_types = db.Column(db.Text)  # Tipos de archivos multimedia (JSON)
+    enviado_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    telefono_norm = db.Column(db.String(20))  # Teléfono del cliente en formato E.164
+    intentos = db.Column(db.Integer, default=0)  # Intentos de envío realizados
+    proximo_intento_at = db.Column(db.DateTime)  # Cuándo puede volver a procesarse en la cola
+    error_envio = db.Column(db.Text)  # Último error devuelto por Twilio
+    difusion_id = db.Column(db.Integer, db.ForeignKey('difusion.id'), nullable=True, index=True)
+
+    __table_args__ = (
+        # Paginación de conversaciones por teléfono y fecha
+        db.Index('ix_mensaje_telefono_norm_enviado_at', 'telefono_norm', 'enviado_at'),
+        # Búsqueda de mensajes pendientes en la cola de envío
+        db.Index('ix_mensaje_estado_proximo_intento', 'estado', 'proximo_intento_at'),
+    )
+
+
+class Difusion(db.Model):
+    """Envío masivo de un mensaje con plantilla a un grupo de reservas"""
+    id = db.Column(db.Integer, primary_key=True)
+    plantilla = db.Column(db.Text, nullable=False)
+    filtros = db.Column(db.Text)  # Filtros aplicados (JSON)
+    total = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+    mensajes = db.relationship('Mensaje', backref='difusion', lazy=True)
+
+
+class EntradaWebhook(db.Model):
+    """Payload crudo de un webhook de Twilio, pendiente de convertirse en Mensaje"""
+    id = db.Column(db.Integer, primary_key=True)
+    message_sid = db.Column(db.String(100), unique=True, nullable=False)  # Deduplica reintentos
+    payload = db.Column(db.Text, nullable=False)  # Formulario recibido (JSON)
+    recibido_at = db.Column(db.DateTime, default=datetime.utcnow)
+    lote = db.Column(db.String(32))  # Proceso que lo está tratando
+    reclamado_at = db.Column(db.DateTime)
+    procesado_at = db.Column(db.DateTime, index=True)
+
+
+class ArchivoMedia(db.Model):
+    """Copia local de un archivo multimedia recibido por WhatsApp"""
+    id = db.Column(db.Integer, primary_key=True)
+    url_origen = db.Column(db.String(500), unique=True, nullable=False)  # MediaUrl de Twilio
+    sha256 = db.Column(db.String(64), index=True)  # Nombre del archivo en disco
+    content_type = db.Column(db.String(100))
+    tamano = db.Column(db.Integer, default=0)
+    tiene_miniatura = db.Column(db.Boolean, default=False)
+    estado = db.Column(db.String(20), default='pendiente')  # pendiente, descargando, descargado, error, expulsado
+    intentos = db.Column(db.Integer, default=0)
+    reclamado_at = db.Column(db.DateTime)
+    ultimo_acceso = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class VersionTabla(db.Model):
+    """Contador de cambios de una tabla, usado como clave de caché y ETag de sus consultas"""
+    tabla = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Contacto(db.Model):
+    """Relación teléfono normalizado -> cliente, para búsquedas por igualdad"""
+    id = db.Column(db.Integer, primary_key=True)
+    telefono_norm = db.Column(db.String(20), unique=True, nullable=False)
+    nombre = db.Column(db.String(100))
+    reserva_id = db.Column(db.Integer, db.ForeignKey('reserva.id'), nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class BloqueMensajes(db.Model):
+    """Mensajes archivados de una conversación, comprimidos (archivo_mensajes.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    telefono_norm = db.Column(db.String(20), nullable=False)
+    desde = db.Column(db.DateTime, nullable=False)  # enviado_at del primer y del último mensaje
+    hasta = db.Column(db.DateTime, nullable=False)
+    id_min = db.Column(db.Integer, nullable=False)  # ids de mensaje del bloque
+    id_max = db.Column(db.Integer, nullable=False)
+    num_mensajes = db.Column(db.Integer, default=0)
+    num_salientes = db.Column(db.Integer, default=0)
+    num_media = db.Column(db.Integer, default=0)
+    datos = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Páginas anteriores de una conversación, del bloque más reciente al más antiguo
+        db.Index('ix_bloque_mensajes_telefono_hasta', 'telefono_norm', 'hasta'),
+    )
+
+
+class ResumenDiario(db.Model):
+    """Totales de las reservas por día, tipo y estado para los informes (informes.py)"""
+    fecha = db.Column(db.Date, primary_key=True)
+    tipo_celebracion = db.Column(db.String(50), primary_key=True)  # '' si la reserva no tiene tipo
+    estado = db.Column(db.String(20), primary_key=True)
+    reservas = db.Column(db.Integer, nullable=False, default=0)
+    ingresos = db.Column(db.Float, nullable=False, default=0)  # suma de precio
+    anticipos = db.Column(db.Float, nullable=False, default=0)
+    invitados = db.Column(db.Integer, nullable=False, default=0)
+    con_invitados = db.Column(db.Integer, nullable=False, default=0)  # reservas que indican invitados
+
+
+# ============= TELÉFONOS NORMALIZADOS =============
+
+def normalizar_telefono(telefono):
+    """
+    Convierte un teléfono a formato E.164 (+34600111222)
+    Acepta prefijo 'whatsapp:', espacios, guiones y prefijo internacional 00
+    """
+    if not telefono:
+        return None
+    
+    telefono = telefono.strip()
+    if telefono.startswith('whatsapp:'):
+        telefono = telefono[len('whatsapp:'):]
+    
+    digitos = ''.join(c for c in telefono if c.isdigit())
+    if not digitos:
+        return None
+    
+    if telefono.startswith('+'):
+        return f'+{digitos}'
+    if digitos.startswith('00'):
+        return f'+{digitos[2:]}'
+    if len(digitos) <= 9:
+        # Número nacional sin código de país
+        return f'+{TELEFONO_PREFIJO_PAIS}{digitos}'
+    return f'+{digitos}'
+
+
+def telefono_contacto(mensaje):
+    """Teléfono del cliente: el origen si es entrante, el destino si es saliente"""
+    if mensaje.direccion == 'entrante':
+        return mensaje.telefono_origen
+    return mensaje.telefono_destino
+
+
+def guardar_contacto(conn, telefono_norm, nombre, reserva_id):
+    """Crear o actualizar el contacto de un teléfono normalizado"""
+    if not telefono_norm:
+        return
+    
+    tabla = Contacto.__table__
+    ahora = datetime.utcnow()
+    resultado = conn.execute(
+        tabla.update()
+        .where(tabla.c.telefono_norm == telefono_norm)
+        .values(nombre=nombre, reserva_id=reserva_id, updated_at=ahora)
+    )
+    if resultado.rowcount == 0:
+        conn.execute(tabla.insert().values(
+            telefono_norm=telefono_norm,
+            nombre=nombre,
+            reserva_id=reserva_id,
+            updated_at=ahora
+        ))
+
+
+@db.event.listens_for(Reserva, 'before_insert')
+@db.event.listens_for(Reserva, 'before_update')
+def normalizar_telefono_reserva(mapper, connection, target):
+    target.telefono_norm = normalizar_telefono(target.cliente_telefono)
+
+
+def telefonos_anteriores(target):
+    """Teléfonos normalizados que tenía la reserva antes de este flush"""
+    return [t for t in db.inspect(target).attrs.telefono_norm.history.deleted if t and t != target.telefono_norm]
+
+
+@db.event.listens_for(Reserva, 'after_insert')
+@db.event.listens_for(Reserva, 'after_update')
+def actualizar_contacto_reserva(mapper, connection, target):
+    # Si cambió el teléfono, el contacto anterior deja de apuntar a esta reserva
+    anteriores = telefonos_anteriores(target)
+    if anteriores:
+        tabla = Contacto.__table__
+        connection.execute(
+            tabla.update()
+            .where(tabla.c.telefono_norm.in_(anteriores), tabla.c.reserva_id == target.id)
+            .values(reserva_id=None)
+        )
+    guardar_contacto(connection, target.telefono_norm, target.cliente_nombre, target.id)
+
+
+@db.event.listens_for(Reserva, 'after_delete')
+def desvincular_contacto_reserva(mapper, connection, target):
+    tabla = Contacto.__table__
+    connection.execute(
+        tabla.update()
+        .where(tabla.c.reserva_id == target.id)
+        .values(reserva_id=None)
+    )
+
+
+@db.event.listens_for(Mensaje, 'before_insert')
+@db.event.listens_for(Mensaje, 'before_update')
+def normalizar_telefono_mensaje(mapper, connection, target):
+    target.telefono_norm = normalizar_telefono(telefono_contacto(target))
+
+
+# ============= VERSIONES DE TABLAS =============
+
+def incrementar_version_tabla(conn, tabla):
+    """Incrementar el contador de cambios de una tabla en la transacción actual"""
+    versiones = VersionTabla.__table__
+    resultado = conn.execute(
+        versiones.update()
+        .where(versiones.c.tabla == tabla)
+        .values(version=versiones.c.version + 1)
+    )
+    if resultado.rowcount == 0:
+        conn.execute(versiones.insert().values(tabla=tabla, version=1))
+
+
+def bloquear_version_tabla(conn, tabla):
+    """
+    Tomar hasta el commit el bloqueo de escritura de una tabla sin cambiar su versión
+    Se reescribe su fila de version_tabla con el mismo valor: en SQLite la
+    transacción pasa a tener el bloqueo de escritura y en PostgreSQL el de esa fila.
+    """
+    versiones = VersionTabla.__table__
+    resultado = conn.execute(
+        versiones.update()
+        .where(versiones.c.tabla == tabla)
+        .values(version=versiones.c.version)
+    )
+    if resultado.rowcount == 0:
+        conn.execute(versiones.insert().values(tabla=tabla, version=0))
+
+
+def version_tabla(tabla):
+    """Versión actual de una tabla (0 si nunca ha cambiado)"""
+    return db.session.query(VersionTabla.version).filter_by(tabla=tabla).scalar() or 0
+
+
+@db.event.listens_for(Reserva, 'after_insert')
+@db.event.listens_for(Reserva, 'after_update')
+@db.event.listens_for(Reserva, 'after_delete')
+def incrementar_version_reservas(mapper, connection, target):
+    incrementar_version_tabla(connection, 'reserva')
+
+
+# ============= RESUMEN DIARIO PARA INFORMES =============
+
+def actualizar_resumen_diario(connection, target):
+    """
+    Volver a agregar el día de la reserva (y el anterior si cambió de fecha)
+    en la misma transacción: si el cambio se deshace, el resumen también
+    
+    Antes se toma el bloqueo de escritura de las reservas. Así dos
+    transacciones que cambian el mismo día lo agregan una detrás de otra, y
+    la segunda ve las reservas que guardó la primera.
+    """
+    bloquear_version_tabla(connection, 'reserva')
+    fechas = [target.fecha_evento, *db.inspect(target).attrs.fecha_evento.history.deleted]
+    recalcular_dias(connection, Reserva.__table__, ResumenDiario.__table__, fechas)
+
+
+@db.event.listens_for(Reserva, 'after_insert')
+@db.event.listens_for(Reserva, 'after_delete')
+def resumen_reserva_creada_o_borrada(mapper, connection, target):
+    actualizar_resumen_diario(connection, target)
+
+
+@db.event.listens_for(Reserva, 'after_update')
+def resumen_reserva_modificada(mapper, connection, target):
+    atributos = db.inspect(target).attrs
+    # Los cambios que no afectan a los totales (notas, teléfono...) no lo tocan
+    if any(atributos[campo].history.has_changes() for campo in CAMPOS_RESUMEN):
+        actualizar_resumen_diario(connection, target)
+
+
+# ============= CACHÉ DE RESERVAS Y CONTACTOS =============
+
+cache_datos = crear_cache(
+    CACHE_BACKEND, os.environ.get('REDIS_URL'), CACHE_MAX_ELEMENTOS, CACHE_SEGUNDOS, metrica_cache
+)
+
+
+def cargar_contactos(telefonos):
+    return {fila.telefono_norm: {'reserva_id': fila.reserva_id, 'nombre': fila.nombre} for fila in
+            db.session.query(Contacto.telefono_norm, Contacto.reserva_id, Contacto.nombre).filter(
+                Contacto.telefono_norm.in_(telefonos)
+            )}
+
+
+def contactos_por_telefono(telefonos):
+    """Contacto ({'reserva_id', 'nombre'} o None) de cada teléfono normalizado, desde la caché"""
+    return cache_datos.leer('contacto', {t for t in telefonos if t}, cargar_contactos)
+
+
+def cargar_reserva(reserva_id):
+    reserva = db.session.get(Reserva, reserva_id)
+    return serializar_reserva(reserva) if reserva else None
+
+
+def reserva_por_id(reserva_id):
+    """Datos de una reserva (como serializar_reserva) o None si no existe, desde la caché"""
+    return cache_datos.leer_uno('reserva', reserva_id, cargar_reserva)
+
+
+def invalidar_cache(target, espacio, ids):
+    """
+    Olvidar valores de la caché de datos al modificar `target`
+    Se borran ya y otra vez tras el commit, por si otro hilo los volvió a leer
+    de la base de datos antes de que el cambio se confirmara. Los pendientes se
+    guardan en la sesión por espacio de la caché ('reserva', 'contacto'...).
+    """
+    cache_datos.invalidar(espacio, ids)
+    sesion = db.inspect(target).session
+    if sesion is not None:
+        sesion.info.setdefault('cache_invalidar', {}).setdefault(espacio, set()).update(ids)
+
+
+def invalidar_cache_reserva(target, telefonos):
+    """Olvidar la reserva y los contactos afectados"""
+    invalidar_cache(target, 'reserva', [target.id])
+    invalidar_cache(target, 'contacto', [t for t in telefonos if t])
+
+
+@db.event.listens_for(Reserva, 'after_insert')
+@db.event.listens_for(Reserva, 'after_update')
+def invalidar_cache_reserva_guardada(mapper, connection, target):
+    invalidar_cache_reserva(target, [target.telefono_norm, *telefonos_anteriores(target)])
+
+
+@db.event.listens_for(Reserva, 'before_delete')
+def invalidar_cache_reserva_borrada(mapper, connection, target):
+    # Al borrar la reserva se desvinculan todos los contactos que apuntan a ella
+    tabla = Contacto.__table__
+    telefonos = [t for (t,) in connection.execute(
+        db.select(tabla.c.telefono_norm).where(tabla.c.reserva_id == target.id)
+    )]
+    invalidar_cache_reserva(target, telefonos)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidar_cache_tras_commit(sesion):
+    for espacio, ids in sesion.info.pop('cache_invalidar', {}).items():
+        cache_datos.invalidar(espacio, list(ids))
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def descartar_invalidaciones_pendientes(sesion):
+    sesion.info.pop('cache_invalidar', None)
+
+
+# ============= DISPONIBILIDAD =============
+
+def intervalo_reserva(fecha, hora_inicio, hora_fin):
+    """
+    Intervalo (inicio, fin) de una reserva como datetimes
+    Si la hora de fin no es posterior a la de inicio, el evento acaba al día siguiente
+    """
+    inicio = datetime.combine(fecha, hora_inicio)
+    fin = datetime.combine(fecha, hora_fin)
+    if fin <= inicio:
+        fin += timedelta(days=1)
+    return inicio, fin
+
+
+@db.event.listens_for(Reserva, 'before_insert')
+@db.event.listens_for(Reserva, 'before_update')
+def calcular_intervalo_reserva(mapper, connection, target):
+    target.inicio_at, target.fin_at = intervalo_reserva(
+        target.fecha_evento, target.hora_inicio, target.hora_fin
+    )
+
+
+def consultar_ocupacion(inicio, fin, excluir_id=None):
+    """
+    Reservas que ocupan algún momento de [inicio, fin), ordenadas por inicio
+    
+    Como ninguna reserva dura más de DURACION_MAX_RESERVA, inicio_at queda
+    acotado por los dos lados y la consulta es un rango del índice
+    (estado, inicio_at, fin_at) en lugar de recorrer todo el histórico.
+    """
+    consulta = Reserva.query.filter(
+        Reserva.estado.in_(ESTADOS_QUE_OCUPAN),
+        Reserva.inicio_at > inicio - DURACION_MAX_RESERVA,
+        Reserva.inicio_at < fin,
+        Reserva.fin_at > inicio
+    )
+    if excluir_id:
+        consulta = consulta.filter(Reserva.id != excluir_id)
+    return consulta.order_by(Reserva.inicio_at).all()
+
+
+def comprobar_disponibilidad(inicio, fin, excluir_id=None):
+    """
+    Bloquear las escrituras de reservas y devolver las que se solapan con [inicio, fin)
+    
+    Solo para crear o confirmar una reserva: dos peticiones simultáneas se
+    atienden una detrás de otra hasta el commit, así que no pueden aceptar
+    el mismo hueco. La versión de la tabla no cambia, así que los ETag del
+    calendario solo caducan si después se guarda de verdad una reserva.
+    Para consultar sin escribir, consultar_ocupacion().
+    """
+    bloquear_version_tabla(db.session.connection(), 'reserva')
+    return consultar_ocupacion(inicio, fin, excluir_id)
+
+
+def huecos_libres(desde, hasta, minutos_min=0):
+    """
+    Huecos libres por día entre dos fechas (ambas incluidas), con una sola consulta
+    Devuelve una lista de {'fecha', 'estado', 'huecos': [{'inicio', 'fin'}]}
+    donde estado es 'libre', 'parcial' o 'completo'
+    """
+    inicio_rango = datetime.combine(desde, datetime.min.time())
+    fin_rango = datetime.combine(hasta + timedelta(days=1), datetime.min.time())
+    
+    # Repartir los intervalos ocupados entre los días que tocan (como mucho dos)
+    ocupado_por_dia = {}
+    for reserva in consultar_ocupacion(inicio_rango, fin_rango):
+        dia = reserva.inicio_at.date()
+        while datetime.combine(dia, datetime.min.time()) < reserva.fin_at:
+            ocupado_por_dia.setdefault(dia, []).append((reserva.inicio_at, reserva.fin_at))
+            dia += timedelta(days=1)
+    
+    duracion_min = timedelta(minutes=minutos_min)
+    dias = []
+    dia = desde
+    while dia <= hasta:
+        inicio_dia = datetime.combine(dia, datetime.min.time())
+        fin_dia = inicio_dia + timedelta(days=1)
+        
+        huecos = []
+        cursor = inicio_dia
+        for inicio, fin in sorted(ocupado_por_dia.get(dia, [])):
+            if inicio > cursor:
+                huecos.append((cursor, min(inicio, fin_dia)))
+            cursor = max(cursor, fin)
+        if cursor < fin_dia:
+            huecos.append((cursor, fin_dia))
+        huecos = [(i, f) for i, f in huecos if f - i >= duracion_min and f > i]
+        
+        if not ocupado_por_dia.get(dia):
+            estado = 'libre'
+        elif huecos:
+            estado = 'parcial'
+        else:
+            estado = 'completo'
+        
+        dias.append({
+            'fecha': dia.isoformat(),
+            'estado': estado,
+            'huecos': [{
+                'inicio': i.strftime('%H:%M'),
+                'fin': '24:00' if f == fin_dia else f.strftime('%H:%M')
+            } for i, f in huecos]
+        })
+        dia += timedelta(days=1)
+    return dias
+
+
+# ============= SESIONES DE USUARIO =============
+
+class UsuarioSesion(UserMixin):
+    """Usuario de la sesión reconstruido desde la caché de datos (solo lectura)"""
+    
+    def __init__(self, datos):
+        self.id = datos['id']
+        self.username = datos['username']
+        self.is_admin = datos['is_admin']
+
+
+def datos_usuario(user):
+    """Campos del usuario que necesitan las vistas (nunca el email ni el hash)"""
+    return {
+        'id': user.id,
+        'username': user.username,
+        'is_admin': bool(user.is_admin),
+        'version_sesion': user.version_sesion
+    }
+
+
+def obtener_datos_usuario(user_id):
+    """Datos del usuario desde la caché de datos o, si no están, de la base de datos"""
+    def cargar_usuario(user_id):
+        user = db.session.get(User, user_id)
+        return datos_usuario(user) if user else None
+
+    return cache_datos.leer_uno('usuario', user_id, cargar_usuario)
+
+
+def guardar_usuario_sesion(user):
+    """Guardar en la sesión solo el id del usuario y su versión de sesión"""
+    session['usuario'] = {
+        'id': user.id,
+        'version': user.version_sesion,
+        'expira': time.time() + USUARIO_SESION_SEGUNDOS
+    }
+
+
+def invalidar_usuario_sesion():
+    """Olvidar el usuario de la sesión actual"""
+    session.pop('usuario', None)
+
+
+@db.event.listens_for(User, 'before_update')
+def revocar_sesiones_usuario(mapper, connection, target):
+    # Cambiar la contraseña o los permisos cierra las sesiones abiertas
+    estado = db.inspect(target)
+    if estado.attrs.password_hash.history.has_changes() or estado.attrs.is_admin.history.has_changes():
+        target.version_sesion = (target.version_sesion or 1) + 1
+
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidar_cache_usuario(mapper, connection, target):
+    invalidar_cache(target, 'usuario', [target.id])
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    """Usuario de la sesión; consulta la base de datos si la sesión caducó o no está en la caché"""
+    user_id = int(user_id)
+    sesion_usuario = session.get('usuario')
+    if sesion_usuario and sesion_usuario['id'] == user_id and sesion_usuario['expira'] > time.time():
+        datos = obtener_datos_usuario(user_id)
+        if datos and datos['version_sesion'] == sesion_usuario.get('version'):
+            return UsuarioSesion(datos)
+    
+    user = db.session.get(User, user_id)
+    if user is None or (sesion_usuario and sesion_usuario.get('version') != user.version_sesion):
+        # Usuario borrado, o sesión revocada al cambiar la contraseña o los permisos
+        invalidar_usuario_sesion()
+        return None
+    guardar_usuario_sesion(user)
+    return user
+
+
+# ============= EVENTOS EN TIEMPO REAL =============
+
+conexiones_eventos = threading.BoundedSemaphore(EVENTOS_CONEXIONES_MAX)
+
+
+def workers_gunicorn():
+    """
+    Workers configurados para gunicorn (1 si no se ejecuta con gunicorn)
+    Se leen como los lee gunicorn, de menor a mayor prioridad: WEB_CONCURRENCY,
+    GUNICORN_CMD_ARGS y la línea de órdenes.
+    """
+    workers = os.environ.get('WEB_CONCURRENCY', '1')
+    argumentos = shlex.split(os.environ.get('GUNICORN_CMD_ARGS', ''))
+    if os.path.basename(sys.argv[0]).startswith('gunicorn'):
+        argumentos += sys.argv[1:]
+    for i, argumento in enumerate(argumentos):
+        if argumento in ('-w', '--workers') and i + 1 < len(argumentos):
+            workers = argumentos[i + 1]
+        elif argumento.startswith('--workers='):
+            workers = argumento.split('=', 1)[1]
+        elif argumento.startswith('-w') and argumento[2:].isdigit():
+            workers = argumento[2:]
+    try:
+        return int(workers)
+    except ValueError:
+        return 1
+
+
+if EVENTOS_BACKEND == 'memoria' and workers_gunicorn() > 1:
+    app.logger.warning(
+        '⚠️  EVENTOS_BACKEND=memoria con %d workers: los avisos de un worker no llegan a las '
+        'conexiones de los demás (usa EVENTOS_BACKEND=redis o un solo worker)', workers_gunicorn()
+    )
+
+
+def publicar_evento_mensaje(mensaje):
+    """Avisar a los clientes conectados de un mensaje nuevo o actualizado"""
+    try:
+        bus_eventos.publicar({
+            'tipo': 'mensaje',
+            'id': mensaje.id,
+            'telefono': mensaje.telefono_norm,
+            'direccion': mensaje.direccion,
+            'estado': mensaje.estado
+        })
+    except Exception as e:
+        # Las notificaciones nunca deben romper el guardado del mensaje
+        print(f"❌ Error al publicar evento: {str(e)}")
+
+
+# ============= TAREAS EN SEGUNDO PLANO =============
+
+class TareaSegundoPlano:
+    """
+    Hilos que procesan trabajo pendiente guardado en la base de datos
+    
+    Las subclases implementan procesar_pendientes(), que devuelve cuántos
+    elementos ha tratado; si no hay trabajo, los hilos esperan `intervalo`
+    segundos o hasta que alguien llame a avisar().
+    """
+    
+    def __init__(self, nombre, num_hilos=1, intervalo=1):
+        self.nombre = nombre
+        self.num_hilos = num_hilos
+        self.intervalo = intervalo
+        self.despertar = threading.Event()
+        self.activa = False
+        self._lock = threading.Lock()
+    
+    def iniciar(self):
+        """Arrancar los hilos (una sola vez por proceso)"""
+        with self._lock:
+            if self.activa:
+                return
+            for i in range(self.num_hilos):
+                threading.Thread(target=self._trabajar, name=f'{self.nombre}-{i}', daemon=True).start()
+            self.activa = True
+    
+    def avisar(self):
+        """Despertar a los hilos porque hay trabajo nuevo"""
+        self.despertar.set()
+    
+    def procesar_pendientes(self):
+        raise NotImplementedError
+    
+    def mantenimiento(self):
+        """Tareas periódicas opcionales (limpiezas, etc.)"""
+    
+    def _trabajar(self):
+        while True:
+            procesados = 0
+            try:
+                with app.app_context():
+                    procesados = self.procesar_pendientes()
+                    self.mantenimiento()
+            except Exception as e:
+                print(f"❌ Error en {self.nombre}: {str(e)}")
+            
+            if not procesados:
+                self.despertar.wait(self.intervalo)
+                self.despertar.clear()
+
+
+# ============= COLA DE ENVÍO DE WHATSAPP =============
+
+class ColaEnvioWhatsApp(TareaSegundoPlano):
+    """
+    Pool de hilos que envía los mensajes 'en_cola' de la tabla Mensaje
+    
+    La tabla es la cola persistente: cada hilo se reserva un mensaje con un
+    UPDATE condicional (válido también entre varios workers de gunicorn), lo
+    envía con un cliente HTTP compartido y limitado en tasa, y guarda el
+    resultado. Los errores transitorios se reintentan con espera exponencial.
+    """
+    
+    def __init__(self, num_hilos, tasa):
+        super().__init__('cola-envio', num_hilos, COLA_ENVIO_INTERVALO)
+        self.limitador = LimitadorTasa(tasa)
+        self.cliente = None
+    
+    def iniciar(self):
+        if self.cliente is None:
+            self.cliente = ClienteTwilio(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_API_URL)
+        super().iniciar()
+    
+    def procesar_pendientes(self):
+        """Enviar mensajes pendientes hasta vaciar la cola; devuelve cuántos se procesaron"""
+        procesados = 0
+        while True:
+            mensaje_id = self._reservar_siguiente()
+            if mensaje_id is None:
+                return procesados
+            self._enviar(mensaje_id)
+            procesados += 1
+    
+    def _reservar_siguiente(self):
+        ahora = datetime.utcnow()
+        # Un mensaje 'enviando' cuyo bloqueo ha caducado quedó huérfano y se recupera
+        disponible = db.and_(
+            Mensaje.estado.in_(('en_cola', 'enviando')),
+            db.or_(Mensaje.proximo_intento_at.is_(None), Mensaje.proximo_intento_at <= ahora)
+        )
+        candidatos = db.session.query(Mensaje.id).filter(disponible).order_by(Mensaje.id).limit(5).all()
+        
+        for (mensaje_id,) in candidatos:
+            resultado = db.session.execute(
+                db.update(Mensaje)
+                .where(Mensaje.id == mensaje_id, disponible)
+                .values(estado='enviando', proximo_intento_at=ahora + timedelta(seconds=COLA_ENVIO_BLOQUEO))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            if resultado.rowcount:
+                return mensaje_id
+        return None
+    
+    def _enviar(self, mensaje_id):
+        mensaje = db.session.get(Mensaje, mensaje_id)
+        self.limitador.esperar()
+        
+        try:
+            with metrica_twilio.medir(operacion='enviar'):
+                mensaje.twilio_sid = self.cliente.enviar(
+                    mensaje.contenido,
+                    mensaje.telefono_origen or TWILIO_WHATSAPP_NUMBER,
+                    mensaje.telefono_destino
+                )
+            mensaje.estado = 'enviado'
+            mensaje.proximo_intento_at = None
+            mensaje.error_envio = None
+        except ErrorEnvio as e:
+            metrica_twilio_errores.inc(operacion='enviar')
+            mensaje.intentos = (mensaje.intentos or 0) + 1
+            mensaje.error_envio = str(e)
+            if e.reintentable and mensaje.intentos < COLA_ENVIO_MAX_INTENTOS:
+                espera = min(COLA_ENVIO_ESPERA_BASE * 2 ** (mensaje.intentos - 1), COLA_ENVIO_ESPERA_MAX)
+                mensaje.estado = 'en_cola'
+                mensaje.proximo_intento_at = datetime.utcnow() + timedelta(seconds=espera)
+            else:
+                mensaje.estado = 'fallido'
+                mensaje.proximo_intento_at = None
+            print(f"❌ Error al enviar mensaje {mensaje_id} (intento {mensaje.intentos}): {str(e)}")
+        
+        db.session.commit()
+        publicar_evento_mensaje(mensaje)
+
+
+cola_envio = ColaEnvioWhatsApp(COLA_ENVIO_HILOS, COLA_ENVIO_TASA)
+
+
+# ============= PROCESADO DIFERIDO DEL WEBHOOK =============
+
+def mensaje_desde_webhook(datos, reserva_id):
+    """Construir un Mensaje entrante a partir del formulario de Twilio"""
+    body = datos.get('Body', '')  # El body puede estar vacío si solo hay media
+    num_media = int(datos.get('NumMedia', 0) or 0)
+    media_urls = []
+    media_types = []
+    
+    # Recopilar URLs y tipos de todos los archivos multimedia
+    for i in range(num_media):
+        media_url = datos.get(f'MediaUrl{i}')
+        if media_url:
+            media_urls.append(media_url)
+            media_types.append(datos.get(f'MediaContentType{i}') or 'unknown')
+    
+    # Si no hay texto pero hay multimedia, indicarlo
+    if not body and num_media > 0:
+        body = f"[{num_media} archivo(s) multimedia]"
+    
+    return Mensaje(
+        reserva_id=reserva_id,
+        telefono_destino=datos.get('To'),
+        telefono_origen=datos.get('From'),
+        contenido=body,
+        tipo='whatsapp',
+        direccion='entrante',
+        estado='recibido',
+        twilio_sid=datos.get('MessageSid'),
+        num_media=num_media,
+        media_urls=json.dumps(media_urls) if media_urls else None,
+        media_types=json.dumps(media_types) if media_types else None,
+        user_id=None
+    )
+
+
+class ProcesadorWebhook(TareaSegundoPlano):
+    """
+    Hilo que convierte las entradas del webhook en mensajes por lotes
+    
+    Cada lote se reserva con un UPDATE que marca las filas con un token
+    propio, de modo que varios workers de gunicorn no procesan la misma
+    entrada. Los contactos se resuelven con una sola consulta por lote y
+    todos los mensajes se guardan en la misma transacción.
+    """
+    
+    def __init__(self):
+        super().__init__('procesador-webhook', 1, PROCESADOR_WEBHOOK_INTERVALO)
+        self.ultima_limpieza = 0
+    
+    def procesar_pendientes(self):
+        """Procesar lotes hasta vaciar la tabla de entrada; devuelve cuántas entradas se trataron"""
+        total = 0
+        while True:
+            procesadas = self.procesar_lote()
+            if not procesadas:
+                return total
+            total += procesadas
+    
+    def procesar_lote(self):
+        entradas = self._reservar_lote()
+        if not entradas:
+            return 0
+        
+        datos = [json.loads(entrada.payload) for entrada in entradas]
+        
+        # Reintentos que ya llegaron a la tabla mensaje (p. ej. tras una caída)
+        sids = [d.get('MessageSid') for d in datos]
+        existentes = {sid for (sid,) in db.session.query(Mensaje.twilio_sid).filter(Mensaje.twilio_sid.in_(sids))}
+        
+        # Resolver todos los remitentes del lote desde la caché (una consulta para los que falten)
+        contactos = contactos_por_telefono(normalizar_telefono(d.get('From')) for d in datos)
+        
+        nuevos = []
+        for d in datos:
+            if d.get('MessageSid') in existentes:
+                continue
+            existentes.add(d.get('MessageSid'))
+            contacto = contactos.get(normalizar_telefono(d.get('From')))
+            nuevos.append(mensaje_desde_webhook(d, contacto['reserva_id'] if contacto else None))
+        
+        db.session.add_all(nuevos)
+        hay_media = registrar_media_pendiente(nuevos)
+        ahora = datetime.utcnow()
+        for entrada in entradas:
+            entrada.procesado_at = ahora
+        db.session.commit()
+        
+        for mensaje in nuevos:
+            publicar_evento_mensaje(mensaje)
+        if hay_media:
+            descargador_media.avisar()
+        
+        print(f"✅ {len(nuevos)} mensaje(s) recibido(s) ({len(entradas) - len(nuevos)} duplicado(s))")
+        return len(entradas)
+    
+    def _reservar_lote(self):
+        ahora = datetime.utcnow()
+        token = uuid.uuid4().hex
+        # Una entrada reservada hace más de PROCESADOR_WEBHOOK_BLOQUEO segundos quedó huérfana
+        disponible = db.and_(
+            EntradaWebhook.procesado_at.is_(None),
+            db.or_(
+                EntradaWebhook.reclamado_at.is_(None),
+                EntradaWebhook.reclamado_at < ahora - timedelta(seconds=PROCESADOR_WEBHOOK_BLOQUEO)
+            )
+        )
+        candidatos = db.session.query(EntradaWebhook.id).filter(disponible).order_by(
+            EntradaWebhook.id
+        ).limit(PROCESADOR_WEBHOOK_LOTE).scalar_subquery()
+        
+        db.session.execute(
+            db.update(EntradaWebhook)
+            .where(EntradaWebhook.id.in_(candidatos), disponible)
+            .values(lote=token, reclamado_at=ahora)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        
+        return EntradaWebhook.query.filter_by(lote=token, procesado_at=None).order_by(EntradaWebhook.id).all()
+    
+    def mantenimiento(self):
+        """Borrar entradas procesadas que ya no sirven para detectar reintentos (cada hora)"""
+        if time.monotonic() - self.ultima_limpieza < 3600:
+            return
+        self.ultima_limpieza = time.monotonic()
+        limite = datetime.utcnow() - timedelta(days=WEBHOOK_RETENCION_DIAS)
+        EntradaWebhook.query.filter(EntradaWebhook.procesado_at < limite).delete(synchronize_session=False)
+        db.session.commit()
+
+
+procesador_webhook = ProcesadorWebhook()
+
+
+# ============= CACHÉ LOCAL DE MULTIMEDIA =============
+
+def registrar_media_pendiente(mensajes):
+    """Añadir a la cola de descargas las URLs multimedia de los mensajes (sin hacer commit)"""
+    urls = set()
+    for mensaje in mensajes:
+        if mensaje.media_urls:
+            urls.update(json.loads(mensaje.media_urls))
+    if not urls or not MEDIA_ACTIVO:
+        return False
+    
+    rechazadas = {url for url in urls if not almacen_media.permitida(url)}
+    if rechazadas:
+        print(f"⚠️  MediaUrl fuera de Twilio, no se descarga: {', '.join(sorted(rechazadas))}")
+        urls -= rechazadas
+        if not urls:
+            return False
+    
+    conocidas = {url for (url,) in db.session.query(ArchivoMedia.url_origen).filter(
+        ArchivoMedia.url_origen.in_(urls)
+    )}
+    db.session.add_all(ArchivoMedia(url_origen=url) for url in urls - conocidas)
+    return True
+
+
+def media_locales(urls):
+    """Relación URL de Twilio -> ArchivoMedia descargado, con una sola consulta"""
+    if not urls:
+        return {}
+    return {
+        archivo.url_origen: archivo
+        for archivo in ArchivoMedia.query.filter(
+            ArchivoMedia.url_origen.in_(urls),
+            ArchivoMedia.estado == 'descargado'
+        )
+    }
+
+
+class DescargadorMedia(TareaSegundoPlano):
+    """
+    Descarga en segundo plano los archivos multimedia recibidos
+    
+    Guarda cada archivo por su hash, genera miniaturas de las imágenes y,
+    si el almacén supera MEDIA_TAMANO_MAX, expulsa los archivos usados
+    hace más tiempo (LRU por ultimo_acceso).
+    """
+    
+    def __init__(self):
+        super().__init__('descargador-media', 2, 5)
+    
+    def procesar_pendientes(self):
+        procesados = 0
+        while True:
+            archivo = self._reservar_siguiente()
+            if archivo is None:
+                break
+            self._descargar(archivo)
+            procesados += 1
+        
+        if procesados:
+            self.expulsar_antiguos()
+        return procesados
+    
+    def _reservar_siguiente(self):
+        ahora = datetime.utcnow()
+        abandonada = db.and_(
+            ArchivoMedia.estado == 'descargando',
+            ArchivoMedia.reclamado_at < ahora - timedelta(seconds=MEDIA_BLOQUEO)
+        )
+        intentos = db.func.coalesce(ArchivoMedia.intentos, 0)
+        
+        # Las que hicieron caer al proceso MEDIA_MAX_INTENTOS veces no se reintentan
+        db.session.execute(
+            db.update(ArchivoMedia)
+            .where(abandonada, intentos >= MEDIA_MAX_INTENTOS)
+            .values(estado='error')
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        
+        disponible = db.or_(ArchivoMedia.estado == 'pendiente', abandonada)
+        candidatos = db.session.query(ArchivoMedia.id).filter(disponible).order_by(ArchivoMedia.id).limit(5).all()
+        
+        for (archivo_id,) in candidatos:
+            resultado = db.session.execute(
+                db.update(ArchivoMedia)
+                .where(ArchivoMedia.id == archivo_id, disponible)
+                # El intento cuenta al reservar: también si el proceso muere durante la descarga
+                .values(estado='descargando', reclamado_at=ahora, intentos=intentos + 1)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            if resultado.rowcount:
+                return db.session.get(ArchivoMedia, archivo_id)
+        return None
+    
+    def _descargar(self, archivo):
+        # AlmacenMedia solo pide (y envía las credenciales a) los orígenes de MEDIA_ORIGENES
+        auth = (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN) if TWILIO_ACCOUNT_SID else None
+        archivo_id = archivo.id
         try:
-            return render_template(mobile_template, **context)
-        except:
-            # Si no existe la plantilla móvil, usar desktop
-            return render_template(desktop_template, **context)
-    return render_template(desktop_template, **context)
+            with metrica_twilio.medir(operacion='descargar_media'):
+                sha256, tamano, content_type = almacen_media.descargar(archivo.url_origen, auth=auth)
+            archivo.sha256 = sha256
+            archivo.tamano = tamano
+            archivo.content_type = content_type
+            archivo.tiene_miniatura = almacen_media.crear_miniatura(sha256, content_type)
+            archivo.estado = 'descargado'
+            archivo.ultimo_acceso = datetime.utcnow()
+        except Exception as e:
+            # Cualquier fallo (también de Pillow con una imagen enorme) libera la fila:
+            # si no, se quedaría en 'descargando' y se volvería a intentar sin fin
+            db.session.rollback()
+            if isinstance(e, ErrorDescarga):
+                metrica_twilio_errores.inc(operacion='descargar_media')
+            archivo = db.session.get(ArchivoMedia, archivo_id)
+            archivo.estado = 'pendiente' if (archivo.intentos or 0) < MEDIA_MAX_INTENTOS else 'error'
+            print(f"❌ Error en la descarga multimedia {archivo_id}: {str(e)}")
+        db.session.commit()
+    
+    def expulsar_antiguos(self):
+        """Borrar los archivos menos usados hasta quedar por debajo del 90% del límite"""
+        total = db.session.query(db.func.coalesce(db.func.sum(ArchivoMedia.tamano), 0)).filter(
+            ArchivoMedia.estado == 'descargado'
+        ).scalar()
+        if total <= MEDIA_TAMANO_MAX:
+            return
+        
+        objetivo = MEDIA_TAMANO_MAX * 0.9
+        while total > objetivo:
+            antiguos = ArchivoMedia.query.filter_by(estado='descargado').order_by(
+                ArchivoMedia.ultimo_acceso.asc()
+            ).limit(50).all()
+            if not antiguos:
+                break
+            
+            for archivo in antiguos:
+                archivo.estado = 'expulsado'
+                total -= archivo.tamano or 0
+                # Varias URLs pueden compartir el mismo contenido
+                compartido = ArchivoMedia.query.filter(
+                    ArchivoMedia.sha256 == archivo.sha256,
+                    ArchivoMedia.estado == 'descargado',
+                    ArchivoMedia.id != archivo.id
+                ).first()
+                if not compartido:
+                    almacen_media.borrar(archivo.sha256)
+                if total <= objetivo:
+                    break
+            db.session.commit()
+        
+        print(f"🧹 Caché multimedia reducida a {total / 1024 / 1024:.1f} MB")
+
+
+descargador_media = DescargadorMedia()
+
+
+@app.before_request
+def iniciar_tareas_segundo_plano():
+    """Arrancar los hilos en segundo plano en el primer request de cada proceso"""
+    if not cola_envio.activa and COLA_ENVIO_ACTIVA and TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
+        cola_envio.iniciar()
+    if not procesador_webhook.activa and PROCESADOR_WEBHOOK_ACTIVO:
+        procesador_webhook.iniciar()
+    if not descargador_media.activa and MEDIA_ACTIVO:
+        descargador_media.iniciar()
+
+
+# ============= ESTADÍSTICAS DEL PANEL =============
+
+_estadisticas_cache = {'datos': None, 'fecha': None, 'version_reservas': None, 'expira': 0, 'version': 0}
+_estadisticas_lock = threading.Lock()
+
+
+def invalidar_estadisticas():
+    """Descartar las estadísticas cacheadas tras un cambio en las reservas"""
+    with _estadisticas_lock:
+        _estadisticas_cache['datos'] = None
+        _estadisticas_cache['version'] += 1
+
+
+# Columnas que necesita serializar_reserva_evento (sin cargar la reserva entera)
+COLUMNAS_EVENTO = (
+    Reserva.id, Reserva.cliente_nombre, Reserva.tipo_celebracion, Reserva.fecha_evento,
+    Reserva.hora_inicio, Reserva.hora_fin, Reserva.inicio_at, Reserva.fin_at,
+    Reserva.cliente_telefono, Reserva.num_invitados, Reserva.precio
+)
+
+
+def serializar_reserva_evento(r):
+    """Formato de evento de calendario usado por /api/reservas y el panel (reserva o fila)"""
+    # El intervalo guardado acaba al día siguiente si la reserva pasa de medianoche
+    if r.inicio_at and r.fin_at:
+        inicio, fin = r.inicio_at, r.fin_at
+    else:
+        inicio, fin = intervalo_reserva(r.fecha_evento, r.hora_inicio, r.hora_fin)
+    return {
+        'id': r.id,
+        'title': f'{r.cliente_nombre} - {r.tipo_celebracion or "Evento"}',
+        'start': inicio.isoformat(),
+        'end': fin.isoformat(),
+        'cliente': r.cliente_nombre,
+        'telefono': r.cliente_telefono,
+        'invitados': r.num_invitados,
+        'precio': r.precio
+    }
+
+
+def calcular_estadisticas(hoy):
+    """
+    Calcular los agregados del panel con SQL (solo reservas confirmadas)
+    Devuelve el resumen del mes, el desglose por mes del año en curso,
+    los tipos de celebración y las próximas reservas
+    """
+    confirmada = Reserva.estado == 'confirmada'
+    anio = db.extract('year', Reserva.fecha_evento)
+    mes = db.extract('month', Reserva.fecha_evento)
+
+    filas_mes = db.session.query(
+        mes.label('mes'),
+        db.func.count(Reserva.id).label('reservas'),
+        db.func.coalesce(db.func.sum(Reserva.precio), 0).label('ingresos'),
+        db.func.coalesce(db.func.sum(Reserva.anticipo), 0).label('anticipos')
+    ).filter(confirmada, anio == hoy.year).group_by(mes).all()
+
+    por_mes = {fila.mes: fila for fila in filas_mes}
+    meses = []
+    for numero in range(1, 13):
+        fila = por_mes.get(numero)
+        meses.append({
+            'mes': f'{hoy.year}-{numero:02d}',
+            'reservas': fila.reservas if fila else 0,
+            'ingresos': float(fila.ingresos) if fila else 0.0,
+            'anticipos': float(fila.anticipos) if fila else 0.0
+        })
+    actual = meses[hoy.month - 1]
+
+    tipo = db.func.coalesce(db.func.nullif(Reserva.tipo_celebracion, ''), 'Evento')
+    tipos = db.session.query(
+        tipo.label('tipo'), db.func.count(Reserva.id).label('total')
+    ).filter(confirmada).group_by(tipo).order_by(db.func.count(Reserva.id).desc()).all()
+
+    proximas = Reserva.query.filter(confirmada, Reserva.fecha_evento >= hoy).order_by(
+        Reserva.fecha_evento, Reserva.hora_inicio
+    ).limit(PROXIMAS_RESERVAS_PANEL).all()
+
+    mensajes_enviados = db.session.query(db.func.count(Mensaje.id)).filter(
+        Mensaje.direccion == 'saliente'
+    ).scalar() + (db.session.query(db.func.sum(BloqueMensajes.num_salientes)).scalar() or 0)
+
+    return {
+        'fecha': hoy.isoformat(),
+        'mes': {
+            'reservas': actual['reservas'],
+            'ingresos': actual['ingresos'],
+            'anticipos': actual['anticipos'],
+            'pendiente_cobro': actual['ingresos'] - actual['anticipos']
+        },
+        'por_mes': meses,
+        'tipos_celebracion': [{'tipo': t.tipo, 'total': t.total} for t in tipos],
+        'proxima_reserva': serializar_reserva_evento(proximas[0]) if proximas else None,
+        'proximas_reservas': [serializar_reserva_evento(r) for r in proximas],
+        'mensajes_enviados': mensajes_enviados
+    }
+
+
+def obtener_estadisticas():
+    """Estadísticas del panel desde la caché, recalculándolas si hace falta"""
+    hoy = date.today()
+    version_reservas = version_tabla('reserva')  # cambia también con las escrituras de otros workers
+    with _estadisticas_lock:
+        cache = _estadisticas_cache
+        if (
+            cache['datos'] is not None and cache['fecha'] == hoy
+            and cache['version_reservas'] == version_reservas
+            and time.monotonic() < cache['expira']
+        ):
+            return cache['datos']
+        version = cache['version']
+
+    datos = calcular_estadisticas(hoy)
+
+    with _estadisticas_lock:
+        # Si se invalidó mientras se calculaba, no guardar datos ya obsoletos
+        if _estadisticas_cache['version'] == version:
+            _estadisticas_cache.update(
+                datos=datos, fecha=hoy, version_reservas=version_reservas,
+                expira=time.monotonic() + ESTADISTICAS_CACHE_SEGUNDOS
+            )
+    return datos
+
+
+# ============= CONSULTAS DE CONVERSACIONES =============
+
+def consultar_resumen_conversaciones():
+    """
+    Resumen de todas las conversaciones en una única consulta.
+    
+    Usa funciones de ventana sobre el teléfono normalizado para quedarse con
+    el último mensaje de cada conversación, contar mensajes y archivos
+    multimedia, y resolver el nombre del cliente con la tabla de contactos.
+    Devuelve filas ordenadas de la conversación más reciente a la más antigua.
+    """
+    telefono = Mensaje.telefono_norm
+    
+    ranking = db.session.query(
+        Mensaje.id.label('mensaje_id'),
+        telefono.label('telefono'),
+        db.func.row_number().over(
+            partition_by=telefono,
+            order_by=(Mensaje.enviado_at.desc(), Mensaje.id.desc())
+        ).label('posicion'),
+        db.func.count(Mensaje.id).over(partition_by=telefono).label('total_mensajes'),
+        db.func.sum(db.func.coalesce(Mensaje.num_media, 0)).over(partition_by=telefono).label('total_media')
+    ).filter(
+        telefono.isnot(None)
+    ).subquery()
+    
+    return db.session.query(
+        ranking.c.telefono,
+        ranking.c.total_mensajes,
+        ranking.c.total_media,
+        Mensaje.contenido,
+        Mensaje.num_media,
+        Mensaje.enviado_at,
+        Contacto.nombre.label('cliente_nombre')
+    ).join(
+        Mensaje, Mensaje.id == ranking.c.mensaje_id
+    ).outerjoin(
+        Contacto, Contacto.telefono_norm == ranking.c.telefono
+    ).filter(
+        ranking.c.posicion == 1
+    ).order_by(
+        Mensaje.enviado_at.desc()
+    ).all()
+
+
+# ============= ARCHIVO DE MENSAJES =============
+
+def conversaciones_archivables(limite_fecha, conservar=ARCHIVO_CONSERVAR):
+    """Teléfonos con mensajes anteriores a la fecha límite y más de `conservar` mensajes"""
+    return [telefono for (telefono,) in db.session.query(Mensaje.telefono_norm).filter(
+        Mensaje.telefono_norm.isnot(None)
+    ).group_by(Mensaje.telefono_norm).having(
+        db.and_(db.func.count(Mensaje.id) > conservar, db.func.min(Mensaje.enviado_at) < limite_fecha)
+    )]
+
+
+def valores_bloque(bloque):
+    """Columnas de BloqueMensajes para unos mensajes (filas en orden cronológico)"""
+    return {
+        'desde': bloque[0].enviado_at,
+        'hasta': bloque[-1].enviado_at,
+        'id_min': min(fila.id for fila in bloque),
+        'id_max': max(fila.id for fila in bloque),
+        'num_mensajes': len(bloque),
+        'num_salientes': sum(1 for fila in bloque if fila.direccion == 'saliente'),
+        'num_media': sum(fila.num_media or 0 for fila in bloque),
+        'datos': comprimir(bloque),
+    }
+
+
+def archivar_conversacion(telefono_norm, limite_fecha, conservar=ARCHIVO_CONSERVAR, lote=ARCHIVO_LOTE):
+    """
+    Mover a bloques comprimidos los mensajes antiguos de una conversación
+
+    Nunca se archivan los `conservar` mensajes más recientes, así que todos los
+    archivados son anteriores a los que quedan en la tabla mensaje. Cada lote
+    se guarda y se borra en la misma transacción.
+    Devuelve el número de mensajes archivados.
+    """
+    orden = (Mensaje.enviado_at, Mensaje.id)
+    frontera = db.session.query(*orden).filter(
+        Mensaje.telefono_norm == telefono_norm
+    ).order_by(Mensaje.enviado_at.desc(), Mensaje.id.desc()).offset(conservar - 1).limit(1).first()
+    if not frontera:
+        return 0
+
+    columnas = [Mensaje.__table__.c[campo] for campo in CAMPOS_ARCHIVO]
+    condicion = db.and_(
+        Mensaje.telefono_norm == telefono_norm,
+        Mensaje.enviado_at < limite_fecha,
+        db.tuple_(*orden) < db.tuple_(*frontera),
+        Mensaje.estado.notin_(('en_cola', 'enviando'))
+    )
+
+    total = 0
+    while True:
+        filas = db.session.execute(
+            db.select(*columnas).where(condicion).order_by(*orden).limit(lote)
+        ).all()
+        if not filas:
+            return total
+
+        for bloque in agrupar_en_bloques(filas, ARCHIVO_MENSAJES_POR_BLOQUE):
+            db.session.add(BloqueMensajes(telefono_norm=telefono_norm, **valores_bloque(bloque)))
+        # Los triggers quitan los mensajes borrados del índice de búsqueda: pasan al del archivo
+        indexar_archivados(db.session.connection(), [fila._asdict() for fila in filas])
+        db.session.execute(
+            db.delete(Mensaje).where(Mensaje.id.in_([fila.id for fila in filas]))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        total += len(filas)
+
+
+def mensajes_archivados(telefono_norm, antes, limite):
+    """
+    Hasta `limite` mensajes archivados anteriores a `antes` (enviado_at, id)
+    Se descomprimen los bloques del más reciente al más antiguo hasta reunir
+    los necesarios. Devuelve objetos Mensaje sin sesión, en orden cronológico.
+    """
+    consulta = BloqueMensajes.query.filter(
+        BloqueMensajes.telefono_norm == telefono_norm,
+        BloqueMensajes.desde <= antes[0]
+    ).order_by(BloqueMensajes.hasta.desc(), BloqueMensajes.id.desc())
+
+    encontrados = []
+    for bloque in consulta.yield_per(2):
+        anteriores = [m for m in descomprimir(bloque.datos) if (m['enviado_at'], m['id']) < antes]
+        encontrados = anteriores[-(limite - len(encontrados)):] + encontrados
+        if len(encontrados) >= limite:
+            break
+    return [Mensaje(**datos) for datos in encontrados]
+
+
+def fecha_mensaje_archivado(telefono_norm, mensaje_id):
+    """enviado_at de un mensaje archivado (None si no está en el archivo)"""
+    bloques = BloqueMensajes.query.filter(
+        BloqueMensajes.telefono_norm == telefono_norm,
+        BloqueMensajes.id_min <= mensaje_id,
+        BloqueMensajes.id_max >= mensaje_id
+    )
+    for bloque in bloques:
+        for mensaje in descomprimir(bloque.datos):
+            if mensaje['id'] == mensaje_id:
+                return mensaje['enviado_at']
+    return None
+
+
+def borrar_mensajes_archivados(conn, telefonos, reserva_id):
+    """
+    Quitar del archivo los mensajes de una reserva, como hace el borrado en
+    cascada de Reserva.mensajes con la tabla mensaje: los bloques de esos
+    teléfonos se reescriben sin ellos (o se borran si se quedan vacíos) y los
+    mensajes salen del índice de búsqueda. Devuelve los mensajes borrados.
+    """
+    tabla = BloqueMensajes.__table__
+    bloques = conn.execute(
+        db.select(tabla.c.id, tabla.c.datos).where(tabla.c.telefono_norm.in_([t for t in telefonos if t]))
+    ).all()
+
+    borrados = []
+    for bloque in bloques:
+        mensajes = descomprimir(bloque.datos)
+        quedan = [m for m in mensajes if m['reserva_id'] != reserva_id]
+        if len(quedan) == len(mensajes):
+            continue
+        borrados.extend(m['id'] for m in mensajes if m['reserva_id'] == reserva_id)
+        if quedan:
+            valores = valores_bloque([SimpleNamespace(**m) for m in quedan])
+            conn.execute(tabla.update().where(tabla.c.id == bloque.id).values(**valores))
+        else:
+            conn.execute(tabla.delete().where(tabla.c.id == bloque.id))
+    desindexar_archivados(conn, borrados)
+    return len(borrados)
+
+
+@db.event.listens_for(Reserva, 'before_delete')
+def borrar_archivo_reserva(mapper, connection, target):
+    # Antes de borrar: los contactos todavía apuntan a la reserva
+    tabla = Contacto.__table__
+    telefonos = {target.telefono_norm, *(t for (t,) in connection.execute(
+        db.select(tabla.c.telefono_norm).where(tabla.c.reserva_id == target.id)
+    ))}
+    borrar_mensajes_archivados(connection, telefonos, target.id)
+
+
+def totales_archivados():
+    """Mensajes y archivos multimedia archivados por teléfono: {telefono: (mensajes, media)}"""
+    filas = db.session.query(
+        BloqueMensajes.telefono_norm,
+        db.func.sum(BloqueMensajes.num_mensajes),
+        db.func.sum(BloqueMensajes.num_media)
+    ).group_by(BloqueMensajes.telefono_norm)
+    return {telefono: (mensajes or 0, media or 0) for telefono, mensajes, media in filas}
+
+
+# ============= LISTADO DE RESERVAS =============
+
+def filtros_reservas():
+    """Leer los filtros del listado de la query string (los no válidos se ignoran)"""
+    filtros = {
+        'q': request.args.get('q', '').strip(),
+        'estado': request.args.get('estado', ''),
+        'tipo': request.args.get('tipo', ''),
+        'desde': request.args.get('desde', ''),
+        'hasta': request.args.get('hasta', '')
+    }
+    if filtros['estado'] not in ('pendiente', 'confirmada', 'cancelada'):
+        filtros['estado'] = ''
+    for campo in ('desde', 'hasta'):
+        try:
+            date.fromisoformat(filtros[campo])
+        except ValueError:
+            filtros[campo] = ''
+    return filtros
+
+
+def consultar_reservas(filtros, despues=None, limite=RESERVAS_POR_PAGINA):
+    """
+    Página del listado de reservas, de la fecha más reciente a la más antigua
+    Devuelve (reservas, id para pedir la página siguiente o None)
+    """
+    consulta = Reserva.query
+    if filtros['estado']:
+        consulta = consulta.filter(Reserva.estado == filtros['estado'])
+    if filtros['tipo']:
+        consulta = consulta.filter(Reserva.tipo_celebracion == filtros['tipo'])
+    if filtros['desde']:
+        consulta = consulta.filter(Reserva.fecha_evento >= date.fromisoformat(filtros['desde']))
+    if filtros['hasta']:
+        consulta = consulta.filter(Reserva.fecha_evento <= date.fromisoformat(filtros['hasta']))
+    if filtros['q']:
+        patron = f"%{filtros['q']}%"
+        condiciones = [
+            Reserva.cliente_nombre.ilike(patron),
+            Reserva.cliente_telefono.ilike(patron),
+            Reserva.cliente_email.ilike(patron)
+        ]
+        # Teléfonos escritos con espacios o guiones
+        digitos = ''.join(c for c in filtros['q'] if c.isdigit())
+        if len(digitos) >= 3:
+            condiciones.append(Reserva.telefono_norm.like(f'%{digitos}%'))
+        consulta = consulta.filter(db.or_(*condiciones))
+    
+    # Paginación por cursor (fecha_evento, id): no se recorren las páginas anteriores
+    if despues:
+        cursor_fecha = db.session.query(Reserva.fecha_evento).filter_by(id=despues).scalar()
+        if cursor_fecha:
+            consulta = consulta.filter(
+                db.tuple_(Reserva.fecha_evento, Reserva.id) < db.tuple_(cursor_fecha, despues)
+            )
+    
+    reservas_list = consulta.order_by(
+        Reserva.fecha_evento.desc(), Reserva.id.desc()
+    ).limit(limite + 1).all()
+    
+    siguiente = reservas_list[limite - 1].id if len(reservas_list) > limite else None
+    return reservas_list[:limite], siguiente
+
+
+def serializar_reserva(r):
+    """Datos de una reserva para el listado en JSON"""
+    return {
+        'id': r.id,
+        'fecha_evento': r.fecha_evento.isoformat(),
+        'hora_inicio': r.hora_inicio.strftime('%H:%M'),
+        'hora_fin': r.hora_fin.strftime('%H:%M'),
+        'cliente_nombre': r.cliente_nombre,
+        'cliente_telefono': r.cliente_telefono,
+        'tipo_celebracion': r.tipo_celebracion,
+        'num_invitados': r.num_invitados,
+        'precio': r.precio,
+        'anticipo': r.anticipo,
+        'estado': r.estado
+    }
+
+
+# ============= BÚSQUEDA DE TEXTO COMPLETO =============
+
+def crear_indice_busqueda(tabla, conexion, **kwargs):
+    """Crear el índice de búsqueda junto a la tabla (bases nuevas; las existentes usan migrar.py)"""
+    for sentencia in ddl_busqueda(tabla.name, conexion.dialect.name):
+        conexion.execute(db.text(sentencia))
+
 
-# ============= MODELOS DE BASE DE DATOS =============
+db.event.listen(Mensaje.__table__, 'after_create', crear_indice_busqueda)
+db.event.listen(Reserva.__table__, 'after_create', crear_indice_busqueda)
 
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(200), nullable=False)
-    is_admin = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+def crear_indice_busqueda_archivo(tabla, conexion, **kwargs):
+    for sentencia in ddl_busqueda_archivo(conexion.dialect.name):
+        conexion.execute(db.text(sentencia))
 
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
 
+db.event.listen(BloqueMensajes.__table__, 'after_create', crear_indice_busqueda_archivo)
 
-class Reserva(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    cliente_nombre = db.Column(db.String(100), nullable=False)
-    cliente_telefono = db.Column(db.String(20), nullable=False)
-    cliente_email = db.Column(db.String(120))
-    fecha_evento = db.Column(db.Date, nullable=False)
-    hora_inicio = db.Column(db.Time, nullable=False)
-    hora_fin = db.Column(db.Time, nullable=False)
-    num_invitados = db.Column(db.Integer)
-    tipo_celebracion = db.Column(db.String(50))
-    precio = db.Column(db.Float)
-    anticipo = db.Column(db.Float, default=0)
-    estado = db.Column(db.String(20), default='confirmada')
-    notas = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+# Una palabra frecuente coincide con cientos de miles de mensajes y puntuarlos
+# todos es lento: se toman las BUSQUEDA_CANDIDATOS coincidencias más recientes
+# (el índice las recorre por id sin puntuar) y se ordenan por relevancia. En
+# SQLite el fragmento se calcula al recorrer los candidatos: volver a buscar
+# las filas de la página por rowid repetiría la búsqueda en el índice por cada una.
+# Los mensajes archivados se buscan en su propio índice y compiten con los demás
+SQL_BUSCAR_MENSAJES = {
+    'sqlite': '''
+        WITH recientes AS (
+            SELECT rowid AS id, rank AS puntuacion,
+                   snippet(mensaje_fts, 0, :inicio, :fin, '…', 16) AS fragmento, 0 AS archivado
+            FROM mensaje_fts
+            WHERE mensaje_fts MATCH :consulta
+            ORDER BY rowid DESC LIMIT :candidatos
+        ), archivados AS (
+            SELECT rowid AS id, rank AS puntuacion,
+                   snippet(mensaje_archivado_fts, 0, :inicio, :fin, '…', 16) AS fragmento, 1 AS archivado
+            FROM mensaje_archivado_fts
+            WHERE mensaje_archivado_fts MATCH :consulta
+            ORDER BY rowid DESC LIMIT :candidatos
+        ), candidatos AS (
+            SELECT * FROM recientes UNION ALL SELECT * FROM archivados
+            ORDER BY id DESC LIMIT :candidatos
+        ), encontrados AS (
+            SELECT * FROM candidatos
+            ORDER BY puntuacion, id DESC LIMIT :limite OFFSET :desplazamiento
+        )
+        SELECT e.id, coalesce(m.telefono_norm, a.telefono_norm) AS telefono_norm,
+               coalesce(m.direccion, a.direccion) AS direccion,
+               coalesce(m.enviado_at, a.enviado_at) AS enviado_at,
+               c.nombre AS contacto_nombre, e.fragmento, e.archivado
+        FROM encontrados e
+        LEFT JOIN mensaje m ON m.id = e.id AND e.archivado = 0
+        LEFT JOIN mensaje_archivado_fts a ON a.rowid = e.id AND e.archivado = 1
+        LEFT JOIN contacto c ON c.telefono_norm = coalesce(m.telefono_norm, a.telefono_norm)
+        WHERE m.id IS NOT NULL OR a.rowid IS NOT NULL
+        ORDER BY e.puntuacion, e.id DESC
+    ''',
+    'postgresql': '''
+        WITH candidatos AS (
+            (SELECT id, busqueda, false AS archivado FROM mensaje
+             WHERE busqueda @@ to_tsquery('spanish', :consulta)
+             ORDER BY id DESC LIMIT :candidatos)
+            UNION ALL
+            (SELECT id, busqueda, true AS archivado FROM mensaje_archivado_fts
+             WHERE busqueda @@ to_tsquery('spanish', :consulta)
+             ORDER BY id DESC LIMIT :candidatos)
+            ORDER BY id DESC LIMIT :candidatos
+        ), encontrados AS (
+            SELECT id, archivado, ts_rank(busqueda, to_tsquery('spanish', :consulta)) AS puntuacion
+            FROM candidatos
+            ORDER BY puntuacion DESC, id DESC LIMIT :limite OFFSET :desplazamiento
+        )
+        SELECT e.id, coalesce(m.telefono_norm, a.telefono_norm) AS telefono_norm,
+               coalesce(m.direccion, a.direccion) AS direccion,
+               coalesce(m.enviado_at, a.enviado_at) AS enviado_at,
+               c.nombre AS contacto_nombre,
+               ts_headline('spanish', coalesce(m.contenido, a.contenido), to_tsquery('spanish', :consulta),
+                           :opciones) AS fragmento,
+               e.archivado
+        FROM encontrados e
+        LEFT JOIN mensaje m ON m.id = e.id AND NOT e.archivado
+        LEFT JOIN mensaje_archivado_fts a ON a.id = e.id AND e.archivado
+        LEFT JOIN contacto c ON c.telefono_norm = coalesce(m.telefono_norm, a.telefono_norm)
+        WHERE m.id IS NOT NULL OR a.id IS NOT NULL
+        ORDER BY e.puntuacion DESC, e.id DESC
+    '''
+}
 
-    mensajes = db.relationship('Mensaje', backref='reserva', lazy=True, cascade='all, delete-orphan')
+# Reservas: el nombre del cliente pesa más que el tipo de celebración y las notas
+SQL_BUSCAR_RESERVAS = {
+    'sqlite': '''
+        WITH candidatos AS (
+            SELECT rowid AS id, bm25(reserva_fts, 10.0, 1.0, 5.0) AS puntuacion,
+                   highlight(reserva_fts, 0, :inicio, :fin) AS nombre,
+                   snippet(reserva_fts, -1, :inicio, :fin, '…', 16) AS fragmento
+            FROM reserva_fts
+            WHERE reserva_fts MATCH :consulta
+            ORDER BY rowid DESC LIMIT :candidatos
+        ), encontrados AS (
+            SELECT * FROM candidatos
+            ORDER BY puntuacion, id DESC LIMIT :limite OFFSET :desplazamiento
+        )
+        SELECT r.id, r.cliente_nombre, r.fecha_evento, r.estado, r.tipo_celebracion, r.telefono_norm,
+               e.nombre, e.fragmento
+        FROM encontrados e
+        JOIN reserva r ON r.id = e.id
+        ORDER BY e.puntuacion, e.id DESC
+    ''',
+    'postgresql': '''
+        WITH candidatos AS (
+            SELECT id, busqueda FROM reserva
+            WHERE busqueda @@ to_tsquery('spanish', :consulta)
+            ORDER BY id DESC LIMIT :candidatos
+        ), encontrados AS (
+            SELECT id, ts_rank(busqueda, to_tsquery('spanish', :consulta)) AS puntuacion FROM candidatos
+            ORDER BY puntuacion DESC, id DESC LIMIT :limite OFFSET :desplazamiento
+        )
+        SELECT r.id, r.cliente_nombre, r.fecha_evento, r.estado, r.tipo_celebracion, r.telefono_norm,
+               ts_headline('spanish', r.cliente_nombre, to_tsquery('spanish', :consulta), :opciones) AS nombre,
+               ts_headline('spanish', concat_ws(' · ', r.tipo_celebracion, r.notas),
+                           to_tsquery('spanish', :consulta), :opciones) AS fragmento
+        FROM encontrados e
+        JOIN reserva r ON r.id = e.id
+        ORDER BY e.puntuacion DESC, e.id DESC
+    '''
+}
 
 
-class Mensaje(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    reserva_id = db.Column(db.Integer, db.ForeignKey('reserva.id'), nullable=True)  # Puede ser NULL
-    telefono_destino = db.Column(db.String(20), nullable=False)
-    telefono_origen = db.Column(db.String(20))
-    contenido = db.Column(db.Text, nullable=False)
-    tipo = db.Column(db.String(20), default='whatsapp')
-    direccion = db.Column(db.String(20), default='saliente')  # 'saliente' o 'entrante'
-    estado = db.Column(db.String(20), default='enviado')
-    twilio_sid = db.Column(db.String(100))
-    num_media = db.Column(db.Integer, default=0)  # Número de archivos multimedia
-    media_urls = db.Column(db.Text)  # URLs de archivos multimedia (JSON)
-    media_types = db.Column(db.Text)  # Tipos de archivos multimedia (JSON)
-    enviado_at = db.Column(db.DateTime, default=datetime.utcnow)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+def buscar(sentencias, tipos, texto, limite, desplazamiento):
+    """
+    Página de resultados de una búsqueda ordenados por relevancia
+    Devuelve (filas, hay_mas); sin palabras que buscar no consulta la base de datos
+    """
+    dialecto = db.engine.dialect.name
+    consulta = expresion_busqueda(texto, dialecto)
+    if not consulta or dialecto not in sentencias:
+        return [], False
 
+    filas = db.session.execute(db.text(sentencias[dialecto]).columns(**tipos), {
+        'consulta': consulta,
+        'limite': limite + 1,
+        'desplazamiento': desplazamiento,
+        'candidatos': BUSQUEDA_CANDIDATOS,
+        'inicio': INICIO_RESALTADO,
+        'fin': FIN_RESALTADO,
+        'opciones': f'StartSel={INICIO_RESALTADO}, StopSel={FIN_RESALTADO}, MaxWords=20, MinWords=8'
+    }).all()
+    return filas[:limite], len(filas) > limite
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+
+def buscar_mensajes(texto, limite, desplazamiento):
+    filas, hay_mas = buscar(SQL_BUSCAR_MENSAJES, {'enviado_at': db.DateTime}, texto, limite, desplazamiento)
+    return [{
+        'id': fila.id,
+        'telefono': fila.telefono_norm,
+        'nombre': fila.contacto_nombre or (fila.telefono_norm or '').replace('+', ''),
+        'direccion': fila.direccion,
+        'fecha': fila.enviado_at.strftime('%d/%m/%Y %H:%M') if fila.enviado_at else '',
+        'fragmento': resaltar(fila.fragmento),
+        'archivado': bool(fila.archivado)
+    } for fila in filas], hay_mas
+
+
+def buscar_reservas(texto, limite, desplazamiento):
+    filas, hay_mas = buscar(SQL_BUSCAR_RESERVAS, {'fecha_evento': db.Date}, texto, limite, desplazamiento)
+    return [{
+        'id': fila.id,
+        'nombre': fila.cliente_nombre,
+        'nombre_resaltado': resaltar(fila.nombre),
+        'telefono': fila.telefono_norm,
+        'fecha_evento': fila.fecha_evento.isoformat(),
+        'estado': fila.estado,
+        'tipo_celebracion': fila.tipo_celebracion,
+        'fragmento': resaltar(fila.fragmento)
+    } for fila in filas], hay_mas
 
 
 # ============= RUTAS DE AUTENTICACIÓN =============
@@ -117,17 +2040,19 @@ def login():
         
         if user and user.check_password(password):
             login_user(user)
+            guardar_usuario_sesion(user)
             return redirect(url_for('index'))
         else:
             flash('Usuario o contraseña incorrectos', 'error')
     
-    return render_template('login.html')
+    return renderizar('login.html')
 
 
 @app.route('/logout')
 @login_required
 def logout():
     logout_user()
+    invalidar_usuario_sesion()
     return redirect(url_for('login'))
 
 
@@ -150,7 +2075,7 @@ def register():
         flash('Usuario registrado correctamente', 'success')
         return redirect(url_for('login'))
     
-    return render_template('register.html')
+    return renderizar('register.html')
 
 
 # ============= RUTAS PRINCIPALES =============
@@ -164,39 +2089,215 @@ def index():
 @app.route('/calendario')
 @login_required
 def calendario():
-    return render_template('calendario.html')
+    return renderizar('calendario.html')
 
 
 @app.route('/reservas')
 @login_required
 def reservas():
-    reservas_list = Reserva.query.order_by(Reserva.fecha_evento.desc()).all()
-    return render_template('reservas.html', reservas=reservas_list)
+    """
+    Listado de reservas filtrado y paginado en el servidor
+    
+    Parámetros opcionales: estado, tipo, desde, hasta (YYYY-MM-DD), q (texto)
+    y despues (id de la última reserva mostrada). Con formato=json devuelve
+    la página como JSON para el scroll infinito.
+    """
+    filtros = filtros_reservas()
+    despues = request.args.get('despues', type=int)
+    reservas_list, siguiente = consultar_reservas(filtros, despues)
+    
+    contexto = {
+        'reservas': reservas_list,
+        'primera_pagina': not despues,
+        'hay_filtros': any(filtros.values())
+    }
+    if request.args.get('formato') == 'json':
+        return jsonify({
+            'reservas': [serializar_reserva(r) for r in reservas_list],
+            'html': renderizar('_reservas_pagina.html', **contexto),
+            'siguiente': siguiente
+        })
+    return renderizar('reservas.html', filtros=filtros, siguiente=siguiente, **contexto)
 
 
 @app.route('/mensajes')
 @login_required
 def mensajes():
-    mensajes_list = Mensaje.query.order_by(Mensaje.enviado_at.desc()).all()
-    return render_template('mensajes.html', mensajes=mensajes_list)
+    # Las conversaciones y sus mensajes (paginados por cursor) se cargan por la API
+    return renderizar('mensajes.html')
 
 
 # ============= API ENDPOINTS =============
 
+def fecha_parametro(nombre):
+    """Leer una fecha ISO 8601 de la query string (se ignora la hora y la zona)"""
+    valor = request.args.get(nombre)
+    if not valor:
+        return None
+    return date.fromisoformat(valor[:10])
+
+
 @app.route('/api/reservas', methods=['GET'])
 @login_required
 def get_reservas():
-    reservas = Reserva.query.filter_by(estado='confirmada').all()
-    return jsonify([{
-        'id': r.id,
-        'title': f'{r.cliente_nombre} - {r.tipo_celebracion or "Evento"}',
-        'start': f'{r.fecha_evento}T{r.hora_inicio}',
-        'end': f'{r.fecha_evento}T{r.hora_fin}',
-        'cliente': r.cliente_nombre,
-        'telefono': r.cliente_telefono,
-        'invitados': r.num_invitados,
-        'precio': r.precio
-    } for r in reservas])
+    """
+    Reservas confirmadas en formato de FullCalendar
+    Con start/end (fin exclusivo) devuelve solo la ventana visible; sin ellos
+    devuelve todas en streaming. El ETag depende de la versión de la tabla,
+    así que una vista sin cambios se responde con 304 sin consultar ni
+    serializar las reservas.
+    """
+    try:
+        inicio = fecha_parametro('start')
+        fin = fecha_parametro('end')
+    except ValueError:
+        return jsonify({'error': 'Fecha no válida (formato YYYY-MM-DD)'}), 400
+
+    etag = f'reservas-{version_tabla("reserva")}-{inicio or ""}-{fin or ""}'
+    # Comparación débil: con compresión el ETag se envía como W/"..."
+    if request.if_none_match.contains_weak(etag):
+        respuesta = Response(status=304)
+    else:
+        consulta = db.session.query(*COLUMNAS_EVENTO).filter(Reserva.estado == 'confirmada')
+        if inicio:
+            consulta = consulta.filter(Reserva.fecha_evento >= inicio)
+        if fin:
+            consulta = consulta.filter(Reserva.fecha_evento < fin)
+        consulta = consulta.order_by(Reserva.fecha_evento, Reserva.hora_inicio)
+        if inicio and fin:
+            respuesta = jsonify([serializar_reserva_evento(r) for r in consulta])
+        else:
+            respuesta = respuesta_json_lista(app, stream_with_context(
+                serializar_reserva_evento(r) for r in consulta.yield_per(500)
+            ))
+
+    # El navegador guarda la respuesta pero la revalida siempre con If-None-Match
+    respuesta.set_etag(etag)
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+    return respuesta
+
+
+@app.route('/api/disponibilidad')
+@login_required
+def disponibilidad():
+    """
+    Huecos libres por día en un rango de fechas
+    
+    Parámetros: desde/hasta (incluidos) o start/end de FullCalendar (fin
+    exclusivo) y minutos (duración mínima del hueco, opcional)
+    """
+    try:
+        desde = fecha_parametro('desde') or fecha_parametro('start')
+        hasta = fecha_parametro('hasta')
+        if not hasta and fecha_parametro('end'):
+            hasta = fecha_parametro('end') - timedelta(days=1)
+    except ValueError:
+        return jsonify({'error': 'Fecha no válida (formato YYYY-MM-DD)'}), 400
+    
+    if not desde or not hasta:
+        return jsonify({'error': 'Faltan las fechas desde y hasta'}), 400
+    if hasta < desde or (hasta - desde).days >= DISPONIBILIDAD_DIAS_MAX:
+        return jsonify({'error': f'El rango debe tener entre 1 y {DISPONIBILIDAD_DIAS_MAX} días'}), 400
+    
+    minutos = request.args.get('minutos', 0, type=int)
+    return jsonify({
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'dias': huecos_libres(desde, hasta, minutos)
+    })
+
+
+@app.route('/api/dashboard/stats')
+@login_required
+def estadisticas_dashboard():
+    return jsonify(obtener_estadisticas())
+
+
+# ============= INFORMES DE TEMPORADA =============
+
+ESTADOS_INFORME = ('confirmada', 'pendiente', 'cancelada')
+
+
+def parametros_informe():
+    """
+    Rango y estados de un informe (lanza ValueError si no son válidos)
+    desde/hasta en formato YYYY-MM-DD (por defecto el año en curso) y
+    estado, separados por comas (por defecto solo las confirmadas)
+    """
+    hoy = date.today()
+    try:
+        desde = fecha_parametro('desde') or date(hoy.year, 1, 1)
+        hasta = fecha_parametro('hasta') or date(hoy.year, 12, 31)
+    except ValueError:
+        raise ValueError('Fecha no válida (formato YYYY-MM-DD)')
+    if hasta < desde:
+        raise ValueError('La fecha hasta es anterior a desde')
+    estados = [e for e in request.args.get('estado', 'confirmada').split(',') if e]
+    if not estados or any(e not in ESTADOS_INFORME for e in estados):
+        raise ValueError(f'Estado no válido (usa {", ".join(ESTADOS_INFORME)})')
+    return desde, hasta, estados
+
+
+@app.route('/api/informes/ingresos')
+@login_required
+def informe_ingresos_temporada():
+    """Ingresos, cobros pendientes e invitados por mes y tipo de celebración"""
+    try:
+        desde, hasta, estados = parametros_informe()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'estados': estados,
+        **informe_ingresos(db.session, ResumenDiario.__table__, desde, hasta, estados)
+    })
+
+
+@app.route('/api/informes/ocupacion')
+@login_required
+def informe_ocupacion_temporada():
+    """Ocupación de cada fin de semana (sábado y domingo) y de toda la temporada"""
+    try:
+        desde, hasta, estados = parametros_informe()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'estados': estados,
+        **informe_ocupacion(db.session, ResumenDiario.__table__, desde, hasta, estados)
+    })
+
+
+@app.route('/api/informes/<informe>.csv')
+@login_required
+def exportar_informe(informe):
+    """
+    Informe en CSV: ingresos, ocupacion o reservas (el detalle de cada una)
+    Las filas se escriben en la respuesta a medida que se leen, así que
+    exportar años de reservas no las carga todas en memoria.
+    """
+    if informe not in COLUMNAS_CSV:
+        return jsonify({'error': 'Informe no encontrado'}), 404
+    try:
+        desde, hasta, estados = parametros_informe()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if informe == 'ingresos':
+        filas = ingresos_por_mes(db.session, ResumenDiario.__table__, desde, hasta, estados)
+    elif informe == 'ocupacion':
+        filas = ocupacion_fines_de_semana(db.session, ResumenDiario.__table__, desde, hasta, estados)
+    else:
+        filas = reservas_detalle(db.session, Reserva.__table__, desde, hasta, estados)
+
+    respuesta = app.response_class(
+        stream_with_context(lineas_csv(COLUMNAS_CSV[informe], filas)), mimetype='text/csv'
+    )
+    respuesta.headers['Content-Disposition'] = f'attachment; filename="{informe}_{desde}_{hasta}.csv"'
+    return respuesta
 
 
 @app.route('/api/reservas', methods=['POST'])
@@ -209,13 +2310,21 @@ def crear_reserva():
         hora_inicio = datetime.strptime(data['hora_inicio'], '%H:%M').time()
         hora_fin = datetime.strptime(data['hora_fin'], '%H:%M').time()
         
-        reserva_existente = Reserva.query.filter_by(
-            fecha_evento=fecha_evento,
-            estado='confirmada'
-        ).first()
+        # Con la misma hora de inicio y de fin la reserva duraría 24 horas: solo si se pide
+        if hora_fin == hora_inicio and not data.get('dia_completo'):
+            return jsonify({
+                'error': 'La hora de fin es igual a la de inicio (envía dia_completo para reservar 24 horas)'
+            }), 400
         
-        if reserva_existente:
-            return jsonify({'error': 'Ya existe una reserva para esta fecha'}), 400
+        # Comprobar solapes con el bloqueo de escritura tomado hasta el commit
+        inicio, fin = intervalo_reserva(fecha_evento, hora_inicio, hora_fin)
+        conflictos = comprobar_disponibilidad(inicio, fin)
+        if conflictos:
+            db.session.rollback()
+            return jsonify({
+                'error': 'Ya existe una reserva en ese horario',
+                'conflictos': [serializar_reserva_evento(r) for r in conflictos]
+            }), 409
         
         reserva = Reserva(
             cliente_nombre=data['cliente_nombre'],
@@ -235,6 +2344,7 @@ def crear_reserva():
         
         db.session.add(reserva)
         db.session.commit()
+        invalidar_estadisticas()
         
         return jsonify({'message': 'Reserva creada correctamente', 'id': reserva.id}), 201
         
@@ -243,6 +2353,15 @@ def crear_reserva():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/reservas/<int:reserva_id>', methods=['GET'])
+@login_required
+def obtener_reserva(reserva_id):
+    reserva = reserva_por_id(reserva_id)
+    if reserva is None:
+        return jsonify({'error': 'Reserva no encontrada'}), 404
+    return jsonify(reserva)
+
+
 @app.route('/api/reservas/<int:reserva_id>', methods=['DELETE'])
 @login_required
 def eliminar_reserva(reserva_id):
@@ -251,6 +2370,7 @@ def eliminar_reserva(reserva_id):
     try:
         db.session.delete(reserva)
         db.session.commit()
+        invalidar_estadisticas()
         return jsonify({'message': 'Reserva eliminada correctamente'})
     except Exception as e:
         db.session.rollback()
@@ -270,8 +2390,19 @@ def cambiar_estado_reserva(reserva_id):
         return jsonify({'error': 'Estado no válido'}), 400
     
     try:
+        # Una reserva que pasa a ocupar su horario no puede solaparse con otra
+        if nuevo_estado in ESTADOS_QUE_OCUPAN and reserva.estado not in ESTADOS_QUE_OCUPAN:
+            conflictos = comprobar_disponibilidad(reserva.inicio_at, reserva.fin_at, excluir_id=reserva.id)
+            if conflictos:
+                db.session.rollback()
+                return jsonify({
+                    'error': 'El horario de la reserva se solapa con otra reserva',
+                    'conflictos': [serializar_reserva_evento(r) for r in conflictos]
+                }), 409
+        
         reserva.estado = nuevo_estado
         db.session.commit()
+        invalidar_estadisticas()
         return jsonify({
             'message': f'Estado cambiado a {nuevo_estado}',
             'reserva_id': reserva_id,
@@ -296,18 +2427,20 @@ def enviar_whatsapp():
             'message': 'Mensaje simulado (configura Twilio para enviar realmente)'
         }), 200
     
+    if not telefono_destino or not mensaje:
+        return jsonify({'error': 'Teléfono y mensaje son obligatorios'}), 400
+    
     try:
         if not telefono_destino.startswith('whatsapp:'):
-            telefono_destino = f'whatsapp:+{telefono_destino.replace("+", "").replace(" ", "")}'
-        
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+            telefono_destino = f'whatsapp:{normalizar_telefono(telefono_destino)}'
         
-        message = client.messages.create(
-            body=mensaje,
-            from_=TWILIO_WHATSAPP_NUMBER,
-            to=telefono_destino
-        )
+        # Desde la vista de conversaciones no llega la reserva: usar la del contacto
+        if not reserva_id:
+            telefono_norm = normalizar_telefono(telefono_destino)
+            contacto = contactos_por_telefono([telefono_norm]).get(telefono_norm)
+            reserva_id = contacto['reserva_id'] if contacto else None
         
+        # El envío real lo hace la cola en segundo plano
         nuevo_mensaje = Mensaje(
             reserva_id=reserva_id,
             telefono_destino=telefono_destino,
@@ -315,95 +2448,240 @@ def enviar_whatsapp():
             contenido=mensaje,
             tipo='whatsapp',
             direccion='saliente',
-            estado='enviado',
-            twilio_sid=message.sid,
+            estado='en_cola',
+            intentos=0,
             num_media=0,
             user_id=current_user.id
         )
         
         db.session.add(nuevo_mensaje)
         db.session.commit()
+        publicar_evento_mensaje(nuevo_mensaje)
+        cola_envio.avisar()
         
-        return jsonify({'message': 'Mensaje enviado correctamente', 'sid': message.sid})
+        return jsonify({
+            'message': 'Mensaje en cola de envío',
+            'id': nuevo_mensaje.id,
+            'estado': nuevo_mensaje.estado
+        }), 202
         
     except Exception as e:
-        nuevo_mensaje = Mensaje(
-            reserva_id=reserva_id,
-            telefono_destino=telefono_destino,
-            telefono_origen=TWILIO_WHATSAPP_NUMBER,
-            contenido=mensaje,
-            tipo='whatsapp',
-            direccion='saliente',
-            estado='fallido',
-            num_media=0,
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+class _CamposPlantilla(dict):
+    """Deja intactos los marcadores desconocidos en lugar de fallar"""
+    def __missing__(self, clave):
+        return '{' + clave + '}'
+
+
+def renderizar_plantilla(plantilla, reserva):
+    """Sustituir los marcadores {cliente_nombre}, {fecha_evento}... con los datos de la reserva"""
+    return plantilla.format_map(_CamposPlantilla(
+        cliente_nombre=reserva.cliente_nombre,
+        fecha_evento=reserva.fecha_evento.strftime('%d/%m/%Y'),
+        hora_inicio=reserva.hora_inicio.strftime('%H:%M'),
+        hora_fin=reserva.hora_fin.strftime('%H:%M'),
+        tipo_celebracion=reserva.tipo_celebracion or 'evento',
+        num_invitados=reserva.num_invitados or 0,
+        precio=f'{reserva.precio or 0:.2f}',
+        pendiente=f'{(reserva.precio or 0) - (reserva.anticipo or 0):.2f}'
+    ))
+
+
+@app.route('/api/whatsapp/difusion', methods=['POST'])
+@login_required
+def crear_difusion():
+    """
+    Enviar un mensaje con plantilla a todas las reservas de un rango de fechas
+    
+    JSON: plantilla, estado (por defecto 'confirmada') y fecha_desde/fecha_hasta
+    (YYYY-MM-DD) o dias (próximos N días). Con simular=true solo devuelve la
+    vista previa. Los mensajes se insertan de una vez y los envía la cola.
+    """
+    data = request.get_json() or {}
+    plantilla = (data.get('plantilla') or '').strip()
+    estado = data.get('estado', 'confirmada')
+    simular = bool(data.get('simular'))
+    
+    if not plantilla:
+        return jsonify({'error': 'La plantilla es obligatoria'}), 400
+    
+    try:
+        if data.get('dias') is not None:
+            fecha_desde = datetime.utcnow().date()
+            fecha_hasta = fecha_desde + timedelta(days=int(data['dias']))
+        else:
+            fecha_desde = datetime.strptime(data['fecha_desde'], '%Y-%m-%d').date()
+            fecha_hasta = datetime.strptime(data['fecha_hasta'], '%Y-%m-%d').date()
+    except (KeyError, ValueError, TypeError):
+        return jsonify({'error': 'Indica fecha_desde y fecha_hasta (YYYY-MM-DD) o dias'}), 400
+    
+    reservas = Reserva.query.filter(
+        Reserva.fecha_evento >= fecha_desde,
+        Reserva.fecha_evento <= fecha_hasta,
+        Reserva.estado == estado
+    ).order_by(Reserva.fecha_evento.asc()).all()
+    
+    try:
+        destinatarios = []
+        omitidos = []
+        for reserva in reservas:
+            if not reserva.telefono_norm:
+                omitidos.append({'reserva_id': reserva.id, 'cliente': reserva.cliente_nombre})
+                continue
+            destinatarios.append((reserva, renderizar_plantilla(plantilla, reserva)))
+    except (ValueError, IndexError, AttributeError) as e:
+        return jsonify({'error': f'Plantilla no válida: {str(e)}'}), 400
+    
+    if simular:
+        return jsonify({
+            'total': len(destinatarios),
+            'omitidos': omitidos,
+            'vista_previa': [{
+                'reserva_id': reserva.id,
+                'cliente': reserva.cliente_nombre,
+                'telefono': reserva.telefono_norm,
+                'mensaje': texto
+            } for reserva, texto in destinatarios]
+        })
+    
+    if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
+        return jsonify({
+            'error': 'Configuración de Twilio no disponible',
+            'message': 'Mensajes simulados (configura Twilio para enviar realmente)'
+        }), 200
+    
+    if not destinatarios:
+        return jsonify({'error': 'No hay reservas que cumplan el filtro', 'omitidos': omitidos}), 400
+    
+    try:
+        difusion = Difusion(
+            plantilla=plantilla,
+            filtros=json.dumps({
+                'fecha_desde': fecha_desde.isoformat(),
+                'fecha_hasta': fecha_hasta.isoformat(),
+                'estado': estado
+            }),
+            total=len(destinatarios),
             user_id=current_user.id
         )
-        db.session.add(nuevo_mensaje)
+        db.session.add(difusion)
+        db.session.flush()
+        
+        # Inserción masiva: los eventos del ORM no se ejecutan, el teléfono va ya normalizado
+        ahora = datetime.utcnow()
+        db.session.execute(db.insert(Mensaje), [{
+            'reserva_id': reserva.id,
+            'difusion_id': difusion.id,
+            'telefono_destino': f'whatsapp:{reserva.telefono_norm}',
+            'telefono_origen': TWILIO_WHATSAPP_NUMBER,
+            'telefono_norm': reserva.telefono_norm,
+            'contenido': texto,
+            'tipo': 'whatsapp',
+            'direccion': 'saliente',
+            'estado': 'en_cola',
+            'intentos': 0,
+            'num_media': 0,
+            'enviado_at': ahora,
+            'user_id': current_user.id
+        } for reserva, texto in destinatarios])
         db.session.commit()
+        cola_envio.avisar()
+        
+        return jsonify({
+            'message': f'{len(destinatarios)} mensajes en cola de envío',
+            'id': difusion.id,
+            'total': len(destinatarios),
+            'omitidos': omitidos
+        }), 202
         
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/whatsapp/difusion/<int:difusion_id>')
+@login_required
+def progreso_difusion(difusion_id):
+    """Estado de cada destinatario de un envío masivo"""
+    difusion = Difusion.query.get_or_404(difusion_id)
+    
+    filas = db.session.query(
+        Mensaje.id,
+        Mensaje.reserva_id,
+        Reserva.cliente_nombre,
+        Mensaje.telefono_norm,
+        Mensaje.estado,
+        Mensaje.intentos,
+        Mensaje.error_envio
+    ).outerjoin(
+        Reserva, Reserva.id == Mensaje.reserva_id
+    ).filter(
+        Mensaje.difusion_id == difusion_id
+    ).order_by(Mensaje.id).all()
+    
+    resumen = {}
+    for fila in filas:
+        resumen[fila.estado] = resumen.get(fila.estado, 0) + 1
+    pendientes = resumen.get('en_cola', 0) + resumen.get('enviando', 0)
+    
+    return jsonify({
+        'id': difusion.id,
+        'total': difusion.total,
+        'resumen': resumen,
+        'completada': pendientes == 0,
+        'destinatarios': [{
+            'mensaje_id': fila.id,
+            'reserva_id': fila.reserva_id,
+            'cliente': fila.cliente_nombre,
+            'telefono': fila.telefono_norm,
+            'estado': fila.estado,
+            'intentos': fila.intentos or 0,
+            'error': fila.error_envio
+        } for fila in filas]
+    })
+
+
 @app.route('/api/mensajes/agrupados')
 @login_required
 def obtener_conversaciones_agrupadas():
-    """Obtener conversaciones agrupadas por teléfono"""
+    """Obtener conversaciones agrupadas por teléfono (una consulta y los totales del archivo)"""
     try:
-        # Obtener todos los teléfonos únicos
-        subquery = db.session.query(
-            db.func.coalesce(Mensaje.telefono_origen, Mensaje.telefono_destino).label('telefono'),
-            db.func.max(Mensaje.enviado_at).label('ultima_fecha')
-        ).group_by('telefono').subquery()
-        
         conversaciones = []
+        archivados = totales_archivados()
         
-        # Obtener último mensaje de cada conversación
-        for row in db.session.query(subquery).all():
+        for row in consultar_resumen_conversaciones():
             telefono = row.telefono
-            if not telefono or telefono == TWILIO_WHATSAPP_NUMBER:
+            if not telefono or telefono == normalizar_telefono(TWILIO_WHATSAPP_NUMBER):
                 continue
-                
-            # Obtener último mensaje
-            ultimo_mensaje = Mensaje.query.filter(
-                db.or_(
-                    Mensaje.telefono_origen == telefono,
-                    Mensaje.telefono_destino == telefono
-                )
-            ).order_by(Mensaje.enviado_at.desc()).first()
-            
-            if not ultimo_mensaje:
-                continue
-            
-            # Buscar nombre del cliente en reservas
-            telefono_limpio = telefono.replace('whatsapp:', '').replace('+', '')
-            reserva = Reserva.query.filter(
-                Reserva.cliente_telefono.contains(telefono_limpio[-9:])
-            ).first()
             
-            nombre = reserva.cliente_nombre if reserva else telefono_limpio
+            nombre = row.cliente_nombre or telefono.replace('+', '')
             
             # Contar mensajes no leídos (entrantes sin leer - feature futura)
             no_leidos = 0
             
             # Preparar texto del último mensaje
-            ultimo_texto = ultimo_mensaje.contenido[:50]
-            if ultimo_mensaje.num_media and ultimo_mensaje.num_media > 0:
-                ultimo_texto = f"📎 {ultimo_mensaje.num_media} archivo(s) - {ultimo_texto}"
-            if len(ultimo_mensaje.contenido) > 50:
+            contenido = row.contenido or ''
+            ultimo_texto = contenido[:50]
+            if row.num_media and row.num_media > 0:
+                ultimo_texto = f"📎 {row.num_media} archivo(s) - {ultimo_texto}"
+            if len(contenido) > 50:
                 ultimo_texto += '...'
             
+            mensajes_archivo, media_archivo = archivados.get(telefono, (0, 0))
             conversaciones.append({
                 'telefono': telefono,
                 'nombre': nombre,
                 'ultimo_mensaje': ultimo_texto,
-                'ultimo_mensaje_fecha': ultimo_mensaje.enviado_at.strftime('%d/%m %H:%M'),
+                'ultimo_mensaje_fecha': row.enviado_at.strftime('%d/%m %H:%M') if row.enviado_at else '',
                 'no_leidos': no_leidos,
-                'tiene_multimedia': ultimo_mensaje.num_media > 0 if ultimo_mensaje.num_media else False
+                'tiene_multimedia': bool(row.num_media),
+                'total_mensajes': row.total_mensajes + mensajes_archivo,
+                'total_media': (row.total_media or 0) + media_archivo
             })
         
-        # Ordenar por fecha más reciente
-        conversaciones.sort(key=lambda x: x['ultimo_mensaje_fecha'], reverse=True)
-        
         return jsonify(conversaciones)
         
     except Exception as e:
@@ -411,104 +2689,179 @@ def obtener_conversaciones_agrupadas():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/buscar')
+@login_required
+def buscar_texto():
+    """
+    Búsqueda de texto completo en mensajes y reservas, por relevancia
+    
+    Parámetros:
+        q:      palabras a buscar (todas, como prefijo; sin distinguir acentos en SQLite)
+        tipo:   todo (por defecto), mensajes o reservas
+        pagina: página de resultados, desde 1
+        limite: resultados por página de cada tipo (máximo 50)
+    Los fragmentos vienen con el HTML escapado y las coincidencias entre <mark>.
+    """
+    texto = request.args.get('q', '').strip()
+    tipo = request.args.get('tipo', 'todo')
+    if tipo not in ('todo', 'mensajes', 'reservas'):
+        return jsonify({'error': 'Tipo no válido (todo, mensajes o reservas)'}), 400
+    if not texto:
+        return jsonify({'error': 'Falta el texto a buscar (q)'}), 400
+    
+    limite = min(max(request.args.get('limite', BUSQUEDA_POR_PAGINA, type=int), 1), BUSQUEDA_POR_PAGINA_MAX)
+    pagina = min(max(request.args.get('pagina', 1, type=int), 1), -(-BUSQUEDA_CANDIDATOS // limite))
+    desplazamiento = (pagina - 1) * limite
+    
+    resultado = {'q': texto, 'pagina': pagina}
+    try:
+        if tipo in ('todo', 'mensajes'):
+            mensajes, hay_mas = buscar_mensajes(texto, limite, desplazamiento)
+            resultado['mensajes'] = {'resultados': mensajes, 'hay_mas': hay_mas}
+        if tipo in ('todo', 'reservas'):
+            reservas, hay_mas = buscar_reservas(texto, limite, desplazamiento)
+            resultado['reservas'] = {'resultados': reservas, 'hay_mas': hay_mas}
+    except (OperationalError, ProgrammingError) as e:
+        db.session.rollback()
+        print(f"❌ Índice de búsqueda no disponible (¿falta ejecutar python migrar.py?): {e}")
+        return jsonify({'error': 'La búsqueda no está disponible'}), 503
+    
+    return jsonify(resultado)
+
+
+def firma_twilio_valida():
+    """
+    Comprobar la cabecera X-Twilio-Signature: HMAC de la URL del webhook y
+    los parámetros del formulario con el auth token de la cuenta
+    """
+    firma = request.headers.get('X-Twilio-Signature', '')
+    if not firma or not TWILIO_AUTH_TOKEN:
+        return False
+    url = WEBHOOK_URL_PUBLICA or request.url
+    return validador_twilio.validate(url, request.form.to_dict(), firma)
+
+
 @app.route('/api/whatsapp/webhook', methods=['POST'])
 def whatsapp_webhook():
-    """Webhook para recibir mensajes entrantes de Twilio (incluyendo multimedia)"""
+    """
+    Webhook para recibir mensajes entrantes de Twilio (incluyendo multimedia)
+    
+    Solo guarda el payload en la tabla de entrada y responde; el procesador
+    en segundo plano crea los mensajes. Los reintentos de Twilio con el
+    mismo MessageSid se descartan.
+    """
+    if WEBHOOK_VALIDAR_FIRMA and not firma_twilio_valida():
+        print("⚠️ Webhook rechazado: firma de Twilio no válida")
+        return '', 403
+    
+    message_sid = request.form.get('MessageSid')
+    if not message_sid or not request.form.get('From'):
+        return '', 400
+    
     try:
-        # Obtener datos del mensaje entrante
-        from_number = request.form.get('From')
-        to_number = request.form.get('To')
-        body = request.form.get('Body', '')  # El body puede estar vacío si solo hay media
-        message_sid = request.form.get('MessageSid')
-        
-        # Obtener información de archivos multimedia
-        num_media = int(request.form.get('NumMedia', 0))
-        media_urls = []
-        media_types = []
-        
-        # Recopilar URLs y tipos de todos los archivos multimedia
-        for i in range(num_media):
-            media_url = request.form.get(f'MediaUrl{i}')
-            media_type = request.form.get(f'MediaContentType{i}')
-            if media_url:
-                media_urls.append(media_url)
-                media_types.append(media_type or 'unknown')
-        
-        # Si no hay texto pero hay multimedia, indicarlo
-        if not body and num_media > 0:
-            body = f"[{num_media} archivo(s) multimedia]"
-        
-        # Buscar si existe una reserva con este número
-        telefono_limpio = from_number.replace('whatsapp:', '').replace('+', '')
-        reserva = Reserva.query.filter(
-            Reserva.cliente_telefono.contains(telefono_limpio[-9:])
-        ).first()
-        
-        # Guardar mensaje entrante con información multimedia
-        nuevo_mensaje = Mensaje(
-            reserva_id=reserva.id if reserva else None,
-            telefono_destino=to_number,
-            telefono_origen=from_number,
-            contenido=body,
-            tipo='whatsapp',
-            direccion='entrante',
-            estado='recibido',
-            twilio_sid=message_sid,
-            num_media=num_media,
-            media_urls=json.dumps(media_urls) if media_urls else None,
-            media_types=json.dumps(media_types) if media_types else None,
-            user_id=None
-        )
-        
-        db.session.add(nuevo_mensaje)
+        db.session.add(EntradaWebhook(
+            message_sid=message_sid,
+            payload=json.dumps(request.form.to_dict())
+        ))
         db.session.commit()
-        
-        print(f"✅ Mensaje recibido de {from_number}")
-        print(f"   Contenido: {body}")
-        print(f"   Archivos multimedia: {num_media}")
-        if media_urls:
-            print(f"   URLs: {media_urls}")
-        
+    except IntegrityError:
+        # Reintento de Twilio de un mensaje ya recibido
+        db.session.rollback()
         return '', 200
-        
     except Exception as e:
+        # Responder error para que Twilio reintente: la entrada no se ha guardado
+        db.session.rollback()
         print(f"❌ Error en webhook: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return '', 200  # Siempre devolver 200 para que Twilio no reintente
+        return '', 500
+    
+    procesador_webhook.avisar()
+    return '', 200
+
+
+# Columnas que se envían de cada mensaje de una conversación
+COLUMNAS_CONVERSACION = (
+    Mensaje.id, Mensaje.contenido, Mensaje.direccion, Mensaje.estado, Mensaje.enviado_at,
+    Mensaje.telefono_origen, Mensaje.telefono_destino, Mensaje.num_media, Mensaje.media_urls, Mensaje.media_types
+)
 
 
 @app.route('/api/conversacion/<telefono>')
 @login_required
 def obtener_conversacion(telefono):
-    """Obtener todos los mensajes de una conversación con un número (incluyendo multimedia)"""
+    """
+    Obtener los mensajes de una conversación con un número (incluyendo multimedia)
+    
+    Parámetros opcionales:
+        after:  id del último mensaje conocido, devuelve solo los más nuevos
+        before: id del primer mensaje cargado, devuelve la página anterior
+        limit:  número máximo de mensajes (por defecto 50, entre 1 y 200)
+    Sin cursores devuelve los últimos mensajes. Siempre en orden cronológico.
+    Un cursor que no es un mensaje de la conversación responde 400.
+    Al retroceder más allá de los mensajes de la tabla se continúa por los
+    archivados, que siempre son anteriores.
+    """
     try:
-        # Normalizar el teléfono
-        telefono_normalizado = telefono.replace('whatsapp:', '').replace('+', '').replace(' ', '')
+        after = request.args.get('after', type=int)
+        before = request.args.get('before', type=int)
+        limit = max(1, min(request.args.get('limit', MENSAJES_POR_PAGINA, type=int), MENSAJES_POR_PAGINA_MAX))
         
-        # Buscar todos los mensajes relacionados con este número
-        mensajes = Mensaje.query.filter(
-            db.or_(
-                Mensaje.telefono_destino.contains(telefono_normalizado[-9:]),
-                Mensaje.telefono_origen.contains(telefono_normalizado[-9:])
-            )
-        ).order_by(Mensaje.enviado_at.asc()).all()
+        # Mensajes de este número, usando el índice (telefono_norm, enviado_at)
+        telefono_norm = normalizar_telefono(telefono)
+        consulta = db.session.query(*COLUMNAS_CONVERSACION).filter(Mensaje.telefono_norm == telefono_norm)
+        orden = (Mensaje.enviado_at, Mensaje.id)
+        
+        # El cursor tiene que ser un mensaje de esta conversación; `before`
+        # también puede estar archivado, `after` no (los archivados son anteriores)
+        cursor_id = after or before
+        cursor_fecha = None
+        if cursor_id:
+            cursor_fecha = db.session.query(Mensaje.enviado_at).filter(
+                Mensaje.id == cursor_id, Mensaje.telefono_norm == telefono_norm
+            ).scalar()
+            if not cursor_fecha and not after:
+                cursor_fecha = fecha_mensaje_archivado(telefono_norm, before)
+            if not cursor_fecha:
+                return jsonify({'error': 'El cursor no es un mensaje de esta conversación'}), 400
+        
+        if after:
+            mensajes = consulta.filter(
+                db.tuple_(*orden) > db.tuple_(cursor_fecha, after)
+            ).order_by(Mensaje.enviado_at.asc(), Mensaje.id.asc()).limit(limit).all()
+        elif before:
+            mensajes = consulta.filter(
+                db.tuple_(*orden) < db.tuple_(cursor_fecha, before)
+            ).order_by(Mensaje.enviado_at.desc(), Mensaje.id.desc()).limit(limit).all()
+            mensajes.reverse()
+            if len(mensajes) < limit:
+                antes = (mensajes[0].enviado_at, mensajes[0].id) if mensajes else (cursor_fecha, before)
+                mensajes = mensajes_archivados(telefono_norm, antes, limit - len(mensajes)) + mensajes
+        else:
+            mensajes = consulta.order_by(
+                Mensaje.enviado_at.desc(), Mensaje.id.desc()
+            ).limit(limit).all()
+            mensajes.reverse()
+        
+        # Copias locales de los archivos multimedia de la página (cada JSON se lee una vez)
+        media_urls = {m.id: app.json.loads(m.media_urls) for m in mensajes if m.media_urls}
+        locales = media_locales({url for urls in media_urls.values() for url in urls})
         
         resultado = []
         for m in mensajes:
-            mensaje_data = {
+            urls = media_urls.get(m.id, [])
+            fecha = m.enviado_at
+            resultado.append({
                 'id': m.id,
                 'contenido': m.contenido,
                 'direccion': m.direccion,
                 'estado': m.estado,
-                'fecha': m.enviado_at.strftime('%d/%m/%Y %H:%M'),
+                'fecha': f'{fecha.day:02d}/{fecha.month:02d}/{fecha.year} {fecha.hour:02d}:{fecha.minute:02d}',
                 'telefono_origen': m.telefono_origen,
                 'telefono_destino': m.telefono_destino,
                 'num_media': m.num_media or 0,
-                'media_urls': json.loads(m.media_urls) if m.media_urls else [],
-                'media_types': json.loads(m.media_types) if m.media_types else []
-            }
-            resultado.append(mensaje_data)
+                'media_urls': urls,
+                'media_types': app.json.loads(m.media_types) if m.media_types else [],
+                'media_locales': [url_media_local(locales.get(url)) for url in urls]
+            })
         
         return jsonify(resultado)
         
@@ -519,6 +2872,147 @@ def obtener_conversacion(telefono):
         return jsonify({'error': str(e)}), 500
 
 
+def url_media_local(archivo):
+    """URLs locales de un archivo descargado (None si aún no está en caché)"""
+    if not archivo:
+        return None
+    return {
+        'url': url_for('servir_media', sha256=archivo.sha256),
+        'miniatura': url_for('servir_miniatura', sha256=archivo.sha256) if archivo.tiene_miniatura else None
+    }
+
+
+def respuesta_media(sha256, miniatura=False):
+    """Servir un archivo de la caché con ETag, Range y caché de larga duración"""
+    archivo = ArchivoMedia.query.filter_by(sha256=sha256, estado='descargado').first()
+    ruta = almacen_media.ruta_miniatura(sha256) if miniatura else almacen_media.ruta(sha256)
+    if not archivo or not os.path.exists(ruta):
+        abort(404)
+    
+    # Registrar el uso para la expulsión LRU (como mucho una escritura por hora)
+    if not archivo.ultimo_acceso or archivo.ultimo_acceso < datetime.utcnow() - timedelta(hours=1):
+        archivo.ultimo_acceso = datetime.utcnow()
+        db.session.commit()
+    
+    respuesta = send_file(
+        ruta,
+        mimetype='image/jpeg' if miniatura else archivo.content_type,
+        conditional=True,
+        etag=f'{sha256}-miniatura' if miniatura else sha256,
+        max_age=MEDIA_CACHE_SEGUNDOS
+    )
+    respuesta.cache_control.public = False
+    respuesta.cache_control.private = True
+    respuesta.cache_control.immutable = True
+    return respuesta
+
+
+@app.route('/static/dist/<archivo>')
+def recurso_empaquetado(archivo):
+    """Paquete de CSS o JS con hash en el nombre: versión precomprimida y caché de un año"""
+    ruta, codificacion = recursos.variante(archivo, request.accept_encodings)
+    if ruta is None:
+        abort(404)
+    
+    respuesta = send_file(
+        ruta,
+        mimetype=mimetypes.guess_type(archivo)[0],
+        conditional=True,
+        max_age=RECURSOS_CACHE_SEGUNDOS
+    )
+    respuesta.vary.add('Accept-Encoding')
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.cache_control.public = True
+    respuesta.cache_control.immutable = True
+    return respuesta
+
+
+@app.route('/sw.js')
+def service_worker():
+    """
+    Service worker de la PWA, servido desde la raíz para que controle todas las páginas
+    La versión cambia con la lista de recursos, así que cada despliegue con
+    paquetes nuevos instala un service worker nuevo y descarta la caché anterior.
+    """
+    precache = [url for nombre in recursos.paquetes for url in urls_paquete(nombre)] + list(RECURSOS_CDN)
+    paginas = [url_for(endpoint) for endpoint in ('index', 'calendario', 'reservas', 'mensajes')]
+    version = hashlib.sha256(json.dumps([precache, paginas]).encode('utf-8')).hexdigest()[:12]
+    
+    respuesta = Response(
+        renderizar('sw.js', version=version, precache=precache, paginas=paginas),
+        mimetype='text/javascript'
+    )
+    respuesta.cache_control.no_cache = True
+    return respuesta
+
+
+@app.route('/media/<sha256>')
+@login_required
+def servir_media(sha256):
+    """Archivo multimedia original desde la caché local"""
+    return respuesta_media(sha256)
+
+
+@app.route('/media/<sha256>/miniatura')
+@login_required
+def servir_miniatura(sha256):
+    """Miniatura JPEG de una imagen de la caché local"""
+    return respuesta_media(sha256, miniatura=True)
+
+
+@app.route('/api/eventos')
+@login_required
+def stream_eventos():
+    """
+    Canal Server-Sent Events con avisos de mensajes nuevos
+    
+    La conexión se cierra tras EVENTOS_DURACION_MAX segundos para liberar
+    el worker; EventSource reconecta automáticamente. Con EVENTOS_CONEXIONES_MAX
+    conexiones abiertas en el proceso responde 503 y el navegador sigue con el polling.
+    """
+    if not conexiones_eventos.acquire(blocking=False):
+        return jsonify({'error': 'Demasiadas conexiones de eventos'}), 503, {'Retry-After': '60'}
+    
+    def generar():
+        cola = bus_eventos.suscribir()
+        try:
+            yield 'retry: 3000\n\n'
+            limite = time.monotonic() + EVENTOS_DURACION_MAX
+            while time.monotonic() < limite:
+                try:
+                    evento = cola.get(timeout=min(EVENTOS_KEEPALIVE, max(limite - time.monotonic(), 0.1)))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield formato_sse(evento)
+        finally:
+            bus_eventos.cancelar(cola)
+    
+    respuesta = Response(generar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Se llama al cerrar la respuesta, también si el cliente se desconecta antes de empezar
+    respuesta.call_on_close(conexiones_eventos.release)
+    return respuesta
+
+
+@app.route('/metrics')
+def exponer_metricas():
+    """
+    Métricas de rendimiento de este proceso en formato Prometheus
+    Para un usuario con sesión iniciada o con el token de METRICAS_TOKEN
+    """
+    autorizacion = request.headers.get('Authorization', '')
+    con_token = bool(METRICAS_TOKEN) and hmac.compare_digest(
+        autorizacion.encode(), f'Bearer {METRICAS_TOKEN}'.encode()
+    )
+    if not con_token and not current_user.is_authenticated:
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    return Response(metricas.exponer(), content_type=metricas.TIPO_CONTENIDO)
+
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
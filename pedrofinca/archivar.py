@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Archivar los mensajes antiguos de WhatsApp
+
+Mueve los mensajes con más de ARCHIVO_DIAS días a bloques comprimidos
+(tabla bloque_mensajes) y los borra de la tabla mensaje, que se queda con
+los recientes. Los ARCHIVO_CONSERVAR últimos mensajes de cada conversación
+nunca se archivan. Se puede ejecutar con la aplicación en marcha, por
+ejemplo cada noche desde cron.
+
+Uso:
+    python archivar.py [--dias 180] [--conservar 50] [--lote 2000]
+    python archivar.py --simular    contar las conversaciones afectadas sin cambiar nada
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Agregar el directorio actual al path para importar app
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import (app, db, ARCHIVO_CONSERVAR, ARCHIVO_DIAS, ARCHIVO_LOTE,
+                 archivar_conversacion, conversaciones_archivables)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archivar los mensajes antiguos')
+    parser.add_argument('--dias', type=int, default=ARCHIVO_DIAS, help='antigüedad mínima en días')
+    parser.add_argument('--conservar', type=int, default=ARCHIVO_CONSERVAR,
+                        help='mensajes recientes de cada conversación que no se archivan')
+    parser.add_argument('--lote', type=int, default=ARCHIVO_LOTE, help='mensajes por transacción')
+    parser.add_argument('--simular', action='store_true', help='no archivar, solo contar')
+    args = parser.parse_args()
+
+    if args.conservar < 1:
+        print("❌ --conservar tiene que ser al menos 1")
+        sys.exit(1)
+
+    limite_fecha = datetime.utcnow() - timedelta(days=args.dias)
+
+    with app.app_context():
+        telefonos = conversaciones_archivables(limite_fecha, args.conservar)
+        print(f"📦 {len(telefonos)} conversaciones con mensajes anteriores al {limite_fecha:%d/%m/%Y}")
+        if args.simular:
+            sys.exit(0)
+
+        inicio = time.monotonic()
+        total = 0
+        for telefono in telefonos:
+            try:
+                total += archivar_conversacion(telefono, limite_fecha, args.conservar, args.lote)
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Error al archivar {telefono}: {str(e)}")
+                print("   Los lotes ya archivados se conservan; vuelve a ejecutar el script para continuar")
+                sys.exit(1)
+
+        print(f"✅ {total} mensajes archivados en {time.monotonic() - inicio:.1f} s")
@@ -0,0 +1,64 @@
+"""
+Compresión de los mensajes antiguos en bloques
+
+Los mensajes de una conversación se guardan por bloques (un mes como
+mucho y un número máximo de mensajes) en JSON por columnas comprimido
+con zlib: los nombres de los campos aparecen una sola vez y el texto
+repetido de las plantillas comprime bien.
+"""
+
+import json
+import zlib
+from datetime import datetime
+
+# Campos de Mensaje que se guardan (todos, para poder restaurarlos)
+CAMPOS = (
+    'id', 'reserva_id', 'telefono_destino', 'telefono_origen', 'contenido', 'tipo', 'direccion',
+    'estado', 'twilio_sid', 'num_media', 'media_urls', 'media_types', 'enviado_at', 'user_id',
+    'telefono_norm', 'intentos', 'proximo_intento_at', 'error_envio', 'difusion_id',
+)
+CAMPOS_FECHA = ('enviado_at', 'proximo_intento_at')
+NIVEL_COMPRESION = 6
+
+
+def _valor(fila, campo):
+    valor = getattr(fila, campo)
+    if campo in CAMPOS_FECHA and valor is not None:
+        return valor.isoformat()
+    return valor
+
+
+def comprimir(filas):
+    """Filas de mensaje (en orden cronológico) a bytes comprimidos"""
+    datos = {'campos': CAMPOS, 'filas': [[_valor(fila, campo) for campo in CAMPOS] for fila in filas]}
+    return zlib.compress(json.dumps(datos, separators=(',', ':')).encode('utf-8'), NIVEL_COMPRESION)
+
+
+def descomprimir(datos):
+    """Bytes comprimidos a una lista de diccionarios con los campos del mensaje"""
+    contenido = json.loads(zlib.decompress(datos))
+    mensajes = []
+    for fila in contenido['filas']:
+        mensaje = dict(zip(contenido['campos'], fila))
+        for campo in CAMPOS_FECHA:
+            if mensaje.get(campo):
+                mensaje[campo] = datetime.fromisoformat(mensaje[campo])
+        mensajes.append(mensaje)
+    return mensajes
+
+
+def agrupar_en_bloques(filas, max_por_bloque):
+    """
+    Repartir las filas de una conversación (en orden cronológico) en bloques
+    Cada bloque contiene mensajes de un solo mes y como mucho max_por_bloque
+    """
+    bloque = []
+    for fila in filas:
+        if bloque and (len(bloque) >= max_por_bloque or
+                       (fila.enviado_at.year, fila.enviado_at.month) !=
+                       (bloque[0].enviado_at.year, bloque[0].enviado_at.month)):
+            yield bloque
+            bloque = []
+        bloque.append(fila)
+    if bloque:
+        yield bloque
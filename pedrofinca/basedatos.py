@@ -0,0 +1,83 @@
+"""
+Configuración del motor de base de datos según DATABASE_URL
+
+Con SQLite (por defecto) cada conexión nueva se ajusta con PRAGMAs para
+que lecturas y escrituras de varios workers de gunicorn convivan: modo WAL
+(los lectores no bloquean al escritor ni al revés), synchronous=NORMAL y un
+busy_timeout para esperar al bloqueo en lugar de fallar con "database is
+locked". Con PostgreSQL (o SQL Server) solo se ajusta el pool.
+"""
+
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+# Ajustes de SQLite (se aplican a cada conexión)
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 15000))  # milisegundos
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+SQLITE_CACHE_KB = int(os.environ.get('SQLITE_CACHE_KB', 20000))  # caché de páginas por conexión
+
+# Pool de conexiones
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # segundos
+
+
+def url_base_datos(url):
+    """
+    Normalizar DATABASE_URL
+    Muchos proveedores dan 'postgres://', que SQLAlchemy 2 ya no acepta
+    """
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def opciones_motor(url):
+    """Opciones de create_engine (SQLALCHEMY_ENGINE_OPTIONS) según el motor"""
+    url = make_url(url)
+
+    if url.get_backend_name() == 'sqlite':
+        if not url.database or url.database == ':memory:':
+            # Base de datos en memoria: una sola conexión compartida, sin ajustes
+            return {}
+        return {
+            # Conexiones locales y baratas: un pool amplio evita esperas entre hilos
+            'pool_size': DB_POOL_SIZE * 2,
+            'max_overflow': DB_MAX_OVERFLOW * 2,
+            'connect_args': {
+                'timeout': SQLITE_BUSY_TIMEOUT / 1000,
+                'check_same_thread': False
+            }
+        }
+
+    # Servidores de base de datos: pool limitado y conexiones verificadas
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_pre_ping': True,
+        'pool_recycle': DB_POOL_RECYCLE
+    }
+
+
+def aplicar_pragmas_sqlite(conexion):
+    """Ajustar una conexión sqlite3 recién abierta"""
+    cursor = conexion.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+        cursor.execute(f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}')
+        cursor.execute(f'PRAGMA cache_size=-{SQLITE_CACHE_KB}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+    finally:
+        cursor.close()
+
+
+@event.listens_for(Engine, 'connect')
+def configurar_conexion(dbapi_connection, connection_record):
+    # Solo afecta a SQLite; el resto de motores no necesitan PRAGMAs
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        aplicar_pragmas_sqlite(dbapi_connection)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark del resumen de conversaciones (/api/mensajes/agrupados)
+
+Compara el algoritmo anterior (1 + 2N consultas) con la consulta única
+basada en funciones de ventana, sobre una base de datos temporal.
+
+Uso:
+    python benchmarks/bench_conversaciones.py [num_conversaciones]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, date, time as dtime
+
+# Base de datos temporal: debe configurarse antes de importar app
+_tmpdir = tempfile.mkdtemp(prefix='bench_finca_')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_tmpdir, "bench.db")}'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import app, db, Reserva, Mensaje, Contacto, TWILIO_WHATSAPP_NUMBER, consultar_resumen_conversaciones
+
+
+def poblar(num_conversaciones, mensajes_por_conversacion=3):
+    """Crear conversaciones sintéticas (una de cada cinco con reserva)"""
+    inicio = datetime(2024, 1, 1)
+    reservas = []
+    for i in range(0, num_conversaciones, 5):
+        reservas.append({
+            'cliente_nombre': f'Cliente {i}',
+            'cliente_telefono': f'6{i:08d}',
+            'telefono_norm': f'+346{i:08d}',
+            'fecha_evento': date(2025, 1, 1) + timedelta(days=i % 365),
+            'hora_inicio': dtime(12, 0),
+            'hora_fin': dtime(23, 0),
+            'estado': 'confirmada'
+        })
+    db.session.execute(db.insert(Reserva), reservas)
+    db.session.execute(db.insert(Contacto), [{
+        'telefono_norm': r['telefono_norm'],
+        'nombre': r['cliente_nombre'],
+        'reserva_id': n + 1
+    } for n, r in enumerate(reservas)])
+
+    mensajes = []
+    for i in range(num_conversaciones):
+        telefono_norm = f'+346{i:08d}'
+        telefono = f'whatsapp:{telefono_norm}'
+        reserva_id = i // 5 + 1 if i % 5 == 0 else None
+        for j in range(mensajes_por_conversacion):
+            entrante = j % 2 == 0
+            mensajes.append({
+                'reserva_id': reserva_id,
+                'telefono_origen': telefono if entrante else TWILIO_WHATSAPP_NUMBER,
+                'telefono_destino': TWILIO_WHATSAPP_NUMBER if entrante else telefono,
+                'contenido': f'Mensaje {j} de la conversación {i}',
+                'telefono_norm': telefono_norm,
+                'direccion': 'entrante' if entrante else 'saliente',
+                'estado': 'recibido' if entrante else 'enviado',
+                'num_media': 1 if j == 0 and i % 7 == 0 else 0,
+                'enviado_at': inicio + timedelta(minutes=i * mensajes_por_conversacion + j)
+            })
+    db.session.execute(db.insert(Mensaje), mensajes)
+    db.session.commit()
+
+
+def resumen_anterior():
+    """Algoritmo anterior: subconsulta agrupada + 2 consultas por teléfono"""
+    subquery = db.session.query(
+        db.func.coalesce(Mensaje.telefono_origen, Mensaje.telefono_destino).label('telefono'),
+        db.func.max(Mensaje.enviado_at).label('ultima_fecha')
+    ).group_by('telefono').subquery()
+
+    resultado = []
+    for row in db.session.query(subquery).all():
+        telefono = row.telefono
+        if not telefono or telefono == TWILIO_WHATSAPP_NUMBER:
+            continue
+        ultimo_mensaje = Mensaje.query.filter(
+            db.or_(
+                Mensaje.telefono_origen == telefono,
+                Mensaje.telefono_destino == telefono
+            )
+        ).order_by(Mensaje.enviado_at.desc()).first()
+        telefono_limpio = telefono.replace('whatsapp:', '').replace('+', '')
+        reserva = Reserva.query.filter(
+            Reserva.cliente_telefono.contains(telefono_limpio[-9:])
+        ).first()
+        resultado.append((telefono, ultimo_mensaje.id, reserva.cliente_nombre if reserva else None))
+    return resultado
+
+
+def medir(nombre, funcion):
+    """Ejecutar la función contando consultas SQL y tiempo total"""
+    consultas = {'total': 0}
+
+    def contar(*args):
+        consultas['total'] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', contar)
+    db.session.expire_all()
+    inicio = time.perf_counter()
+    filas = funcion()
+    duracion = (time.perf_counter() - inicio) * 1000
+    event.remove(db.engine, 'before_cursor_execute', contar)
+
+    print(f"   {nombre:<22} {len(filas):>7} conversaciones  {consultas['total']:>7} consultas  {duracion:>10.1f} ms")
+
+
+def main():
+    num_conversaciones = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    with app.app_context():
+        db.create_all()
+        print(f"📦 Generando {num_conversaciones} conversaciones en {_tmpdir}...")
+        poblar(num_conversaciones)
+
+        print("\n⏱️  Resultados:")
+        medir('consulta única', consultar_resumen_conversaciones)
+        medir('algoritmo anterior', resumen_anterior)
+
+
+if __name__ == '__main__':
+    main()
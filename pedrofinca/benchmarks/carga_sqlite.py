@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de lecturas y escrituras concurrentes sobre SQLite
+
+Simula varios workers de gunicorn: unos procesos escriben mensajes uno a
+uno (como el webhook) y otros leen el resumen de conversaciones (como el
+panel). Se ejecuta dos veces sobre una copia nueva de la base de datos:
+
+    por_defecto  create_engine(url) sin ajustes (journal DELETE)
+    ajustado     opciones y PRAGMAs de basedatos.py (WAL, busy_timeout...)
+
+Uso:
+    python benchmarks/carga_sqlite.py [--escritores 4] [--lectores 8] [--segundos 10] [--filas 20000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CONSULTA_LECTURA = (
+    'SELECT telefono, COUNT(*), MAX(enviado_at) FROM mensaje '
+    'GROUP BY telefono ORDER BY 3 DESC LIMIT 50'
+)
+
+
+def crear_base(ruta, filas):
+    """Crear la base de datos de prueba con `filas` mensajes"""
+    conexion = sqlite3.connect(ruta)
+    conexion.execute(
+        'CREATE TABLE mensaje (id INTEGER PRIMARY KEY, telefono TEXT, '
+        'contenido TEXT, enviado_at TEXT)'
+    )
+    conexion.execute('CREATE INDEX ix_mensaje_telefono ON mensaje (telefono, enviado_at)')
+    inicio = datetime(2026, 1, 1)
+    conexion.executemany(
+        'INSERT INTO mensaje (telefono, contenido, enviado_at) VALUES (?, ?, ?)',
+        [(
+            f'+34600{random.randint(0, 999):06d}',
+            'Hola, quería información sobre la finca ' * 3,
+            (inicio + timedelta(minutes=i)).isoformat(' ')
+        ) for i in range(filas)]
+    )
+    conexion.commit()
+    conexion.close()
+
+
+def crear_motor(url, modo):
+    from sqlalchemy import create_engine
+
+    if modo == 'ajustado':
+        # Registra los PRAGMAs en cada conexión nueva
+        from basedatos import opciones_motor
+        return create_engine(url, **opciones_motor(url))
+    return create_engine(url)
+
+
+def trabajador(modo, rol, url, segundos, resultados):
+    """Ejecutar operaciones durante `segundos` y devolver latencias y errores"""
+    from sqlalchemy import text
+
+    motor = crear_motor(url, modo)
+    latencias = []
+    errores = 0
+    limite = time.monotonic() + segundos
+
+    while time.monotonic() < limite:
+        inicio = time.perf_counter()
+        try:
+            with motor.connect() as conn:
+                if rol == 'escritor':
+                    conn.execute(text(
+                        'INSERT INTO mensaje (telefono, contenido, enviado_at) VALUES (:t, :c, :f)'
+                    ), {'t': f'+34600{random.randint(0, 999):06d}', 'c': 'Mensaje entrante', 'f': datetime.utcnow().isoformat(' ')})
+                    conn.commit()
+                else:
+                    conn.execute(text(CONSULTA_LECTURA)).fetchall()
+            latencias.append(time.perf_counter() - inicio)
+        except Exception as e:
+            if 'locked' not in str(e):
+                raise
+            errores += 1
+
+    motor.dispose()
+    resultados.put((rol, latencias, errores))
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def ejecutar(modo, plantilla, args):
+    directorio = tempfile.mkdtemp()
+    ruta = os.path.join(directorio, 'carga.db')
+    shutil.copy(plantilla, ruta)
+    url = f'sqlite:///{ruta}'
+
+    contexto = multiprocessing.get_context('spawn')
+    resultados = contexto.Queue()
+    procesos = [
+        contexto.Process(target=trabajador, args=(modo, rol, url, args.segundos, resultados))
+        for rol in ['escritor'] * args.escritores + ['lector'] * args.lectores
+    ]
+    for proceso in procesos:
+        proceso.start()
+    datos = [resultados.get() for _ in procesos]
+    for proceso in procesos:
+        proceso.join()
+    shutil.rmtree(directorio)
+
+    print(f"\n📊 {modo}")
+    for rol in ('escritor', 'lector'):
+        latencias = [l for r, ls, _ in datos if r == rol for l in ls]
+        errores = sum(e for r, _, e in datos if r == rol)
+        print(
+            f"   {rol + 'es':<11} {len(latencias) / args.segundos:8.1f} op/s   "
+            f"p50 {percentil(latencias, 0.5) * 1000:7.1f} ms   "
+            f"p99 {percentil(latencias, 0.99) * 1000:8.1f} ms   "
+            f"'database is locked': {errores}"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Carga concurrente sobre SQLite')
+    parser.add_argument('--escritores', type=int, default=4)
+    parser.add_argument('--lectores', type=int, default=8)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--filas', type=int, default=20000)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    plantilla = os.path.join(directorio, 'plantilla.db')
+    print(f"🔧 Creando base de datos de prueba con {args.filas} mensajes...")
+    crear_base(plantilla, args.filas)
+    print(f"🚀 {args.escritores} escritores y {args.lectores} lectores durante {args.segundos:g} s")
+
+    for modo in ('por_defecto', 'ajustado'):
+        ejecutar(modo, plantilla, args)
+    shutil.rmtree(directorio)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Generador de datos sintéticos reproducibles (usuarios, reservas y mensajes)
+
+Con la misma semilla genera siempre los mismos datos, así que las
+mediciones de distintas versiones del código son comparables. Los
+mensajes se reparten entre los teléfonos con una distribución sesgada
+(unos pocos clientes con conversaciones muy largas) y una parte lleva
+archivos multimedia.
+
+Inserta directamente con executemany por bloques (sin eventos del ORM)
+y calcula los campos derivados (telefono_norm, inicio_at, fin_at,
+contactos) con las mismas funciones que la aplicación.
+
+Uso:
+    DATABASE_URL=sqlite:////tmp/finca_bench.db python benchmarks/datos_sinteticos.py \\
+        [--semilla 42] [--reservas 5000] [--mensajes 200000] [--telefonos 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, time as hora, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NOMBRES = ['Ana', 'Luis', 'María', 'Javier', 'Carmen', 'Pedro', 'Lucía', 'Sergio', 'Elena', 'Pablo']
+APELLIDOS = ['García', 'López', 'Martínez', 'Sánchez', 'Pérez', 'Gómez', 'Ruiz', 'Díaz', 'Moreno', 'Romero']
+TIPOS = ['boda', 'cumpleaños', 'comunión', 'bautizo', 'empresa', 'otro', None]
+ESTADOS = ['confirmada'] * 6 + ['pendiente'] * 3 + ['cancelada']
+TEXTOS = [
+    'Hola, quería información sobre la finca',
+    '¿Tenéis disponible el sábado?',
+    'Perfecto, muchas gracias',
+    'Os envío el justificante del anticipo',
+    '¿A qué hora podemos empezar a montar?',
+    'Somos unas 80 personas más o menos',
+]
+TIPOS_MEDIA = ['image/jpeg', 'image/png', 'application/pdf', 'audio/ogg']
+USUARIO_BENCHMARK = ('benchmark', 'benchmark@finca.local', 'benchmark')
+BLOQUE = 5000
+
+
+def bloques(filas, tamano=BLOQUE):
+    for i in range(0, len(filas), tamano):
+        yield filas[i:i + tamano]
+
+
+def generar(conn, semilla=42, num_reservas=5000, num_mensajes=200000, num_telefonos=2000,
+            proporcion_media=0.05):
+    """
+    Insertar los datos con una conexión de SQLAlchemy (dentro del contexto de la app)
+    Devuelve los teléfonos normalizados ordenados de más a menos mensajes
+    """
+    from werkzeug.security import generate_password_hash
+    from app import (User, Reserva, Mensaje, Contacto, VersionTabla, TWILIO_WHATSAPP_NUMBER,
+                     intervalo_reserva, normalizar_telefono)
+
+    rng = random.Random(semilla)
+    ahora = datetime(2026, 6, 1)
+
+    # Usuarios
+    conn.execute(User.__table__.insert(), [{
+        'id': 1,
+        'username': USUARIO_BENCHMARK[0],
+        'email': USUARIO_BENCHMARK[1],
+        'password_hash': generate_password_hash(USUARIO_BENCHMARK[2]),
+        'is_admin': True,
+        'created_at': ahora
+    }] + [{
+        'id': i,
+        'username': f'usuario{i}',
+        'email': f'usuario{i}@finca.local',
+        'password_hash': 'sin-acceso',
+        'is_admin': False,
+        'created_at': ahora
+    } for i in range(2, 4)])
+
+    # Teléfonos de clientes con su nombre
+    telefonos = []
+    for i in range(num_telefonos):
+        original = f'6{rng.randint(0, 99999999):08d}'
+        nombre = f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}'
+        telefonos.append((original, normalizar_telefono(original), nombre))
+
+    # Reservas repartidas en tres años alrededor de hoy
+    reservas = []
+    reserva_por_telefono = {}
+    contactos = {}
+    primer_dia = date(2025, 1, 1)
+    for reserva_id in range(1, num_reservas + 1):
+        original, telefono_norm, nombre = rng.choice(telefonos)
+        fecha = primer_dia + timedelta(days=rng.randint(0, 3 * 365))
+        hora_inicio = hora(rng.choice([10, 12, 13, 17, 19, 20]))
+        hora_fin = hora((hora_inicio.hour + rng.choice([4, 5, 6, 8])) % 24)
+        inicio_at, fin_at = intervalo_reserva(fecha, hora_inicio, hora_fin)
+        precio = rng.choice([800, 1200, 1500, 2000, 3000])
+        reservas.append({
+            'id': reserva_id,
+            'cliente_nombre': nombre,
+            'cliente_telefono': original,
+            'cliente_email': None,
+            'fecha_evento': fecha,
+            'hora_inicio': hora_inicio,
+            'hora_fin': hora_fin,
+            'num_invitados': rng.randint(20, 250),
+            'tipo_celebracion': rng.choice(TIPOS),
+            'precio': precio,
+            'anticipo': rng.choice([0, precio * 0.2, precio * 0.5]),
+            'estado': rng.choice(ESTADOS),
+            'notas': None,
+            'created_at': ahora - timedelta(days=rng.randint(0, 700)),
+            'updated_at': ahora,
+            'user_id': rng.randint(1, 3),
+            'telefono_norm': telefono_norm,
+            'inicio_at': inicio_at,
+            'fin_at': fin_at
+        })
+        reserva_por_telefono[telefono_norm] = reserva_id
+        contactos[telefono_norm] = {
+            'telefono_norm': telefono_norm, 'nombre': nombre, 'reserva_id': reserva_id, 'updated_at': ahora
+        }
+
+    for bloque in bloques(reservas):
+        conn.execute(Reserva.__table__.insert(), bloque)
+    if contactos:
+        conn.execute(Contacto.__table__.insert(), list(contactos.values()))
+    conn.execute(VersionTabla.__table__.insert(), [{'tabla': 'reserva', 'version': 1}])
+
+    # Mensajes: distribución sesgada (el teléfono i tiene peso 1 / (i + 1))
+    pesos = [1 / (i + 1) for i in range(len(telefonos))]
+    elegidos = rng.choices(telefonos, weights=pesos, k=num_mensajes)
+    inicio_mensajes = ahora - timedelta(days=730)
+    paso = timedelta(days=730) / max(num_mensajes, 1)
+    mensajes = []
+    totales = {}
+    for mensaje_id, (original, telefono_norm, nombre) in enumerate(elegidos, start=1):
+        entrante = rng.random() < 0.5
+        cliente = f'whatsapp:{telefono_norm}'
+        num_media = rng.randint(1, 3) if rng.random() < proporcion_media else 0
+        media_urls = media_types = None
+        if num_media:
+            media_urls = json.dumps([
+                f'https://api.twilio.com/2010-04-01/Accounts/ACbench/Messages/MM{mensaje_id:010d}/Media/ME{n}'
+                for n in range(num_media)
+            ])
+            media_types = json.dumps([rng.choice(TIPOS_MEDIA) for _ in range(num_media)])
+        mensajes.append({
+            'id': mensaje_id,
+            'reserva_id': reserva_por_telefono.get(telefono_norm),
+            'telefono_destino': TWILIO_WHATSAPP_NUMBER if entrante else cliente,
+            'telefono_origen': cliente if entrante else TWILIO_WHATSAPP_NUMBER,
+            'contenido': rng.choice(TEXTOS),
+            'tipo': 'whatsapp',
+            'direccion': 'entrante' if entrante else 'saliente',
+            'estado': 'recibido' if entrante else 'enviado',
+            'twilio_sid': f'SM{rng.getrandbits(128):032x}',
+            'num_media': num_media,
+            'media_urls': media_urls,
+            'media_types': media_types,
+            'enviado_at': inicio_mensajes + paso * mensaje_id,
+            'user_id': None if entrante else 1,
+            'telefono_norm': telefono_norm,
+            'intentos': 0 if entrante else 1
+        })
+        totales[telefono_norm] = totales.get(telefono_norm, 0) + 1
+
+        if len(mensajes) == BLOQUE:
+            conn.execute(Mensaje.__table__.insert(), mensajes)
+            mensajes = []
+    if mensajes:
+        conn.execute(Mensaje.__table__.insert(), mensajes)
+
+    conn.commit()
+    return sorted(totales, key=totales.get, reverse=True)
+
+
+def tablas_vacias(conn):
+    from sqlalchemy import text
+    return all(
+        conn.execute(text(f'SELECT COUNT(*) FROM {tabla}')).scalar() == 0
+        for tabla in ('user', 'reserva', 'mensaje')
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generar datos sintéticos reproducibles')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--reservas', type=int, default=5000)
+    parser.add_argument('--mensajes', type=int, default=200000)
+    parser.add_argument('--telefonos', type=int, default=2000)
+    parser.add_argument('--media', type=float, default=0.05, help='proporción de mensajes con multimedia')
+    args = parser.parse_args()
+
+    from app import app, db
+
+    with app.app_context():
+        db.create_all()
+        with db.engine.connect() as conn:
+            if not tablas_vacias(conn):
+                print("❌ La base de datos ya tiene datos; usa una vacía (DATABASE_URL)")
+                sys.exit(1)
+
+            print(f"🔧 Generando {args.reservas} reservas y {args.mensajes} mensajes (semilla {args.semilla})...")
+            inicio = time.monotonic()
+            telefonos = generar(conn, args.semilla, args.reservas, args.mensajes, args.telefonos, args.media)
+            print(f"✅ Datos generados en {time.monotonic() - inicio:.1f} s")
+            print(f"   Usuario: {USUARIO_BENCHMARK[0]} / {USUARIO_BENCHMARK[2]}")
+            print(f"   Conversación más larga: {telefonos[0]}")
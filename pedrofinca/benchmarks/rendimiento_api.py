@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los endpoints principales con el cliente de pruebas de Flask
+
+Genera una base de datos sintética (benchmarks/datos_sinteticos.py) y
+mide cada escenario: latencia p50/p99 y número de consultas SQL por
+petición (leído de la cabecera Server-Timing). Twilio no se usa: sin
+credenciales la cola de envío no arranca, y los hilos en segundo plano
+(webhook, multimedia) se desactivan para que las mediciones sean estables.
+
+Guarda los resultados con --guardar y compáralos en el siguiente despliegue
+con --comparar: el script termina con código 1 si el p99 empeora más de la
+tolerancia o si algún escenario hace más consultas SQL que antes.
+
+Uso:
+    python benchmarks/rendimiento_api.py [--reservas 5000] [--mensajes 200000] [--repeticiones 50]
+    python benchmarks/rendimiento_api.py --guardar benchmarks/referencia.json
+    python benchmarks/rendimiento_api.py --comparar benchmarks/referencia.json [--tolerancia 0.25] [--margen-ms 5]
+    python benchmarks/rendimiento_api.py --base /tmp/finca_bench.db   # reutilizar datos ya generados
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def configurar_entorno(ruta_base):
+    """Variables de entorno antes de importar la aplicación"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_base}'
+    os.environ['METRICAS_CABECERA'] = '1'
+    os.environ['SQL_LENTA_MS'] = '60000'  # el benchmark ya mide las latencias
+    os.environ['TWILIO_ACCOUNT_SID'] = ''
+    os.environ['TWILIO_AUTH_TOKEN'] = ''
+    os.environ['WEBHOOK_VALIDAR_FIRMA'] = '0'  # las peticiones del benchmark no van firmadas
+    os.environ['PROCESADOR_WEBHOOK_ACTIVO'] = '0'
+    os.environ['MEDIA_ACTIVO'] = '0'
+    os.environ['COLA_ENVIO_ACTIVA'] = '0'
+
+
+def consultas_sql(respuesta):
+    coincidencia = re.search(r'desc="(\d+) consultas"', respuesta.headers.get('Server-Timing', ''))
+    return int(coincidencia.group(1)) if coincidencia else 0
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def escenarios(rng, telefonos):
+    """Escenarios como (nombre, función que hace una petición con el cliente)"""
+    largos = telefonos[:20]
+
+    def calendario(cliente):
+        anio, mes = rng.choice([2025, 2026, 2027]), rng.randint(1, 12)
+        fin = f'{anio + 1}-01-01' if mes == 12 else f'{anio}-{mes + 1:02d}-01'
+        return cliente.get(f'/api/reservas?start={anio}-{mes:02d}-01&end={fin}')
+
+    def listado_reservas(cliente):
+        return cliente.get('/reservas?formato=json')
+
+    def conversaciones(cliente):
+        return cliente.get('/api/mensajes/agrupados')
+
+    def conversacion(cliente):
+        return cliente.get(f'/api/conversacion/{rng.choice(largos)}')
+
+    def busqueda(cliente):
+        texto = rng.choice(['finca', 'disponible sabado', 'justificante', 'garcia boda', 'hora montar'])
+        return cliente.get(f'/api/buscar?q={texto}')
+
+    def webhook(cliente):
+        datos = {
+            'MessageSid': f'SM{uuid.UUID(int=rng.getrandbits(128)).hex}',
+            'From': f'whatsapp:{rng.choice(telefonos)}',
+            'To': 'whatsapp:+14155238886',
+            'Body': 'Hola, ¿tenéis disponible el sábado?',
+            'NumMedia': '0'
+        }
+        if rng.random() < 0.1:
+            datos.update({
+                'NumMedia': '1',
+                'MediaUrl0': f'https://api.twilio.com/2010-04-01/Accounts/ACbench/Messages/{datos["MessageSid"]}/Media/ME0',
+                'MediaContentType0': 'image/jpeg'
+            })
+        return cliente.post('/api/whatsapp/webhook', data=datos)
+
+    return [
+        ('calendario', calendario),
+        ('listado_reservas', listado_reservas),
+        ('conversaciones', conversaciones),
+        ('conversacion', conversacion),
+        ('busqueda', busqueda),
+        ('webhook', webhook),
+    ]
+
+
+def medir(cliente, peticion, repeticiones, calentamiento=3):
+    for _ in range(calentamiento):
+        peticion(cliente)
+
+    latencias = []
+    consultas = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        respuesta = peticion(cliente)
+        latencias.append(time.perf_counter() - inicio)
+        if respuesta.status_code >= 400:
+            raise RuntimeError(f'Respuesta {respuesta.status_code}: {respuesta.get_data(as_text=True)[:200]}')
+        consultas.append(consultas_sql(respuesta))
+
+    return {
+        'p50_ms': round(percentil(latencias, 0.5) * 1000, 2),
+        'p99_ms': round(percentil(latencias, 0.99) * 1000, 2),
+        'consultas_media': round(sum(consultas) / len(consultas), 2),
+        'consultas_max': max(consultas)
+    }
+
+
+def comparar(resultados, referencia, tolerancia, margen_ms):
+    """
+    Lista de regresiones respecto a una ejecución anterior
+    El p99 tiene que empeorar más de la tolerancia y más de margen_ms (ruido en endpoints rápidos)
+    """
+    regresiones = []
+    for nombre, actual in resultados.items():
+        anterior = referencia.get(nombre)
+        if not anterior:
+            continue
+        limite = max(anterior['p99_ms'] * (1 + tolerancia), anterior['p99_ms'] + margen_ms)
+        if actual['p99_ms'] > limite:
+            regresiones.append(f"{nombre}: p99 {anterior['p99_ms']} ms → {actual['p99_ms']} ms")
+        if actual['consultas_max'] > anterior['consultas_max']:
+            regresiones.append(f"{nombre}: consultas SQL {anterior['consultas_max']} → {actual['consultas_max']}")
+    return regresiones
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de los endpoints principales')
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--reservas', type=int, default=5000)
+    parser.add_argument('--mensajes', type=int, default=200000)
+    parser.add_argument('--telefonos', type=int, default=2000)
+    parser.add_argument('--repeticiones', type=int, default=50)
+    parser.add_argument('--base', help='base de datos ya generada (se trabaja sobre una copia)')
+    parser.add_argument('--guardar', help='guardar los resultados en un JSON')
+    parser.add_argument('--comparar', help='JSON de una ejecución anterior')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='empeoramiento admitido del p99')
+    parser.add_argument('--margen-ms', type=float, default=5, help='empeoramiento mínimo del p99 en ms')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp()
+    ruta_base = os.path.join(directorio, 'bench.db')
+    if args.base:
+        shutil.copy(args.base, ruta_base)
+    configurar_entorno(ruta_base)
+
+    from app import app, db, Mensaje
+    from datos_sinteticos import USUARIO_BENCHMARK, generar
+
+    with app.app_context():
+        db.create_all()
+        with db.engine.connect() as conn:
+            if args.base:
+                telefonos = [t for (t,) in db.session.query(Mensaje.telefono_norm).group_by(
+                    Mensaje.telefono_norm).order_by(db.func.count().desc())]
+            else:
+                print(f"🔧 Generando {args.reservas} reservas y {args.mensajes} mensajes (semilla {args.semilla})...")
+                inicio = time.monotonic()
+                telefonos = generar(conn, args.semilla, args.reservas, args.mensajes, args.telefonos)
+                print(f"✅ Datos generados en {time.monotonic() - inicio:.1f} s")
+
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': USUARIO_BENCHMARK[0], 'password': USUARIO_BENCHMARK[2]})
+
+    rng = random.Random(args.semilla)
+    resultados = {}
+    print(f"\n{'escenario':<18} {'p50 ms':>9} {'p99 ms':>9} {'SQL media':>10} {'SQL máx':>8}")
+    for nombre, peticion in escenarios(rng, telefonos):
+        resultado = medir(cliente, peticion, args.repeticiones)
+        resultados[nombre] = resultado
+        print(f"{nombre:<18} {resultado['p50_ms']:>9.2f} {resultado['p99_ms']:>9.2f} "
+              f"{resultado['consultas_media']:>10.2f} {resultado['consultas_max']:>8}")
+
+    shutil.rmtree(directorio)
+
+    if args.guardar:
+        with open(args.guardar, 'w') as f:
+            json.dump(resultados, f, indent=2)
+        print(f"\n💾 Resultados guardados en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia, args.margen_ms)
+        if regresiones:
+            print("\n❌ Regresiones detectadas:")
+            for regresion in regresiones:
+                print(f"   {regresion}")
+            sys.exit(1)
+        print("\n✅ Sin regresiones respecto a la referencia")
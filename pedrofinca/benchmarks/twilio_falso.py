@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Servidor Twilio falso para probar la cola de envío sin enviar mensajes reales
+
+Responde a POST /2010-04-01/Accounts/<sid>/Messages.json como la API REST
+de Twilio, con latencia y tasa de errores configurables.
+
+Uso:
+    python benchmarks/twilio_falso.py [--puerto 8099] [--latencia 0.2] [--errores 0.1]
+
+Y arrancar la aplicación con:
+    TWILIO_ACCOUNT_SID=AC_test TWILIO_AUTH_TOKEN=test TWILIO_API_URL=http://localhost:8099 python app.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class ManejadorTwilio(BaseHTTPRequestHandler):
+    latencia = 0.0
+    tasa_errores = 0.0
+    enviados = []
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        longitud = int(self.headers.get('Content-Length', 0))
+        datos = {k: v[0] for k, v in parse_qs(self.rfile.read(longitud).decode()).items()}
+
+        if self.latencia:
+            time.sleep(self.latencia)
+
+        if not self.path.endswith('/Messages.json'):
+            return self._responder(404, {'message': 'Recurso no encontrado'})
+
+        if random.random() < self.tasa_errores:
+            return self._responder(503, {'message': 'Servicio no disponible (simulado)'})
+
+        sid = f'SM{uuid.uuid4().hex}'
+        with self._lock:
+            self.enviados.append((sid, datos.get('To'), datos.get('Body')))
+        self._responder(201, {'sid': sid, 'status': 'queued', 'to': datos.get('To'), 'body': datos.get('Body')})
+
+    def _responder(self, codigo, cuerpo):
+        contenido = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+
+    def log_message(self, formato, *args):
+        print(f"📨 {self.address_string()} {formato % args}")
+
+
+def crear_servidor(puerto=8099, latencia=0.0, tasa_errores=0.0):
+    """Crear el servidor (sin arrancarlo) para usarlo desde otros scripts"""
+    ManejadorTwilio.latencia = latencia
+    ManejadorTwilio.tasa_errores = tasa_errores
+    return ThreadingHTTPServer(('127.0.0.1', puerto), ManejadorTwilio)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor Twilio falso')
+    parser.add_argument('--puerto', type=int, default=8099)
+    parser.add_argument('--latencia', type=float, default=0.0, help='segundos de espera por petición')
+    parser.add_argument('--errores', type=float, default=0.0, help='proporción de respuestas 503')
+    args = parser.parse_args()
+
+    servidor = crear_servidor(args.puerto, args.latencia, args.errores)
+    print(f"🚀 Twilio falso escuchando en http://127.0.0.1:{args.puerto}")
+    servidor.serve_forever()
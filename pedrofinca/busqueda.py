@@ -0,0 +1,158 @@
+"""
+Búsqueda de texto completo en mensajes y reservas
+
+SQLite: tablas virtuales FTS5 de contenido externo (mensaje_fts,
+reserva_fts) que guardan solo el índice, mantenidas por triggers. El
+tokenizador unicode61 con remove_diacritics hace que "cumpleanos"
+encuentre "cumpleaños".
+
+PostgreSQL: columna tsvector generada (se mantiene sola en cada INSERT o
+UPDATE, sin triggers) con un índice GIN.
+
+Los mensajes archivados (archivo_mensajes.py) salen de la tabla mensaje y
+sus bloques están comprimidos: se indexan aparte, en mensaje_archivado_fts,
+al archivarlos, con los datos que muestra un resultado.
+"""
+
+import re
+
+from markupsafe import escape
+from sqlalchemy import DateTime, bindparam, text
+
+# Marcadores de resaltado que no aparecen en el texto (se sustituyen tras escapar el HTML)
+INICIO_RESALTADO = '\x02'
+FIN_RESALTADO = '\x03'
+MAX_PALABRAS = 8
+
+# Columnas indexadas de cada tabla, por orden de importancia
+COLUMNAS_BUSQUEDA = {
+    'mensaje': ('contenido',),
+    'reserva': ('cliente_nombre', 'notas', 'tipo_celebracion'),
+}
+
+# Pesos de PostgreSQL por posición de la columna
+_PESOS = ('A', 'B', 'C', 'D')
+
+
+def _ddl_sqlite(tabla, columnas):
+    fts = f'{tabla}_fts'
+    lista = ', '.join(columnas)
+    nuevos = ', '.join(f'new.{c}' for c in columnas)
+    antiguos = ', '.join(f'old.{c}' for c in columnas)
+    insertar = f'INSERT INTO {fts}(rowid, {lista}) VALUES (new.id, {nuevos});'
+    borrar = f"INSERT INTO {fts}({fts}, rowid, {lista}) VALUES ('delete', old.id, {antiguos});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({lista}, content='{tabla}', "
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabla} BEGIN {insertar} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabla} BEGIN {borrar} END',
+        # Solo al cambiar las columnas indexadas (no en cada cambio de estado)
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {lista} ON {tabla} '
+        f'BEGIN {borrar} {insertar} END',
+    ]
+
+
+def _ddl_postgresql(tabla, columnas):
+    vector = ' || '.join(
+        f"setweight(to_tsvector('spanish', coalesce({c}, '')), '{_PESOS[i]}')"
+        for i, c in enumerate(columnas)
+    )
+    return [
+        f'ALTER TABLE {tabla} ADD COLUMN IF NOT EXISTS busqueda tsvector '
+        f'GENERATED ALWAYS AS ({vector}) STORED',
+        f'CREATE INDEX IF NOT EXISTS ix_{tabla}_busqueda ON {tabla} USING GIN (busqueda)',
+    ]
+
+
+def ddl_busqueda(tabla, dialecto):
+    """Sentencias que crean el índice de búsqueda de una tabla (idempotentes)"""
+    columnas = COLUMNAS_BUSQUEDA[tabla]
+    if dialecto == 'sqlite':
+        return _ddl_sqlite(tabla, columnas)
+    if dialecto == 'postgresql':
+        return _ddl_postgresql(tabla, columnas)
+    return []
+
+
+def sql_reconstruir(tabla, dialecto):
+    """Sentencia que indexa las filas existentes (None si el motor lo hace solo)"""
+    if dialecto == 'sqlite':
+        return f"INSERT INTO {tabla}_fts({tabla}_fts) VALUES ('rebuild')"
+    return None
+
+
+def palabras_busqueda(texto):
+    """Palabras del texto del usuario (sin operadores ni signos)"""
+    return re.findall(r'\w+', texto or '')[:MAX_PALABRAS]
+
+
+def expresion_busqueda(texto, dialecto):
+    """
+    Consulta para el motor: todas las palabras, cada una como prefijo
+    ("boda gar" encuentra "Boda de Ana García"). None si no hay palabras.
+    """
+    palabras = palabras_busqueda(texto)
+    if not palabras:
+        return None
+    if dialecto == 'postgresql':
+        return ' & '.join(f'{p}:*' for p in palabras)
+    return ' '.join(f'"{p}"*' for p in palabras)
+
+
+def resaltar(fragmento):
+    """Escapar el HTML del fragmento y marcar las coincidencias con <mark>"""
+    if not fragmento:
+        return ''
+    return str(escape(fragmento)).replace(INICIO_RESALTADO, '<mark>').replace(FIN_RESALTADO, '</mark>')
+
+
+# Índice del archivo: columnas de cada mensaje archivado (id es el del mensaje original)
+COLUMNAS_ARCHIVO = ('id', 'telefono_norm', 'direccion', 'enviado_at', 'contenido')
+
+SQL_INDEXAR_ARCHIVO = {
+    'sqlite': 'INSERT INTO mensaje_archivado_fts (rowid, telefono_norm, direccion, enviado_at, contenido) '
+              'VALUES (:id, :telefono_norm, :direccion, :enviado_at, :contenido)',
+    'postgresql': 'INSERT INTO mensaje_archivado_fts (id, telefono_norm, direccion, enviado_at, contenido) '
+                  'VALUES (:id, :telefono_norm, :direccion, :enviado_at, :contenido) ON CONFLICT (id) DO NOTHING',
+}
+
+SQL_DESINDEXAR_ARCHIVO = {
+    'sqlite': 'DELETE FROM mensaje_archivado_fts WHERE rowid IN :ids',
+    'postgresql': 'DELETE FROM mensaje_archivado_fts WHERE id IN :ids',
+}
+
+
+def ddl_busqueda_archivo(dialecto):
+    """Sentencias que crean el índice de los mensajes archivados (idempotentes)"""
+    if dialecto == 'sqlite':
+        return [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS mensaje_archivado_fts USING fts5(contenido, "
+            "telefono_norm UNINDEXED, direccion UNINDEXED, enviado_at UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2')",
+        ]
+    if dialecto == 'postgresql':
+        return [
+            'CREATE TABLE IF NOT EXISTS mensaje_archivado_fts (id INTEGER PRIMARY KEY, '
+            'telefono_norm VARCHAR(20), direccion VARCHAR(20), enviado_at TIMESTAMP, contenido TEXT, '
+            "busqueda tsvector GENERATED ALWAYS AS (to_tsvector('spanish', coalesce(contenido, ''))) STORED)",
+            'CREATE INDEX IF NOT EXISTS ix_mensaje_archivado_fts_busqueda '
+            'ON mensaje_archivado_fts USING GIN (busqueda)',
+        ]
+    return []
+
+
+def indexar_archivados(conn, mensajes):
+    """Añadir al índice los mensajes archivados (diccionarios con los campos del mensaje)"""
+    sql = SQL_INDEXAR_ARCHIVO.get(conn.dialect.name)
+    if sql and mensajes:
+        conn.execute(
+            text(sql).bindparams(bindparam('enviado_at', type_=DateTime)),
+            [{columna: mensaje.get(columna) for columna in COLUMNAS_ARCHIVO} for mensaje in mensajes]
+        )
+
+
+def desindexar_archivados(conn, ids):
+    """Quitar del índice los mensajes archivados con esos ids"""
+    sql = SQL_DESINDEXAR_ARCHIVO.get(conn.dialect.name)
+    if sql and ids:
+        conn.execute(text(sql).bindparams(bindparam('ids', expanding=True)), {'ids': list(ids)})
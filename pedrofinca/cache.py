@@ -0,0 +1,175 @@
+"""
+Caché de lectura de datos de la aplicación (contactos por teléfono, reservas por id)
+
+Los valores se leen a través de la caché: lo que no está se carga de la base
+de datos con una sola consulta y se guarda, también cuando no existe (None),
+para no repetir la búsqueda. La aplicación borra las claves al modificar los
+datos de origen.
+
+CacheMemoria es una LRU con caducidad propia de cada proceso. CacheRedis se
+comparte entre los workers de gunicorn, así que un cambio hecho en un worker
+se ve al momento en todos. Si Redis falla, los datos se leen de la base de
+datos: la caché nunca debe romper una petición.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheMemoria:
+    """LRU en memoria con caducidad, segura entre hilos"""
+
+    def __init__(self, max_elementos=10000, segundos=60, contador=None):
+        self.max_elementos = max_elementos
+        self.segundos = segundos
+        self.contador = contador  # Contador de metricas.py con etiquetas (espacio, resultado)
+        self._datos = OrderedDict()  # clave -> (expira, valor)
+        self._generacion = 0
+        self._lock = threading.Lock()
+
+    def leer(self, espacio, ids, cargar):
+        """
+        Valores de los ids de un espacio ('reserva', 'contacto'...), cargando solo los que faltan
+        cargar(ids_que_faltan) devuelve un diccionario id -> valor; los ids que no
+        devuelve se guardan como None. Los valores son compartidos: no modificarlos.
+        """
+        claves = {f'{espacio}:{i}': i for i in ids}
+        try:
+            generacion = self._generacion_actual()
+            encontrados = self._obtener(list(claves))
+        except Exception as e:
+            print(f"❌ Error al leer la caché: {str(e)}")
+            generacion, encontrados = None, {}
+
+        valores = {claves[clave]: valor for clave, valor in encontrados.items()}
+        faltan = [i for i in claves.values() if i not in valores]
+        self._contar(espacio, len(valores), len(faltan))
+        if not faltan:
+            return valores
+
+        cargados = cargar(faltan)
+        nuevos = {f'{espacio}:{i}': cargados.get(i) for i in faltan}
+        try:
+            self._guardar(nuevos, generacion)
+        except Exception as e:
+            print(f"❌ Error al guardar en la caché: {str(e)}")
+        for i in faltan:
+            valores[i] = cargados.get(i)
+        return valores
+
+    def leer_uno(self, espacio, id, cargar):
+        """Valor de un solo id; cargar(id) devuelve el valor o None"""
+        return self.leer(espacio, [id], lambda faltan: {id: cargar(id)})[id]
+
+    def invalidar(self, espacio, ids):
+        """Olvidar los valores de los ids (tras modificarlos en la base de datos)"""
+        try:
+            self._borrar([f'{espacio}:{i}' for i in ids])
+        except Exception as e:
+            print(f"❌ Error al invalidar la caché: {str(e)}")
+
+    def _contar(self, espacio, aciertos, fallos):
+        if self.contador is None:
+            return
+        if aciertos:
+            self.contador.inc(aciertos, espacio=espacio, resultado='acierto')
+        if fallos:
+            self.contador.inc(fallos, espacio=espacio, resultado='fallo')
+
+    def _generacion_actual(self):
+        return self._generacion
+
+    def _obtener(self, claves):
+        ahora = time.monotonic()
+        encontrados = {}
+        with self._lock:
+            for clave in claves:
+                entrada = self._datos.get(clave)
+                if entrada is None:
+                    continue
+                if entrada[0] < ahora:
+                    del self._datos[clave]
+                    continue
+                self._datos.move_to_end(clave)
+                encontrados[clave] = entrada[1]
+        return encontrados
+
+    def _guardar(self, valores, generacion):
+        with self._lock:
+            # Si se invalidó algo mientras se cargaba, los datos pueden estar obsoletos
+            if generacion != self._generacion:
+                return
+            expira = time.monotonic() + self.segundos
+            for clave, valor in valores.items():
+                self._datos[clave] = (expira, valor)
+                self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_elementos:
+                self._datos.popitem(last=False)
+
+    def _borrar(self, claves):
+        with self._lock:
+            self._generacion += 1
+            for clave in claves:
+                self._datos.pop(clave, None)
+
+
+class CacheRedis(CacheMemoria):
+    """
+    Caché compartida entre procesos (varios workers de gunicorn) a través de Redis
+
+    Como en CacheMemoria, un contador de generación (una clave más en Redis)
+    sube con cada invalidación, y lo cargado de la base de datos solo se
+    guarda si no ha cambiado desde la lectura: el guardado vigila la clave
+    con WATCH, así que ningún worker vuelve a guardar datos anteriores a un
+    cambio que otro worker acaba de invalidar.
+    """
+
+    def __init__(self, url, segundos=60, contador=None, prefijo='finca:cache:'):
+        import redis
+
+        super().__init__(segundos=segundos, contador=contador)
+        self._redis = redis.Redis.from_url(url, socket_timeout=1)
+        self._prefijo = prefijo
+        self._clave_generacion = prefijo + 'generacion'
+        self._error_watch = redis.WatchError
+
+    def _generacion_actual(self):
+        return int(self._redis.get(self._clave_generacion) or 0)
+
+    def _obtener(self, claves):
+        if not claves:
+            return {}
+        valores = self._redis.mget([self._prefijo + clave for clave in claves])
+        return {clave: json.loads(valor) for clave, valor in zip(claves, valores) if valor is not None}
+
+    def _guardar(self, valores, generacion):
+        # Sin generación (Redis falló al leer) no se sabe si los datos están al día
+        if generacion is None:
+            return
+        with self._redis.pipeline() as tuberia:
+            try:
+                tuberia.watch(self._clave_generacion)
+                if int(tuberia.get(self._clave_generacion) or 0) != generacion:
+                    return
+                tuberia.multi()
+                for clave, valor in valores.items():
+                    tuberia.set(self._prefijo + clave, json.dumps(valor), ex=self.segundos)
+                tuberia.execute()
+            except self._error_watch:
+                pass  # se invalidó algo mientras se guardaba
+
+    def _borrar(self, claves):
+        if claves:
+            tuberia = self._redis.pipeline()
+            tuberia.delete(*[self._prefijo + clave for clave in claves])
+            tuberia.incr(self._clave_generacion)
+            tuberia.execute()
+
+
+def crear_cache(backend='memoria', redis_url=None, max_elementos=10000, segundos=60, contador=None):
+    """Crear la caché según la configuración"""
+    if backend == 'redis':
+        return CacheRedis(redis_url or 'redis://localhost:6379/0', segundos, contador)
+    return CacheMemoria(max_elementos, segundos, contador)
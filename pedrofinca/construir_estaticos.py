@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Construir los paquetes de CSS y JS de las plantillas (static/dist)
+
+Une y minimiza los archivos de cada paquete (estaticos.PAQUETES), pone un
+hash del contenido en el nombre y escribe las versiones .gz y .br. Hay que
+ejecutarlo en cada despliegue: mientras un paquete no se reconstruya tras
+cambiar sus archivos, la aplicación sirve los originales.
+
+Para minimizar: pip install rcssmin rjsmin (sin ellos solo se une y comprime)
+Para la versión .br: pip install brotli
+
+Uso:
+    python construir_estaticos.py
+"""
+
+import os
+import sys
+
+# Agregar el directorio actual al path para importar estaticos
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from estaticos import ErrorPaquete, brotli, construir, rcssmin
+
+DIRECTORIO_STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+
+if __name__ == '__main__':
+    if rcssmin is None:
+        print("⚠️  rcssmin/rjsmin no instalados: los paquetes no se minimizan")
+    if brotli is None:
+        print("⚠️  brotli no instalado: solo se genera la versión .gz")
+
+    try:
+        resumen = construir(DIRECTORIO_STATIC)
+    except (ErrorPaquete, OSError) as e:
+        print(f"❌ {str(e)}")
+        sys.exit(1)
+
+    for nombre, archivo, original, minimizado, comprimido in resumen:
+        print(f"📦 {nombre:<18} {archivo:<30} {original / 1024:6.1f} KB → "
+              f"{minimizado / 1024:6.1f} KB ({comprimido / 1024:.1f} KB gzip)")
+    print(f"✅ {len(resumen)} paquetes en static/dist")
@@ -9,10 +9,24 @@ echo "🚀 Iniciando despliegue..."
 echo "📦 Instalando dependencias..."
 pip install -r requirements.txt
 
+# Comprobar regresiones de rendimiento (opcional)
+if [ -n "$BENCHMARK_REFERENCIA" ]; then
+    echo "📊 Comparando el rendimiento con $BENCHMARK_REFERENCIA..."
+    python benchmarks/rendimiento_api.py --comparar "$BENCHMARK_REFERENCIA" --repeticiones 20
+fi
+
 # Inicializar base de datos si no existe
 if [ ! -f "finca_reservas.db" ]; then
     echo "🗄️  Inicializando base de datos..."
     python init_db.py
 fi
 
+# Migraciones versionadas (solo se aplican las pendientes)
+echo "🔧 Aplicando migraciones..."
+python migrar.py
+
+# Paquetes de CSS y JS (static/dist); sin ellos las páginas cargan los originales sin minimizar
+echo "🎨 Construyendo recursos estáticos..."
+python construir_estaticos.py
+
 echo "✅ Despliegue completado"
@@ -0,0 +1,193 @@
+"""
+Recursos estáticos empaquetados: el CSS y el JS de cada plantilla en un archivo
+
+python construir_estaticos.py une y minimiza los archivos de cada paquete,
+pone en el nombre un hash del contenido (base.3f2a9c1b07.css) y escribe al
+lado las versiones .gz y .br. Como el nombre cambia con el contenido, el
+navegador los guarda un año sin volver a preguntar al servidor.
+
+Si no hay paquetes construidos, o alguno ya no coincide con los archivos
+originales, las plantillas cargan los originales de static/: el desarrollo
+no necesita el paso de construcción.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+from werkzeug.security import safe_join
+
+try:
+    import rcssmin
+    import rjsmin
+except ImportError:
+    rcssmin = rjsmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Paquetes por plantilla (rutas relativas a static/). En CSS solo el primer
+# archivo puede usar @import, que tiene que ir antes que cualquier regla.
+PAQUETES = {
+    'base.css': ('css/theme-pastel.css', 'css/notifications.css'),
+    'base.js': ('js/error-handler.js', 'js/pwa.js'),
+    'base_mobile.css': ('css/theme-pastel.css', 'css/mobile.css'),
+    'base_mobile.js': ('js/pwa.js',),
+    'dashboard.js': ('js/dashboard.js',),
+    'calendario.js': ('js/calendario.js',),
+    'mensajes.js': ('js/mensajes.js',),
+    'reservas.js': ('js/reservas.js', 'js/dashboard.js'),
+}
+
+# Librerías de las plantillas servidas desde CDN (el service worker las guarda para usarlas sin conexión)
+RECURSOS_CDN = (
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font/bootstrap-icons.css',
+    'https://cdn.jsdelivr.net/npm/fullcalendar@6.1.8/index.global.min.css',
+    'https://cdn.jsdelivr.net/npm/fullcalendar@6.1.8/index.global.min.js',
+    'https://cdn.jsdelivr.net/npm/chart.js@4.3.0/dist/chart.umd.min.js',
+)
+DIRECTORIO_PAQUETES = 'dist'
+MANIFIESTO = 'manifiesto.json'
+
+
+class ErrorPaquete(Exception):
+    """Un paquete no se puede construir con sus archivos de origen"""
+
+
+def _leer_origenes(directorio_static, archivos):
+    textos = []
+    for archivo in archivos:
+        with open(os.path.join(directorio_static, archivo), encoding='utf-8') as f:
+            textos.append(f.read())
+    return textos
+
+
+def huella_origenes(directorio_static, archivos):
+    """Hash de los archivos de origen de un paquete, para detectar paquetes desactualizados"""
+    resumen = hashlib.sha256()
+    for texto in _leer_origenes(directorio_static, archivos):
+        resumen.update(texto.encode('utf-8'))
+        resumen.update(b'\0')
+    return resumen.hexdigest()[:16]
+
+
+def unir(nombre, textos):
+    """Concatenar y minimizar los archivos de un paquete"""
+    if nombre.endswith('.css'):
+        for texto in textos[1:]:
+            if '@import' in texto:
+                raise ErrorPaquete(f'{nombre}: @import solo puede estar en el primer archivo')
+        contenido = '\n'.join(textos)
+        return rcssmin.cssmin(contenido) if rcssmin else contenido
+    # El ';' evita que un archivo sin punto y coma final se una con el siguiente
+    contenido = '\n;\n'.join(textos)
+    return rjsmin.jsmin(contenido) if rjsmin else contenido
+
+
+def construir(directorio_static, paquetes=PAQUETES, nivel_brotli=11):
+    """
+    Escribir los paquetes en static/dist con su versión .gz y .br
+    Devuelve (nombre, archivo, bytes originales, bytes minimizados, bytes gzip) de cada paquete.
+    """
+    destino = os.path.join(directorio_static, DIRECTORIO_PAQUETES)
+    os.makedirs(destino, exist_ok=True)
+    anterior = _leer_manifiesto(destino)
+
+    manifiesto = {}
+    resumen = []
+    for nombre, archivos in paquetes.items():
+        textos = _leer_origenes(directorio_static, archivos)
+        datos = unir(nombre, textos).encode('utf-8')
+        base, extension = os.path.splitext(nombre)
+        archivo = f'{base}.{hashlib.sha256(datos).hexdigest()[:10]}{extension}'
+        comprimido = gzip.compress(datos, 9, mtime=0)
+
+        _escribir(os.path.join(destino, archivo), datos)
+        _escribir(os.path.join(destino, archivo + '.gz'), comprimido)
+        if brotli is not None:
+            _escribir(os.path.join(destino, archivo + '.br'), brotli.compress(datos, quality=nivel_brotli))
+
+        manifiesto[nombre] = {'archivo': archivo, 'origenes': huella_origenes(directorio_static, archivos)}
+        resumen.append((nombre, archivo, sum(len(t.encode('utf-8')) for t in textos), len(datos), len(comprimido)))
+
+    _escribir(os.path.join(destino, MANIFIESTO), json.dumps(manifiesto, indent=2).encode('utf-8'))
+
+    # Se conservan los de la construcción anterior: páginas ya servidas pueden pedirlos
+    conservar = {MANIFIESTO}
+    for entrada in list(manifiesto.values()) + list(anterior.values()):
+        conservar.update(entrada['archivo'] + sufijo for sufijo in ('', '.gz', '.br'))
+    for archivo in os.listdir(destino):
+        if archivo not in conservar:
+            os.remove(os.path.join(destino, archivo))
+    return resumen
+
+
+def _escribir(ruta, datos):
+    temporal = ruta + '.tmp'
+    with open(temporal, 'wb') as f:
+        f.write(datos)
+    os.replace(temporal, ruta)
+
+
+def _leer_manifiesto(destino):
+    try:
+        with open(os.path.join(destino, MANIFIESTO), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class RecursosEstaticos:
+    """Paquetes construidos que se pueden usar (los que coinciden con sus archivos de origen)"""
+
+    def __init__(self, directorio_static, paquetes=PAQUETES):
+        self.directorio_static = directorio_static
+        self.directorio = os.path.join(directorio_static, DIRECTORIO_PAQUETES)
+        self.paquetes = paquetes
+        self.archivos = {}  # nombre del paquete -> archivo con hash
+        self.desactualizados = []
+
+    def cargar(self):
+        """Leer el manifiesto y descartar los paquetes cuyos originales han cambiado"""
+        self.archivos = {}
+        self.desactualizados = []
+        for nombre, entrada in _leer_manifiesto(self.directorio).items():
+            archivos = self.paquetes.get(nombre)
+            if archivos is None:
+                continue
+            try:
+                vigente = entrada['origenes'] == huella_origenes(self.directorio_static, archivos)
+            except OSError:
+                vigente = False
+            if vigente and os.path.exists(os.path.join(self.directorio, entrada['archivo'])):
+                self.archivos[nombre] = entrada['archivo']
+            else:
+                self.desactualizados.append(nombre)
+        return self
+
+    def origenes(self, nombre):
+        """Archivos de static/ que forman un paquete"""
+        return self.paquetes[nombre]
+
+    def archivo(self, nombre):
+        """Archivo con hash del paquete, o None si no está construido"""
+        return self.archivos.get(nombre)
+
+    def variante(self, archivo, accept_encodings):
+        """
+        Ruta del archivo a enviar y su Content-Encoding ('br', 'gzip' o None)
+        También sirve los de la construcción anterior, que pueden pedir páginas
+        renderizadas por otro worker. Devuelve (None, None) si no existe.
+        """
+        ruta = safe_join(self.directorio, archivo)
+        if ruta is None or os.path.splitext(archivo)[1] not in ('.css', '.js') or not os.path.isfile(ruta):
+            return None, None
+        for codificacion, sufijo in (('br', '.br'), ('gzip', '.gz')):
+            if accept_encodings[codificacion] and os.path.exists(ruta + sufijo):
+                return ruta + sufijo, codificacion
+        return ruta, None
@@ -0,0 +1,101 @@
+"""
+Bus de eventos para notificar cambios en tiempo real (Server-Sent Events)
+
+Los eventos son avisos ligeros (p. ej. "nuevo mensaje de +34600111222"):
+el cliente vuelve a pedir los datos con los cursores habituales, así que
+perder un evento nunca deja la interfaz en un estado incorrecto.
+"""
+
+import json
+import queue
+import threading
+import time
+
+
+class BusEventosMemoria:
+    """Pub/sub en memoria: comparte eventos solo dentro del mismo proceso"""
+
+    def __init__(self, tamano_cola=100):
+        self.tamano_cola = tamano_cola
+        self._suscriptores = set()
+        self._lock = threading.Lock()
+
+    def suscribir(self):
+        """Registrar un suscriptor y devolver su cola de eventos"""
+        cola = queue.Queue(maxsize=self.tamano_cola)
+        with self._lock:
+            self._suscriptores.add(cola)
+        return cola
+
+    def cancelar(self, cola):
+        """Eliminar un suscriptor"""
+        with self._lock:
+            self._suscriptores.discard(cola)
+
+    def publicar(self, evento):
+        """Enviar un evento a todos los suscriptores"""
+        self._repartir(evento)
+
+    def _repartir(self, evento):
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        for cola in suscriptores:
+            try:
+                cola.put_nowait(evento)
+            except queue.Full:
+                # Cliente demasiado lento: se descarta el aviso
+                pass
+
+
+class BusEventosRedis(BusEventosMemoria):
+    """
+    Pub/sub compartido entre procesos (varios workers de gunicorn) a través de Redis
+
+    Cada proceso mantiene un único hilo suscrito al canal de Redis que
+    reparte los eventos entre sus suscriptores locales.
+    """
+
+    def __init__(self, url, canal='finca:eventos', tamano_cola=100):
+        import redis
+
+        super().__init__(tamano_cola)
+        self._redis = redis.Redis.from_url(url)
+        self._canal = canal
+        self._hilo = None
+
+    def suscribir(self):
+        self._iniciar_escucha()
+        return super().suscribir()
+
+    def publicar(self, evento):
+        self._redis.publish(self._canal, json.dumps(evento))
+
+    def _iniciar_escucha(self):
+        with self._lock:
+            if self._hilo and self._hilo.is_alive():
+                return
+            self._hilo = threading.Thread(target=self._escuchar, name='bus-eventos-redis', daemon=True)
+            self._hilo.start()
+
+    def _escuchar(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._canal)
+                for mensaje in pubsub.listen():
+                    self._repartir(json.loads(mensaje['data']))
+            except Exception as e:
+                print(f"❌ Error en el bus de eventos Redis: {str(e)}")
+                time.sleep(1)
+
+
+def crear_bus_eventos(backend='memoria', redis_url=None):
+    """Crear el bus de eventos según la configuración"""
+    if backend == 'redis':
+        return BusEventosRedis(redis_url or 'redis://localhost:6379/0')
+    return BusEventosMemoria()
+
+
+def formato_sse(evento):
+    """Serializar un evento en formato text/event-stream"""
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
@@ -0,0 +1,253 @@
+"""
+Informes de temporada: ingresos, cobros pendientes, invitados y ocupación
+
+Se calculan sobre la tabla resumen_diario, que guarda por día, tipo de
+celebración y estado el número de reservas y la suma de precios,
+anticipos e invitados. La aplicación vuelve a agregar los días afectados
+cada vez que se crea, modifica o borra una reserva, en la misma
+transacción: un informe de varios años lee como mucho unas pocas filas
+por día con reservas, no todas las reservas.
+"""
+
+import csv
+import io
+from datetime import timedelta
+
+from sqlalchemy import case, delete, extract, func, insert, select
+
+# Días que cuentan como fin de semana (date.weekday(): sábado y domingo)
+SABADO = 5
+DIAS_FIN_DE_SEMANA = 2
+
+# Columnas de la reserva que cambian el resumen (otros cambios no lo tocan)
+CAMPOS_RESUMEN = ('fecha_evento', 'tipo_celebracion', 'estado', 'precio', 'anticipo', 'num_invitados')
+
+COLUMNAS_RESUMEN = (
+    'fecha', 'tipo_celebracion', 'estado', 'reservas', 'ingresos', 'anticipos', 'invitados', 'con_invitados'
+)
+
+# Columnas de los CSV de cada informe
+COLUMNAS_CSV = {
+    'ingresos': ('mes', 'tipo_celebracion', 'reservas', 'ingresos', 'anticipos', 'pendiente_cobro',
+                 'invitados', 'invitados_medio'),
+    'ocupacion': ('fin_de_semana', 'dias', 'dias_ocupados', 'ocupacion', 'reservas', 'ingresos'),
+    'reservas': ('id', 'fecha_evento', 'tipo_celebracion', 'estado', 'cliente_nombre', 'num_invitados',
+                 'precio', 'anticipo', 'pendiente_cobro'),
+}
+FILAS_POR_LOTE = 500  # filas que se leen de la base de datos cada vez al exportar reservas
+
+
+# ============= MANTENIMIENTO DEL RESUMEN =============
+
+def _agregar(reserva):
+    """SELECT con las filas del resumen agregadas desde la tabla de reservas"""
+    tipo = func.coalesce(reserva.c.tipo_celebracion, '')
+    estado = func.coalesce(reserva.c.estado, '')
+    return select(
+        reserva.c.fecha_evento,
+        tipo,
+        estado,
+        func.count(),
+        func.coalesce(func.sum(reserva.c.precio), 0),
+        func.coalesce(func.sum(reserva.c.anticipo), 0),
+        func.coalesce(func.sum(reserva.c.num_invitados), 0),
+        # El invitados medio solo cuenta las reservas que lo indican
+        func.count(case((reserva.c.num_invitados > 0, 1))),
+    ).group_by(reserva.c.fecha_evento, tipo, estado)
+
+
+def recalcular_dias(conn, reserva, resumen, fechas):
+    """
+    Volver a agregar los días indicados (en la transacción de la conexión)
+    La transacción debe tener bloqueadas las escrituras de reservas: si dos
+    agregan el mismo día a la vez, ninguna ve las filas de la otra. En
+    PostgreSQL la segunda inserción chocaría con la clave primaria.
+    """
+    fechas = sorted({fecha for fecha in fechas if fecha is not None})
+    if not fechas:
+        return
+    conn.execute(delete(resumen).where(resumen.c.fecha.in_(fechas)))
+    conn.execute(insert(resumen).from_select(
+        COLUMNAS_RESUMEN, _agregar(reserva).where(reserva.c.fecha_evento.in_(fechas))
+    ))
+
+
+def recalcular_rango(conn, reserva, resumen, desde, hasta):
+    """Volver a agregar todos los días de [desde, hasta] (relleno inicial o reparación)"""
+    conn.execute(delete(resumen).where(resumen.c.fecha.between(desde, hasta)))
+    conn.execute(insert(resumen).from_select(
+        COLUMNAS_RESUMEN, _agregar(reserva).where(reserva.c.fecha_evento.between(desde, hasta))
+    ))
+
+
+# ============= INFORMES =============
+
+def _totales(reservas, ingresos, anticipos, invitados, con_invitados):
+    ingresos = float(ingresos or 0)
+    anticipos = float(anticipos or 0)
+    return {
+        'reservas': int(reservas or 0),
+        'ingresos': round(ingresos, 2),
+        'anticipos': round(anticipos, 2),
+        'pendiente_cobro': round(ingresos - anticipos, 2),
+        'invitados': int(invitados or 0),
+        'invitados_medio': round(invitados / con_invitados, 1) if con_invitados else None,
+    }
+
+
+def _sumas(resumen):
+    return (
+        func.sum(resumen.c.reservas).label('reservas'),
+        func.sum(resumen.c.ingresos).label('ingresos'),
+        func.sum(resumen.c.anticipos).label('anticipos'),
+        func.sum(resumen.c.invitados).label('invitados'),
+        func.sum(resumen.c.con_invitados).label('con_invitados'),
+    )
+
+
+def ingresos_por_mes(conn, resumen, desde, hasta, estados):
+    """
+    Ingresos, anticipos, pendiente de cobro (precio - anticipo) e invitados
+    por mes y tipo de celebración, en orden. Genera una fila cada vez.
+    """
+    anio = extract('year', resumen.c.fecha)
+    mes = extract('month', resumen.c.fecha)
+    consulta = select(
+        anio.label('anio'), mes.label('mes'), resumen.c.tipo_celebracion, *_sumas(resumen)
+    ).where(
+        resumen.c.fecha.between(desde, hasta), resumen.c.estado.in_(estados)
+    ).group_by(anio, mes, resumen.c.tipo_celebracion).order_by(anio, mes, resumen.c.tipo_celebracion)
+
+    for fila in conn.execute(consulta):
+        yield {
+            'mes': f'{int(fila.anio):04d}-{int(fila.mes):02d}',
+            'tipo_celebracion': fila.tipo_celebracion or None,
+            **_totales(fila.reservas, fila.ingresos, fila.anticipos, fila.invitados, fila.con_invitados),
+            'con_invitados': int(fila.con_invitados or 0),
+        }
+
+
+def informe_ingresos(conn, resumen, desde, hasta, estados):
+    """Ingresos por mes (con el desglose por tipo), por tipo en toda la temporada y el total"""
+    meses = {}
+    tipos = {}
+    total = [0, 0.0, 0.0, 0, 0]
+    for fila in ingresos_por_mes(conn, resumen, desde, hasta, estados):
+        sumas = (fila['reservas'], fila['ingresos'], fila['anticipos'], fila['invitados'], fila.pop('con_invitados'))
+        mes = meses.setdefault(fila.pop('mes'), {'sumas': [0, 0.0, 0.0, 0, 0], 'tipos': []})
+        mes['tipos'].append(fila)
+        for acumulado in (mes['sumas'], tipos.setdefault(fila['tipo_celebracion'], [0, 0.0, 0.0, 0, 0]), total):
+            for i, valor in enumerate(sumas):
+                acumulado[i] += valor
+
+    return {
+        'meses': [{'mes': nombre, **_totales(*mes['sumas']), 'tipos': mes['tipos']} for nombre, mes in meses.items()],
+        # Los tipos que más facturan primero
+        'tipos': [{'tipo_celebracion': tipo, **_totales(*sumas)}
+                  for tipo, sumas in sorted(tipos.items(), key=lambda t: -t[1][1])],
+        'total': _totales(*total),
+    }
+
+
+def ocupacion_fines_de_semana(conn, resumen, desde, hasta, estados):
+    """
+    Ocupación de cada fin de semana de [desde, hasta], también los que no
+    tienen reservas. Un día está ocupado si tiene al menos una reserva.
+    Recorre las filas del resumen en orden de fecha sin guardarlas.
+    """
+    reservas = func.sum(resumen.c.reservas)
+    consulta = select(
+        resumen.c.fecha, reservas.label('reservas'), func.sum(resumen.c.ingresos).label('ingresos')
+    ).where(
+        resumen.c.fecha.between(desde, hasta), resumen.c.estado.in_(estados)
+    ).group_by(resumen.c.fecha).having(reservas > 0).order_by(resumen.c.fecha)
+
+    filas = iter(conn.execute(consulta))
+    fila = next(filas, None)
+    sabado = desde - timedelta(days=(desde.weekday() - SABADO) % 7)
+    while sabado <= hasta:
+        dias = [d for d in (sabado + timedelta(days=i) for i in range(DIAS_FIN_DE_SEMANA)) if desde <= d <= hasta]
+        ocupados = total_reservas = 0
+        ingresos = 0.0
+        # Las filas de lunes a viernes se saltan
+        while fila is not None and fila.fecha <= sabado + timedelta(days=DIAS_FIN_DE_SEMANA - 1):
+            if fila.fecha in dias:
+                ocupados += 1
+                total_reservas += int(fila.reservas)
+                ingresos += float(fila.ingresos or 0)
+            fila = next(filas, None)
+        if dias:
+            yield {
+                'fin_de_semana': sabado.isoformat(),
+                'dias': len(dias),
+                'dias_ocupados': ocupados,
+                'ocupacion': round(ocupados / len(dias), 3),
+                'reservas': total_reservas,
+                'ingresos': round(ingresos, 2),
+            }
+        sabado += timedelta(days=7)
+
+
+def informe_ocupacion(conn, resumen, desde, hasta, estados):
+    """Fines de semana de la temporada y su ocupación total"""
+    fines = list(ocupacion_fines_de_semana(conn, resumen, desde, hasta, estados))
+    dias = sum(f['dias'] for f in fines)
+    ocupados = sum(f['dias_ocupados'] for f in fines)
+    return {
+        'fines_de_semana': fines,
+        'total': {
+            'fines_de_semana': len(fines),
+            'completos': sum(1 for f in fines if f['dias_ocupados'] == f['dias']),
+            'libres': sum(1 for f in fines if f['dias_ocupados'] == 0),
+            'dias': dias,
+            'dias_ocupados': ocupados,
+            'ocupacion': round(ocupados / dias, 3) if dias else None,
+            'reservas': sum(f['reservas'] for f in fines),
+            'ingresos': round(sum(f['ingresos'] for f in fines), 2),
+        },
+    }
+
+
+def reservas_detalle(conn, reserva, desde, hasta, estados):
+    """Reservas de [desde, hasta] una a una, leídas de la base de datos por lotes"""
+    consulta = select(
+        reserva.c.id, reserva.c.fecha_evento, reserva.c.tipo_celebracion, reserva.c.estado,
+        reserva.c.cliente_nombre, reserva.c.num_invitados, reserva.c.precio, reserva.c.anticipo
+    ).where(
+        reserva.c.fecha_evento.between(desde, hasta), reserva.c.estado.in_(estados)
+    ).order_by(reserva.c.fecha_evento, reserva.c.id).execution_options(yield_per=FILAS_POR_LOTE)
+
+    for fila in conn.execute(consulta):
+        precio = fila.precio or 0.0
+        anticipo = fila.anticipo or 0.0
+        yield {
+            **fila._asdict(),
+            'fecha_evento': fila.fecha_evento.isoformat(),
+            'pendiente_cobro': round(precio - anticipo, 2),
+        }
+
+
+# ============= CSV =============
+
+def _celda(valor):
+    # Un texto que empieza por = + - @ se tomaría como fórmula en una hoja de cálculo
+    if isinstance(valor, str) and valor[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + valor
+    return valor
+
+
+def lineas_csv(columnas, filas, tamano_trozo=16384):
+    """
+    Texto de un CSV (cabecera incluida) generado a medida que llegan las filas (diccionarios)
+    Se entrega en trozos de unos 16 KB: una escritura por fila sería demasiado lenta.
+    """
+    salida = io.StringIO()
+    escritor = csv.writer(salida, lineterminator='\r\n')
+    escritor.writerow(columnas)
+    for fila in filas:
+        escritor.writerow([_celda(fila.get(columna)) for columna in columnas])
+        if salida.tell() >= tamano_trozo:
+            yield salida.getvalue()
+            salida.seek(0)
+            salida.truncate()
+    yield salida.getvalue()
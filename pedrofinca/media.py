@@ -0,0 +1,145 @@
+"""
+Almacén local de archivos multimedia de WhatsApp, direccionado por contenido
+
+Cada archivo se guarda como <directorio>/<sha256[:2]>/<sha256>, de modo que
+el mismo contenido recibido varias veces ocupa un solo fichero y el hash
+sirve directamente como ETag.
+
+Solo se descargan URLs de los orígenes permitidos (los de Twilio): las URLs
+llegan en el webhook y, si no, una petición falsificada podría hacer que el
+servidor pidiera direcciones internas o enviara las credenciales a otro host.
+"""
+
+import hashlib
+import os
+import tempfile
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from PIL import Image
+
+
+class ErrorDescarga(Exception):
+    """No se pudo descargar un archivo multimedia"""
+
+
+def url_permitida(url, origenes):
+    """
+    True si la URL es de uno de los orígenes ('https://api.twilio.com'):
+    mismo esquema, host y puerto; '*.' al principio del host admite subdominios
+    """
+    try:
+        partes = urlsplit(url)
+        puerto = partes.port
+    except ValueError:
+        return False
+    host = (partes.hostname or '').lower()
+    for origen in origenes:
+        esperado = urlsplit(origen)
+        patron = esperado.hostname
+        if partes.scheme != esperado.scheme or puerto != esperado.port:
+            continue
+        if host == patron or (patron.startswith('*.') and host.endswith(patron[1:])):
+            return True
+    return False
+
+
+class AlmacenMedia:
+    """Descarga, guarda y borra archivos multimedia y sus miniaturas"""
+
+    def __init__(self, directorio, origenes_permitidos=(), tamano_miniatura=320,
+                 tamano_archivo_max=20 * 1024 * 1024, max_redirecciones=5):
+        self.directorio = directorio
+        self.origenes_permitidos = tuple(origenes_permitidos)
+        self.max_redirecciones = max_redirecciones
+        self.tamano_miniatura = tamano_miniatura
+        self.tamano_archivo_max = tamano_archivo_max
+        self.session = requests.Session()
+
+    def ruta(self, sha256):
+        return os.path.join(self.directorio, sha256[:2], sha256)
+
+    def ruta_miniatura(self, sha256):
+        return self.ruta(sha256) + '_miniatura.jpg'
+
+    def permitida(self, url):
+        return url_permitida(url, self.origenes_permitidos)
+
+    def _pedir(self, url, auth, timeout):
+        """
+        GET siguiendo las redirecciones a mano: cada salto tiene que ser de un
+        origen permitido (Twilio redirige a su CDN, que no necesita credenciales)
+        """
+        for _ in range(self.max_redirecciones + 1):
+            if not self.permitida(url):
+                raise ErrorDescarga(f'URL no permitida: {url}')
+            respuesta = self.session.get(url, auth=auth, stream=True, timeout=timeout, allow_redirects=False)
+            if not respuesta.is_redirect:
+                respuesta.raise_for_status()
+                return respuesta
+            respuesta.close()
+            url = urljoin(url, respuesta.headers['Location'])
+            auth = None
+        raise ErrorDescarga(f'Demasiadas redirecciones: {url}')
+
+    def descargar(self, url, auth=None, timeout=30):
+        """
+        Descargar una URL de un origen permitido al almacén
+        Devuelve (sha256, tamaño en bytes, content-type)
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        try:
+            respuesta = self._pedir(url, auth, timeout)
+        except requests.RequestException as e:
+            raise ErrorDescarga(f'Error al descargar {url}: {e}')
+
+        # Guardar en un temporal calculando el hash a la vez
+        resumen = hashlib.sha256()
+        tamano = 0
+        descriptor, temporal = tempfile.mkstemp(dir=self.directorio, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                for bloque in respuesta.iter_content(64 * 1024):
+                    tamano += len(bloque)
+                    if tamano > self.tamano_archivo_max:
+                        raise ErrorDescarga(f'Archivo demasiado grande ({url})')
+                    resumen.update(bloque)
+                    f.write(bloque)
+
+            sha256 = resumen.hexdigest()
+            destino = self.ruta(sha256)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(temporal, destino)
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+        finally:
+            respuesta.close()
+
+        content_type = respuesta.headers.get('Content-Type', 'application/octet-stream').split(';')[0]
+        return sha256, tamano, content_type
+
+    def crear_miniatura(self, sha256, content_type):
+        """Generar una miniatura JPEG para imágenes; devuelve True si se creó"""
+        if not content_type.startswith('image/'):
+            return False
+
+        destino = self.ruta_miniatura(sha256)
+        if os.path.exists(destino):
+            return True
+
+        try:
+            with Image.open(self.ruta(sha256)) as imagen:
+                imagen.thumbnail((self.tamano_miniatura, self.tamano_miniatura))
+                imagen.convert('RGB').save(destino, 'JPEG', quality=80, optimize=True)
+            return True
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # Formato no soportado por Pillow o imagen enorme: se sirve el original
+            return False
+
+    def borrar(self, sha256):
+        """Borrar un archivo y su miniatura"""
+        for ruta in (self.ruta(sha256), self.ruta_miniatura(sha256)):
+            if os.path.exists(ruta):
+                os.remove(ruta)
@@ -0,0 +1,168 @@
+"""
+Métricas de rendimiento en formato de texto de Prometheus
+
+Contadores e histogramas en memoria, seguros entre hilos. Cada proceso
+(worker de gunicorn) tiene los suyos: Prometheus los suma al consultar
+varios workers, o se leen por separado en un despliegue de un solo worker.
+"""
+
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Límites de los histogramas de duración (segundos)
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Límites de los histogramas de número de consultas SQL por petición
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear_etiquetas(nombres, valores, extra=None):
+    pares = list(zip(nombres, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{n}="{_escapar(v)}"' for n, v in pares) + '}'
+
+
+def _formatear_numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metrica:
+    tipo = ''
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas):
+        return tuple(str(etiquetas.get(nombre, '')) for nombre in self.etiquetas)
+
+    def exponer(self):
+        lineas = [f'# HELP {self.nombre} {self.ayuda}', f'# TYPE {self.nombre} {self.tipo}']
+        with self._lock:
+            lineas.extend(self._muestras())
+        return lineas
+
+
+class Contador(Metrica):
+    """Valor que solo crece (peticiones, errores...)"""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores = Counter()
+
+    def inc(self, cantidad=1, **etiquetas):
+        with self._lock:
+            self._valores[self._clave(etiquetas)] += cantidad
+
+    def _muestras(self):
+        for clave, valor in sorted(self._valores.items()):
+            yield f'{self.nombre}{_formatear_etiquetas(self.etiquetas, clave)} {_formatear_numero(valor)}'
+
+
+class Histograma(Metrica):
+    """Distribución de valores en cubetas acumuladas (latencias, tamaños...)"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites) + (float('inf'),)
+        self._series = {}
+
+    def observar(self, valor, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = {'cubetas': [0] * len(self.limites), 'suma': 0.0, 'total': 0}
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie['cubetas'][i] += 1
+                    break
+            serie['suma'] += valor
+            serie['total'] += 1
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        """Observar la duración del bloque en segundos (también si lanza una excepción)"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def _muestras(self):
+        for clave, serie in sorted(self._series.items()):
+            acumulado = 0
+            for limite, cantidad in zip(self.limites, serie['cubetas']):
+                acumulado += cantidad
+                etiquetas = _formatear_etiquetas(self.etiquetas, clave, ('le', _formatear_numero(limite)))
+                yield f'{self.nombre}_bucket{etiquetas} {acumulado}'
+            etiquetas = _formatear_etiquetas(self.etiquetas, clave)
+            yield f'{self.nombre}_sum{etiquetas} {serie["suma"]!r}'
+            yield f'{self.nombre}_count{etiquetas} {serie["total"]}'
+
+
+class RegistroMetricas:
+    """Conjunto de métricas de un proceso"""
+
+    TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metricas = []
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        metrica = Contador(nombre, ayuda, etiquetas)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        metrica = Histograma(nombre, ayuda, etiquetas, limites)
+        self._metricas.append(metrica)
+        return metrica
+
+    def exponer(self):
+        """Todas las métricas en formato de texto de Prometheus"""
+        lineas = []
+        for metrica in self._metricas:
+            lineas.extend(metrica.exponer())
+        return '\n'.join(lineas) + '\n'
+
+
+def normalizar_sql(sentencia):
+    """Sentencia SQL en una línea, para agrupar las repetidas"""
+    return re.sub(r'\s+', ' ', sentencia).strip()
+
+
+class ConsultasPeticion:
+    """Consultas SQL ejecutadas durante una petición"""
+
+    def __init__(self):
+        self.total = 0
+        self.segundos = 0.0
+        self.por_sentencia = Counter()
+
+    def registrar(self, sentencia, segundos):
+        self.total += 1
+        self.segundos += segundos
+        self.por_sentencia[normalizar_sql(sentencia)] += 1
+
+    def repetidas(self, minimo):
+        """Sentencias ejecutadas al menos `minimo` veces (posible patrón N+1)"""
+        return [(sentencia, veces) for sentencia, veces in self.por_sentencia.most_common() if veces >= minimo]
@@ -0,0 +1,389 @@
+"""
+Migraciones versionadas de la base de datos
+
+Cada versión es un módulo vNNN_nombre.py de este paquete con una
+DESCRIPCION y una lista de PASOS. Las versiones aplicadas se guardan en
+la tabla schema_version, así que ejecutar el migrador varias veces solo
+aplica las pendientes.
+
+Todos los pasos son idempotentes (comprueban el esquema antes de tocarlo)
+y los rellenos de datos se hacen por lotes con commit en cada uno, de
+modo que la aplicación puede seguir funcionando mientras se migra y una
+migración interrumpida continúa donde se quedó.
+"""
+
+import importlib
+import pkgutil
+import re
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+TAMANO_LOTE = 500
+
+metadata_migraciones = MetaData()
+
+schema_version = Table(
+    'schema_version', metadata_migraciones,
+    Column('version', Integer, primary_key=True),
+    Column('descripcion', String(200)),
+    Column('aplicada_at', DateTime),
+    Column('segundos', Float)
+)
+
+
+# ============= PASOS =============
+
+class Paso:
+    """Un cambio del esquema o de los datos"""
+
+    descripcion = ''
+
+    def pendiente(self, conn, metadata):
+        """False si el cambio ya está aplicado"""
+        return True
+
+    def estimar(self, conn, metadata):
+        """Número aproximado de filas que tocará el paso"""
+        return 0
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        raise NotImplementedError
+
+
+class CrearTabla(Paso):
+    """Crear una tabla con su definición actual del modelo (si no existe)"""
+
+    def __init__(self, tabla):
+        self.tabla = tabla
+        self.descripcion = f"Crear tabla '{tabla}'"
+
+    def pendiente(self, conn, metadata):
+        return not inspect(conn).has_table(self.tabla)
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        metadata.tables[self.tabla].create(conn, checkfirst=True)
+        conn.commit()
+
+
+class AgregarColumna(Paso):
+    """
+    Agregar una columna del modelo a una tabla existente
+    El tipo se toma del modelo y se compila para el motor en uso
+    """
+
+    def __init__(self, tabla, columna, defecto_sql=None):
+        self.tabla = tabla
+        self.columna = columna
+        self.defecto_sql = defecto_sql
+        self.descripcion = f"Agregar columna '{tabla}.{columna}'"
+
+    def pendiente(self, conn, metadata):
+        return self.columna not in nombres_columnas(conn, self.tabla)
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        tipo = metadata.tables[self.tabla].c[self.columna].type.compile(dialect=conn.dialect)
+        tabla = conn.dialect.identifier_preparer.quote(self.tabla)  # 'user' es palabra reservada en PostgreSQL
+        ddl = f'ALTER TABLE {tabla} ADD COLUMN {self.columna} {tipo}'
+        if self.defecto_sql is not None:
+            ddl += f' DEFAULT {self.defecto_sql}'
+        conn.execute(text(ddl))
+        conn.commit()
+
+
+class CrearIndice(Paso):
+    """Crear un índice declarado en el modelo (si no existe)"""
+
+    def __init__(self, tabla, nombre):
+        self.tabla = tabla
+        self.nombre = nombre
+        self.descripcion = f"Crear índice '{nombre}'"
+
+    def pendiente(self, conn, metadata):
+        return self.nombre not in nombres_indices(conn, self.tabla)
+
+    def estimar(self, conn, metadata):
+        # Crear el índice recorre la tabla entera
+        return contar(conn, self.tabla)
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        indice = next(i for i in metadata.tables[self.tabla].indexes if i.name == self.nombre)
+        conn.execute(CreateIndex(indice, if_not_exists=True))
+        conn.commit()
+
+
+class EliminarIndice(Paso):
+    """Eliminar un índice que ya no se usa (si existe)"""
+
+    def __init__(self, tabla, nombre):
+        self.tabla = tabla
+        self.nombre = nombre
+        self.descripcion = f"Eliminar índice '{nombre}'"
+
+    def pendiente(self, conn, metadata):
+        return self.nombre in nombres_indices(conn, self.tabla)
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        conn.execute(text(f'DROP INDEX IF EXISTS {self.nombre}'))
+        conn.commit()
+
+
+class CrearIndicesFaltantes(Paso):
+    """Crear todos los índices del modelo que falten en la base de datos"""
+
+    descripcion = 'Crear los índices del modelo que falten'
+
+    def faltantes(self, conn, metadata):
+        inspector = inspect(conn)
+        faltan = []
+        for tabla in metadata.sorted_tables:
+            if not inspector.has_table(tabla.name):
+                continue
+            existentes = nombres_indices(conn, tabla.name)
+            faltan.extend(i for i in tabla.indexes if i.name not in existentes)
+        return faltan
+
+    def pendiente(self, conn, metadata):
+        return bool(self.faltantes(conn, metadata))
+
+    def estimar(self, conn, metadata):
+        return sum(contar(conn, i.table.name) for i in self.faltantes(conn, metadata))
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        for indice in self.faltantes(conn, metadata):
+            conn.execute(CreateIndex(indice, if_not_exists=True))
+            print(f"      ✅ Índice '{indice.name}' creado")
+            conn.commit()
+
+
+class PermitirNulos(Paso):
+    """
+    Quitar el NOT NULL de una columna
+
+    SQLite no tiene ALTER COLUMN: la tabla se reconstruye con la definición
+    actual del modelo y se copian las columnas comunes en una sola
+    transacción (o se copia todo o no cambia nada). Solo se ejecuta si la
+    columna todavía es NOT NULL; conviene hacerlo con la aplicación parada.
+    """
+
+    def __init__(self, tabla, columna):
+        self.tabla = tabla
+        self.columna = columna
+        self.descripcion = f"Permitir nulos en '{tabla}.{columna}'"
+
+    def pendiente(self, conn, metadata):
+        for columna in inspect(conn).get_columns(self.tabla):
+            if columna['name'] == self.columna:
+                return not columna['nullable']
+        return False
+
+    def estimar(self, conn, metadata):
+        return contar(conn, self.tabla) if conn.dialect.name == 'sqlite' else 0
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        if conn.dialect.name != 'sqlite':
+            conn.execute(text(f'ALTER TABLE {self.tabla} ALTER COLUMN {self.columna} DROP NOT NULL'))
+            conn.commit()
+            return
+
+        modelo = metadata.tables[self.tabla]
+        temporal = f'{self.tabla}_migracion'
+        actuales = nombres_columnas(conn, self.tabla)
+        comunes = ', '.join(c.name for c in modelo.columns if c.name in actuales)
+
+        # Copia de la tabla del modelo sin índices (los recrea CrearIndicesFaltantes)
+        # (en un MetaData aparte con todas las tablas, para resolver las claves foráneas)
+        auxiliar = MetaData()
+        for tabla in metadata.sorted_tables:
+            tabla.to_metadata(auxiliar)
+        copia = modelo.to_metadata(auxiliar, name=temporal)
+        copia.indexes.clear()
+        for columna in copia.columns:
+            columna.index = None
+
+        conn.execute(text(f'DROP TABLE IF EXISTS {temporal}'))
+        copia.create(conn)
+        conn.execute(text(f'INSERT INTO {temporal} ({comunes}) SELECT {comunes} FROM {self.tabla}'))
+        conn.execute(text(f'DROP TABLE {self.tabla}'))
+        conn.execute(text(f'ALTER TABLE {temporal} RENAME TO {self.tabla}'))
+        conn.commit()
+
+
+class RellenarPorLotes(Paso):
+    """
+    Rellenar datos recorriendo una tabla por id en lotes
+
+    `condicion` (SQL) selecciona las filas que faltan por rellenar, así que
+    el paso se puede repetir. `procesar(conn, tabla, filas)` recibe cada
+    lote de filas completas y hace las escrituras; se hace commit por lote.
+    """
+
+    def __init__(self, tabla, condicion, procesar, descripcion):
+        self.tabla = tabla
+        self.condicion = condicion
+        self.procesar = procesar
+        self.descripcion = descripcion
+
+    def pendiente(self, conn, metadata):
+        return self.estimar(conn, metadata) > 0
+
+    def estimar(self, conn, metadata):
+        return contar(conn, self.tabla, self.condicion)
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        tabla = metadata.tables[self.tabla]
+        # Solo las columnas que ya existen (las de versiones posteriores aún no)
+        actuales = nombres_columnas(conn, self.tabla)
+        columnas = [c for c in tabla.columns if c.name in actuales]
+        ultimo_id = 0
+        total = 0
+        while True:
+            filas = conn.execute(
+                select(*columnas)
+                .where(text(self.condicion), tabla.c.id > ultimo_id)
+                .order_by(tabla.c.id)
+                .limit(tamano_lote)
+            ).fetchall()
+            if not filas:
+                break
+
+            self.procesar(conn, tabla, filas)
+            conn.commit()
+
+            ultimo_id = filas[-1].id
+            total += len(filas)
+            print(f"      ... {total} filas procesadas")
+
+
+class ActualizarPorLotes(RellenarPorLotes):
+    """Rellenar con un UPDATE SQL fijo, por lotes de ids"""
+
+    def __init__(self, tabla, asignacion, condicion, descripcion):
+        def procesar(conn, tabla_modelo, filas):
+            ids = ', '.join(str(fila.id) for fila in filas)
+            conn.execute(text(f'UPDATE {tabla} SET {asignacion} WHERE id IN ({ids})'))
+
+        super().__init__(tabla, condicion, procesar, descripcion)
+
+
+def nombres_columnas(conn, tabla):
+    """Columnas existentes de una tabla (vacío si la tabla aún no existe)"""
+    if not inspect(conn).has_table(tabla):
+        return set()
+    return {c['name'] for c in inspect(conn).get_columns(tabla)}
+
+
+def nombres_indices(conn, tabla):
+    """Índices existentes de una tabla (vacío si la tabla aún no existe)"""
+    if not inspect(conn).has_table(tabla):
+        return set()
+    return {i['name'] for i in inspect(conn).get_indexes(tabla)}
+
+
+def contar(conn, tabla, condicion=None):
+    if not inspect(conn).has_table(tabla):
+        return 0
+    sql = f'SELECT COUNT(*) FROM {tabla}'
+    if condicion:
+        sql += f' WHERE {condicion}'
+    try:
+        return conn.execute(text(sql)).scalar()
+    except Exception:
+        # La condición usa columnas que aún no existen: se tocarán todas las filas
+        conn.rollback()
+        return conn.execute(text(f'SELECT COUNT(*) FROM {tabla}')).scalar()
+
+
+# ============= VERSIONES =============
+
+class Version:
+    def __init__(self, numero, nombre, descripcion, pasos):
+        self.numero = numero
+        self.nombre = nombre
+        self.descripcion = descripcion
+        self.pasos = pasos
+
+
+def cargar_versiones():
+    """Versiones definidas en el paquete, ordenadas por número"""
+    versiones = []
+    for modulo in pkgutil.iter_modules(__path__):
+        coincidencia = re.match(r'v(\d+)_(\w+)$', modulo.name)
+        if not coincidencia:
+            continue
+        definicion = importlib.import_module(f'{__name__}.{modulo.name}')
+        versiones.append(Version(
+            int(coincidencia.group(1)),
+            coincidencia.group(2),
+            definicion.DESCRIPCION,
+            definicion.PASOS
+        ))
+    versiones.sort(key=lambda v: v.numero)
+    return versiones
+
+
+def versiones_aplicadas(conn):
+    schema_version.create(conn, checkfirst=True)
+    conn.commit()
+    return {fila.version: fila for fila in conn.execute(select(schema_version))}
+
+
+def migrar(engine, metadata, simular=False, tamano_lote=TAMANO_LOTE):
+    """
+    Aplicar las versiones pendientes (o solo mostrarlas si simular=True)
+    Devuelve el número de versiones aplicadas o que se aplicarían
+    """
+    with engine.connect() as conn:
+        aplicadas = versiones_aplicadas(conn)
+        pendientes = [v for v in cargar_versiones() if v.numero not in aplicadas]
+
+        if not pendientes:
+            print("✅ La base de datos está al día")
+            return 0
+
+        for version in pendientes:
+            print(f"\n📦 v{version.numero:03d} {version.descripcion}")
+            inicio = time.monotonic()
+
+            for paso in version.pasos:
+                if not paso.pendiente(conn, metadata):
+                    print(f"   ⏭️  {paso.descripcion} (ya aplicado)")
+                    continue
+
+                filas = paso.estimar(conn, metadata)
+                detalle = f" (~{filas} filas)" if filas else ""
+                if simular:
+                    print(f"   📝 {paso.descripcion}{detalle}")
+                    continue
+
+                print(f"   🔧 {paso.descripcion}{detalle}")
+                paso.aplicar(conn, metadata, tamano_lote)
+
+            if simular:
+                continue
+
+            conn.execute(schema_version.insert().values(
+                version=version.numero,
+                descripcion=version.descripcion,
+                aplicada_at=datetime.utcnow(),
+                segundos=round(time.monotonic() - inicio, 2)
+            ))
+            conn.commit()
+            print(f"   ✅ v{version.numero:03d} aplicada")
+
+        return len(pendientes)
+
+
+def mostrar_estado(engine):
+    """Listar las versiones aplicadas y pendientes"""
+    with engine.connect() as conn:
+        aplicadas = versiones_aplicadas(conn)
+        for version in cargar_versiones():
+            fila = aplicadas.get(version.numero)
+            if fila:
+                print(f"✅ v{version.numero:03d} {version.descripcion} "
+                      f"({fila.aplicada_at:%Y-%m-%d %H:%M}, {fila.segundos:g} s)")
+            else:
+                print(f"⏳ v{version.numero:03d} {version.descripcion} (pendiente)")
@@ -0,0 +1,16 @@
+"""Mensajes entrantes: origen, dirección y reserva opcional (antes migrate_db.py)"""
+
+from migraciones import ActualizarPorLotes, AgregarColumna, PermitirNulos
+
+DESCRIPCION = 'Mensajes entrantes de WhatsApp'
+
+PASOS = [
+    AgregarColumna('mensaje', 'telefono_origen'),
+    AgregarColumna('mensaje', 'direccion', defecto_sql="'saliente'"),
+    ActualizarPorLotes(
+        'mensaje', "direccion = 'saliente'", 'direccion IS NULL',
+        'Marcar como salientes los mensajes sin dirección'
+    ),
+    # Los mensajes entrantes pueden no tener reserva
+    PermitirNulos('mensaje', 'reserva_id'),
+]
@@ -0,0 +1,12 @@
+"""Campos multimedia de los mensajes (antes migrate_multimedia.py)"""
+
+from migraciones import ActualizarPorLotes, AgregarColumna
+
+DESCRIPCION = 'Archivos multimedia en los mensajes'
+
+PASOS = [
+    AgregarColumna('mensaje', 'num_media', defecto_sql='0'),
+    AgregarColumna('mensaje', 'media_urls'),
+    AgregarColumna('mensaje', 'media_types'),
+    ActualizarPorLotes('mensaje', 'num_media = 0', 'num_media IS NULL', 'Poner a 0 num_media de los mensajes antiguos'),
+]
@@ -0,0 +1,54 @@
+"""Teléfonos normalizados (E.164) y contactos (antes migrate_telefonos.py)"""
+
+from sqlalchemy import bindparam
+
+from migraciones import AgregarColumna, CrearIndice, CrearTabla, EliminarIndice, RellenarPorLotes
+
+
+def normalizar_reservas(conn, tabla, filas):
+    from app import guardar_contacto, normalizar_telefono
+
+    cambios = []
+    for fila in filas:
+        telefono_norm = normalizar_telefono(fila.cliente_telefono)
+        cambios.append({'b_id': fila.id, 'b_telefono_norm': telefono_norm})
+        guardar_contacto(conn, telefono_norm, fila.cliente_nombre, fila.id)
+    conn.execute(
+        tabla.update().where(tabla.c.id == bindparam('b_id')).values(telefono_norm=bindparam('b_telefono_norm')),
+        cambios
+    )
+
+
+def normalizar_mensajes(conn, tabla, filas):
+    from app import normalizar_telefono
+
+    conn.execute(
+        tabla.update().where(tabla.c.id == bindparam('b_id')).values(telefono_norm=bindparam('b_telefono_norm')),
+        [{
+            'b_id': fila.id,
+            'b_telefono_norm': normalizar_telefono(
+                fila.telefono_origen if fila.direccion == 'entrante' else fila.telefono_destino
+            )
+        } for fila in filas]
+    )
+
+
+DESCRIPCION = 'Teléfonos normalizados y tabla de contactos'
+
+PASOS = [
+    CrearTabla('contacto'),
+    AgregarColumna('reserva', 'telefono_norm'),
+    AgregarColumna('mensaje', 'telefono_norm'),
+    RellenarPorLotes(
+        'reserva', 'telefono_norm IS NULL AND cliente_telefono IS NOT NULL', normalizar_reservas,
+        'Normalizar teléfonos de reservas y crear sus contactos'
+    ),
+    RellenarPorLotes(
+        'mensaje', 'telefono_norm IS NULL', normalizar_mensajes,
+        'Normalizar teléfonos de mensajes'
+    ),
+    CrearIndice('reserva', 'ix_reserva_telefono_norm'),
+    # En mensaje el índice compuesto cubre las búsquedas por teléfono
+    CrearIndice('mensaje', 'ix_mensaje_telefono_norm_enviado_at'),
+    EliminarIndice('mensaje', 'ix_mensaje_telefono_norm'),
+]
@@ -0,0 +1,13 @@
+"""Reintentos de la cola de envío (antes migrate_cola_envio.py)"""
+
+from migraciones import ActualizarPorLotes, AgregarColumna, CrearIndice
+
+DESCRIPCION = 'Cola de envío con reintentos'
+
+PASOS = [
+    AgregarColumna('mensaje', 'intentos', defecto_sql='0'),
+    AgregarColumna('mensaje', 'proximo_intento_at'),
+    AgregarColumna('mensaje', 'error_envio'),
+    ActualizarPorLotes('mensaje', 'intentos = 0', 'intentos IS NULL', 'Poner a 0 intentos de los mensajes antiguos'),
+    CrearIndice('mensaje', 'ix_mensaje_estado_proximo_intento'),
+]
@@ -0,0 +1,11 @@
+"""Envíos masivos de WhatsApp (antes migrate_difusion.py)"""
+
+from migraciones import AgregarColumna, CrearIndice, CrearTabla
+
+DESCRIPCION = 'Difusiones'
+
+PASOS = [
+    CrearTabla('difusion'),
+    AgregarColumna('mensaje', 'difusion_id'),
+    CrearIndice('mensaje', 'ix_mensaje_difusion_id'),
+]
@@ -0,0 +1,10 @@
+"""Procesado diferido del webhook (antes migrate_webhook.py)"""
+
+from migraciones import CrearIndice, CrearTabla
+
+DESCRIPCION = 'Entrada del webhook'
+
+PASOS = [
+    CrearTabla('entrada_webhook'),
+    CrearIndice('mensaje', 'ix_mensaje_twilio_sid'),
+]
@@ -0,0 +1,34 @@
+"""Caché local de archivos multimedia (antes migrate_media.py)"""
+
+import json
+
+from sqlalchemy import select
+
+from migraciones import CrearTabla, RellenarPorLotes
+
+
+def registrar_media(conn, tabla, filas):
+    """Registrar las URLs aún no conocidas (se descargan en segundo plano)"""
+    from app import ArchivoMedia
+
+    archivos = ArchivoMedia.__table__
+    urls = {url for fila in filas for url in json.loads(fila.media_urls)}
+    conocidas = set(conn.execute(
+        select(archivos.c.url_origen).where(archivos.c.url_origen.in_(urls))
+    ).scalars())
+    nuevas = urls - conocidas
+    if nuevas:
+        conn.execute(archivos.insert(), [{'url_origen': url} for url in nuevas])
+
+
+DESCRIPCION = 'Caché de archivos multimedia'
+
+PASOS = [
+    CrearTabla('archivo_media'),
+    RellenarPorLotes(
+        'mensaje',
+        "media_urls IS NOT NULL AND media_urls NOT IN ('', '[]')",
+        registrar_media,
+        'Registrar los archivos de los mensajes existentes'
+    ),
+]
@@ -0,0 +1,34 @@
+"""
+Contador de cambios de reserva (caché del panel y ETag de /api/reservas) y
+consultas del calendario (antes migrate_estadisticas.py y migrate_calendario.py)
+"""
+
+from sqlalchemy import inspect, text
+
+from migraciones import CrearIndice, CrearTabla, Paso
+
+
+class IniciarVersionReservas(Paso):
+    """Crear el contador de cambios de reserva (clave de la caché del panel y ETag)"""
+
+    descripcion = "Iniciar el contador de versión de 'reserva'"
+
+    def pendiente(self, conn, metadata):
+        if not inspect(conn).has_table('version_tabla'):
+            return True
+        return conn.execute(text(
+            "SELECT COUNT(*) FROM version_tabla WHERE tabla = 'reserva'"
+        )).scalar() == 0
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        conn.execute(text("INSERT INTO version_tabla (tabla, version) VALUES ('reserva', 1)"))
+        conn.commit()
+
+
+DESCRIPCION = 'Calendario de reservas'
+
+PASOS = [
+    CrearIndice('reserva', 'ix_reserva_estado_fecha_evento'),
+    CrearTabla('version_tabla'),
+    IniciarVersionReservas(),
+]
@@ -0,0 +1,9 @@
+"""Listado paginado de reservas (antes migrate_listados.py)"""
+
+from migraciones import CrearIndice
+
+DESCRIPCION = 'Listado paginado de reservas'
+
+PASOS = [
+    CrearIndice('reserva', 'ix_reserva_fecha_evento'),
+]
@@ -0,0 +1,33 @@
+"""Intervalo ocupado de cada reserva (antes migrate_disponibilidad.py)"""
+
+from sqlalchemy import bindparam
+
+from migraciones import AgregarColumna, CrearIndice, RellenarPorLotes
+
+
+def calcular_intervalos(conn, tabla, filas):
+    from app import intervalo_reserva
+
+    cambios = []
+    for fila in filas:
+        inicio, fin = intervalo_reserva(fila.fecha_evento, fila.hora_inicio, fila.hora_fin)
+        cambios.append({'b_id': fila.id, 'b_inicio_at': inicio, 'b_fin_at': fin})
+    conn.execute(
+        tabla.update()
+        .where(tabla.c.id == bindparam('b_id'))
+        .values(inicio_at=bindparam('b_inicio_at'), fin_at=bindparam('b_fin_at')),
+        cambios
+    )
+
+
+DESCRIPCION = 'Disponibilidad y solapes de reservas'
+
+PASOS = [
+    AgregarColumna('reserva', 'inicio_at'),
+    AgregarColumna('reserva', 'fin_at'),
+    RellenarPorLotes(
+        'reserva', 'inicio_at IS NULL OR fin_at IS NULL', calcular_intervalos,
+        'Calcular inicio_at y fin_at de las reservas'
+    ),
+    CrearIndice('reserva', 'ix_reserva_estado_inicio_fin'),
+]
@@ -0,0 +1,10 @@
+"""Índices del modelo que nunca tuvieron script de migración"""
+
+from migraciones import CrearIndicesFaltantes
+
+DESCRIPCION = 'Índices pendientes del modelo'
+
+PASOS = [
+    # Incluye los índices perdidos al reconstruir la tabla mensaje
+    CrearIndicesFaltantes(),
+]
@@ -0,0 +1,9 @@
+"""Versión de sesión de los usuarios: revoca las sesiones abiertas al cambiar la contraseña o los permisos"""
+
+from migraciones import AgregarColumna
+
+DESCRIPCION = 'Versión de sesión de los usuarios'
+
+PASOS = [
+    AgregarColumna('user', 'version_sesion', defecto_sql='1'),
+]
@@ -0,0 +1,51 @@
+"""Índices de búsqueda de texto completo en mensajes y reservas"""
+
+from sqlalchemy import inspect, text
+
+from busqueda import ddl_busqueda, sql_reconstruir
+from migraciones import Paso, contar, nombres_columnas
+
+
+class CrearIndiceBusqueda(Paso):
+    """
+    Crear el índice de texto completo de una tabla e indexar sus filas
+
+    En SQLite la reconstrucción del índice FTS5 es una sola sentencia
+    (consistente con los triggers, que se crean en la misma transacción)
+    y bloquea las escrituras mientras dura: unos segundos por millón de
+    mensajes. En PostgreSQL la columna generada se calcula al añadirla.
+    """
+
+    def __init__(self, tabla):
+        self.tabla = tabla
+        self.descripcion = f"Crear índice de búsqueda de '{tabla}'"
+
+    def pendiente(self, conn, metadata):
+        if conn.dialect.name == 'sqlite':
+            triggers = conn.execute(text(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE :prefijo"
+            ), {'prefijo': f'{self.tabla}_fts_%'}).scalar()
+            return not inspect(conn).has_table(f'{self.tabla}_fts') or triggers < 3
+        if conn.dialect.name == 'postgresql':
+            return 'busqueda' not in nombres_columnas(conn, self.tabla)
+        return False
+
+    def estimar(self, conn, metadata):
+        return contar(conn, self.tabla)
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        dialecto = conn.dialect.name
+        for sentencia in ddl_busqueda(self.tabla, dialecto):
+            conn.execute(text(sentencia))
+        reconstruir = sql_reconstruir(self.tabla, dialecto)
+        if reconstruir:
+            conn.execute(text(reconstruir))
+        conn.commit()
+
+
+DESCRIPCION = 'Búsqueda de texto completo'
+
+PASOS = [
+    CrearIndiceBusqueda('mensaje'),
+    CrearIndiceBusqueda('reserva'),
+]
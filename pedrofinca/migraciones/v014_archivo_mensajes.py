@@ -0,0 +1,74 @@
+"""Bloques comprimidos de mensajes archivados y su índice de búsqueda"""
+
+from sqlalchemy import func, inspect, select, text
+
+from archivo_mensajes import descomprimir
+from busqueda import ddl_busqueda_archivo, desindexar_archivados, indexar_archivados
+from migraciones import CrearTabla, Paso
+
+
+class CrearIndiceBusquedaArchivo(Paso):
+    """Crear el índice de los mensajes archivados (vacío)"""
+
+    descripcion = "Crear índice de búsqueda de 'bloque_mensajes'"
+
+    def pendiente(self, conn, metadata):
+        return bool(ddl_busqueda_archivo(conn.dialect.name)) and not inspect(conn).has_table('mensaje_archivado_fts')
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        for sentencia in ddl_busqueda_archivo(conn.dialect.name):
+            conn.execute(text(sentencia))
+        conn.commit()
+
+
+class IndexarArchivo(Paso):
+    """
+    Indexar los mensajes de los bloques ya archivados
+
+    Cada bloque se quita y se vuelve a añadir al índice, así que repetir el
+    paso no duplica nada; se hace commit cada `tamano_lote` mensajes.
+    """
+
+    descripcion = "Indexar los mensajes de 'bloque_mensajes'"
+
+    def estimar(self, conn, metadata):
+        if not inspect(conn).has_table('bloque_mensajes') or not inspect(conn).has_table('mensaje_archivado_fts'):
+            return 0
+        archivados = conn.execute(
+            select(func.coalesce(func.sum(metadata.tables['bloque_mensajes'].c.num_mensajes), 0))
+        ).scalar()
+        return archivados - conn.execute(text('SELECT COUNT(*) FROM mensaje_archivado_fts')).scalar()
+
+    def pendiente(self, conn, metadata):
+        return self.estimar(conn, metadata) > 0
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        bloques = metadata.tables['bloque_mensajes']
+        ultimo_id = 0
+        total = pendientes = 0
+        while True:
+            bloque = conn.execute(
+                select(bloques.c.id, bloques.c.datos).where(bloques.c.id > ultimo_id).order_by(bloques.c.id).limit(1)
+            ).first()
+            if bloque is None:
+                break
+            mensajes = descomprimir(bloque.datos)
+            desindexar_archivados(conn, [m['id'] for m in mensajes])
+            indexar_archivados(conn, mensajes)
+            ultimo_id = bloque.id
+            total += len(mensajes)
+            pendientes += len(mensajes)
+            if pendientes >= tamano_lote:
+                conn.commit()
+                pendientes = 0
+                print(f"      ... {total} mensajes indexados")
+        conn.commit()
+
+
+DESCRIPCION = 'Archivo de mensajes antiguos'
+
+PASOS = [
+    CrearTabla('bloque_mensajes'),
+    CrearIndiceBusquedaArchivo(),
+    IndexarArchivo(),
+]
@@ -0,0 +1,49 @@
+"""Resumen diario de reservas para los informes de temporada"""
+
+from datetime import date
+
+from sqlalchemy import func, inspect, select, text
+
+from informes import recalcular_rango
+from migraciones import CrearTabla, Paso
+
+
+class RellenarResumenDiario(Paso):
+    """Agregar las reservas existentes, un año por lote"""
+
+    descripcion = "Rellenar 'resumen_diario' con las reservas existentes"
+
+    # Reservas de días que aún no están en el resumen
+    SIN_RESUMEN = (
+        'SELECT COUNT(*) FROM reserva WHERE NOT EXISTS '
+        '(SELECT 1 FROM resumen_diario WHERE resumen_diario.fecha = reserva.fecha_evento)'
+    )
+
+    def pendiente(self, conn, metadata):
+        return self.estimar(conn, metadata) > 0
+
+    def estimar(self, conn, metadata):
+        if not inspect(conn).has_table('reserva'):
+            return 0
+        if not inspect(conn).has_table('resumen_diario'):
+            return conn.execute(text('SELECT COUNT(*) FROM reserva')).scalar()
+        return conn.execute(text(self.SIN_RESUMEN)).scalar()
+
+    def aplicar(self, conn, metadata, tamano_lote):
+        reserva = metadata.tables['reserva']
+        resumen = metadata.tables['resumen_diario']
+        primera, ultima = conn.execute(
+            select(func.min(reserva.c.fecha_evento), func.max(reserva.c.fecha_evento))
+        ).one()
+        for anio in range(primera.year, ultima.year + 1):
+            recalcular_rango(conn, reserva, resumen, date(anio, 1, 1), date(anio, 12, 31))
+            conn.commit()
+            print(f"      ... {anio} agregado")
+
+
+DESCRIPCION = 'Resumen diario para informes'
+
+PASOS = [
+    CrearTabla('resumen_diario'),
+    RellenarResumenDiario(),
+]
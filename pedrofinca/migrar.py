@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Aplicar las migraciones pendientes de la base de datos
+
+Uso:
+    python migrar.py              aplicar las versiones pendientes
+    python migrar.py --simular    mostrar los pasos pendientes y las filas estimadas sin cambiar nada
+    python migrar.py --estado     listar las versiones aplicadas y pendientes
+"""
+
+import argparse
+import os
+import sys
+
+# Agregar el directorio actual al path para importar app
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from migraciones import TAMANO_LOTE, migrar, mostrar_estado
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migraciones de la base de datos')
+    parser.add_argument('--simular', action='store_true', help='no aplicar cambios, solo mostrarlos')
+    parser.add_argument('--estado', action='store_true', help='listar las versiones')
+    parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='filas por lote en los rellenos')
+    args = parser.parse_args()
+
+    # Importar después de configurar el path
+    from app import app, db
+
+    with app.app_context():
+        if args.estado:
+            mostrar_estado(db.engine)
+            sys.exit(0)
+
+        try:
+            total = migrar(db.engine, db.metadata, simular=args.simular, tamano_lote=args.lote)
+        except Exception as e:
+            print(f"\n❌ Error en la migración: {str(e)}")
+            print("   Los pasos ya aplicados se conservan; vuelve a ejecutar el script para continuar")
+            sys.exit(1)
+
+        if args.simular and total:
+            print(f"\n📝 {total} versiones pendientes (simulación, no se ha cambiado nada)")
+        elif total:
+            print(f"\n✅ {total} versiones aplicadas")
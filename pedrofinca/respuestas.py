@@ -0,0 +1,150 @@
+"""
+Serialización y compresión de las respuestas
+
+Con orjson instalado (pip install orjson) todos los jsonify de la
+aplicación lo usan: es varias veces más rápido que el módulo json. Sin
+orjson se usa el de la biblioteca estándar. En los dos casos las fechas
+salen en el mismo formato que con el proveedor por defecto de Flask.
+
+Los listados grandes se envían como un array JSON en streaming
+(respuesta_json_lista) y las respuestas de texto se comprimen con gzip, o
+con brotli si está instalado (pip install brotli), según Accept-Encoding.
+"""
+
+import zlib
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Tipos de contenido que merece la pena comprimir (no imágenes ni eventos SSE)
+TIPOS_COMPRIMIBLES = frozenset((
+    'application/json', 'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'image/svg+xml',
+))
+
+
+# ============= JSON =============
+
+class ProveedorJSON(DefaultJSONProvider):
+    """Proveedor JSON de Flask que usa orjson cuando está disponible"""
+
+    def a_bytes(self, obj, indentar=False):
+        """Serializar a bytes UTF-8"""
+        if orjson is None:
+            if indentar:
+                return super().dumps(obj, indent=2).encode('utf-8')
+            return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+
+        opciones = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            opciones |= orjson.OPT_SORT_KEYS
+        if indentar:
+            opciones |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=opciones)
+
+    def dumps(self, obj, **kwargs):
+        # Con opciones del módulo json (indent, cls...) se usa el proveedor normal
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.a_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indentar = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.a_bytes(obj, indentar) + b'\n', mimetype=self.mimetype)
+
+
+def respuesta_json_lista(app, elementos):
+    """
+    Array JSON enviado en streaming a medida que se recorren los elementos
+    Hay que envolver el iterable con stream_with_context si consulta la base de datos.
+    """
+    a_bytes = app.json.a_bytes
+
+    def generar():
+        separador = b'['
+        for elemento in elementos:
+            yield separador + a_bytes(elemento)
+            separador = b','
+        yield b'[]\n' if separador == b'[' else b']\n'
+
+    return app.response_class(generar(), mimetype='application/json')
+
+
+# ============= COMPRESIÓN =============
+
+def codificacion_aceptada(accept_encodings):
+    """'br', 'gzip' o None según la cabecera Accept-Encoding del cliente"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compresor(codificacion, nivel_gzip, nivel_brotli):
+    """Funciones (comprimir trozo, terminar) de un compresor incremental"""
+    if codificacion == 'br':
+        compresor = brotli.Compressor(quality=nivel_brotli)
+        return compresor.process, compresor.finish
+    compresor = zlib.compressobj(nivel_gzip, zlib.DEFLATED, 31)  # 31: formato gzip
+    return compresor.compress, compresor.flush
+
+
+def _comprimir_flujo(trozos, comprimir, terminar):
+    try:
+        for trozo in trozos:
+            datos = comprimir(trozo.encode('utf-8') if isinstance(trozo, str) else trozo)
+            if datos:
+                yield datos
+        yield terminar()
+    finally:
+        if hasattr(trozos, 'close'):
+            trozos.close()
+
+
+def comprimir_respuesta(respuesta, accept_encodings, minimo=1024, nivel_gzip=6, nivel_brotli=4):
+    """Comprimir la respuesta si el cliente lo admite y el contenido lo merece"""
+    if (respuesta.status_code < 200 or respuesta.status_code in (204, 206, 304)
+            or 'Content-Encoding' in respuesta.headers
+            or respuesta.mimetype not in TIPOS_COMPRIMIBLES):
+        return respuesta
+
+    respuesta.vary.add('Accept-Encoding')
+    codificacion = codificacion_aceptada(accept_encodings)
+    if not codificacion:
+        return respuesta
+
+    comprimir, terminar = _compresor(codificacion, nivel_gzip, nivel_brotli)
+    if respuesta.is_streamed:
+        # Se comprime a medida que se genera; la longitud final no se conoce
+        respuesta.response = _comprimir_flujo(respuesta.response, comprimir, terminar)
+        respuesta.direct_passthrough = False
+        respuesta.headers.pop('Content-Length', None)
+    else:
+        datos = respuesta.get_data()
+        if len(datos) < minimo:
+            return respuesta
+        respuesta.set_data(comprimir(datos) + terminar())
+
+    respuesta.headers['Content-Encoding'] = codificacion
+
+    # La versión comprimida no es idéntica byte a byte: el ETag pasa a ser débil
+    etag, debil = respuesta.get_etag()
+    if etag and not debil:
+        respuesta.set_etag(etag, weak=True)
+    return respuesta
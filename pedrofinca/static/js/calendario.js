@@ -20,7 +20,11 @@ function inicializarCalendario() {
             week: 'Semana',
             list: 'Lista'
         },
-        events: '/api/reservas',
+        eventSources: [
+            '/api/reservas',
+            // Días libres y parcialmente ocupados como fondo del calendario
+            { events: cargarDisponibilidad }
+        ],
         eventClick: function(info) {
             mostrarDetalleReserva(info.event);
         },
@@ -38,6 +42,34 @@ function inicializarCalendario() {
     });
     
     calendar.render();
+    
+    // Reservas más recientes que las que mostró la copia sin conexión
+    window.addEventListener('datos-actualizados', function(e) {
+        if (e.detail.url.startsWith('/api/reservas')) calendar.refetchEvents();
+    });
+}
+
+async function cargarDisponibilidad(info, exito, fallo) {
+    try {
+        const response = await fetch(`/api/disponibilidad?start=${info.startStr.slice(0, 10)}&end=${info.endStr.slice(0, 10)}`);
+        const datos = await response.json();
+        
+        const colores = { libre: '#d8f3dc', parcial: '#fff3bf' };
+        exito(datos.dias
+            .filter(dia => colores[dia.estado])
+            .map(dia => ({
+                start: dia.fecha,
+                allDay: true,
+                display: 'background',
+                backgroundColor: colores[dia.estado],
+                title: dia.estado === 'parcial'
+                    ? 'Libre: ' + dia.huecos.map(h => `${h.inicio}-${h.fin}`).join(', ')
+                    : ''
+            })));
+    } catch (error) {
+        console.error('Error al cargar la disponibilidad:', error);
+        fallo(error);
+    }
 }
 
 function mostrarDetalleReserva(event) {
@@ -154,15 +186,19 @@ async function guardarReserva() {
 
         const respuestas = await Promise.all(promesas);
         
-        const exitos = respuestas.filter(r => r.ok).length;
-        const fallos = respuestas.length - exitos;
+        // 202: sin conexión, el service worker las enviará al recuperarla
+        const pendientes = respuestas.filter(r => r.status === 202).length;
+        const exitos = respuestas.filter(r => r.ok).length - pendientes;
+        const fallos = respuestas.length - exitos - pendientes;
 
         bootstrap.Modal.getInstance(document.getElementById('nuevaReservaModal')).hide();
         calendar.refetchEvents();
         form.reset();
         limpiarFormularioCalendario();
 
-        if (fallos === 0) {
+        if (pendientes > 0 && fallos === 0) {
+            mostrarAlerta('warning', `📥 Sin conexión: ${pendientes} reserva(s) se guardarán al recuperar la conexión`);
+        } else if (fallos === 0) {
             mostrarAlerta('success', `✅ ${exitos} reserva(s) creada(s) correctamente`);
         } else {
             mostrarAlerta('warning', `⚠️ Se crearon ${exitos} reservas, pero ${fallos} fallaron.`);
@@ -224,7 +260,7 @@ async function enviarWhatsAppReservaActual() {
         const result = await response.json();
         
         if (response.ok) {
-            mostrarAlerta('success', 'Mensaje enviado correctamente');
+            mostrarAlerta('success', result.message || 'Mensaje enviado correctamente');
         } else {
             mostrarAlerta('warning', result.message || result.error);
         }
@@ -1,166 +1,132 @@
 // Dashboard functionality
 
 document.addEventListener('DOMContentLoaded', function() {
-    cargarEstadisticas();
-    cargarProximasReservas();
+    // dashboard.js también se carga en la página de reservas, sin panel
+    if (document.getElementById('reservas-mes')) {
+        cargarEstadisticas();
+        window.addEventListener('datos-actualizados', function(e) {
+            if (e.detail.url === '/api/dashboard/stats' || e.detail.url === '/api/reservas') cargarEstadisticas();
+        });
+    }
 });
 
 async function cargarEstadisticas() {
     try {
-        const response = await fetch('/api/reservas');
-        const reservas = await response.json();
-        
-        // Fecha actual
-        const hoy = new Date();
-        const primerDiaMes = new Date(hoy.getFullYear(), hoy.getMonth(), 1);
-        const ultimoDiaMes = new Date(hoy.getFullYear(), hoy.getMonth() + 1, 0);
-        
-        // Filtrar reservas del mes actual
-        const reservasMes = reservas.filter(r => {
-            const fechaReserva = new Date(r.start);
-            return fechaReserva >= primerDiaMes && fechaReserva <= ultimoDiaMes;
-        });
+        // Los agregados se calculan en el servidor (una sola petición)
+        const response = await fetch('/api/dashboard/stats');
+        const stats = await response.json();
         
-        // Actualizar contador de reservas
-        document.getElementById('reservas-mes').textContent = reservasMes.length;
+        document.getElementById('reservas-mes').textContent = stats.mes.reservas;
+        document.getElementById('ingresos-mes').textContent = stats.mes.ingresos.toFixed(2) + '€';
+        document.getElementById('mensajes-enviados').textContent = stats.mensajes_enviados;
         
-        // Calcular ingresos del mes
-        const ingresos = reservasMes.reduce((sum, r) => sum + (r.precio || 0), 0);
-        document.getElementById('ingresos-mes').textContent = ingresos.toFixed(2) + '€';
-        
-        // Buscar próxima reserva
-        const reservasFuturas = reservas
-            .filter(r => new Date(r.start) >= hoy)
-            .sort((a, b) => new Date(a.start) - new Date(b.start));
-        
-        if (reservasFuturas.length > 0) {
-            const proxima = reservasFuturas[0];
-            const fechaProxima = new Date(proxima.start);
+        if (stats.proxima_reserva) {
+            const fechaProxima = new Date(stats.proxima_reserva.start);
             document.getElementById('proxima-reserva').textContent = 
                 fechaProxima.toLocaleDateString('es-ES', { day: '2-digit', month: 'short' });
         }
         
-        // Crear gráfico de tipos de celebración
-        crearGraficoTipos(reservas);
+        mostrarProximasReservas(stats.proximas_reservas);
+        crearGraficoTipos(stats.tipos_celebracion);
         
     } catch (error) {
         console.error('Error al cargar estadísticas:', error);
     }
 }
 
-async function cargarProximasReservas() {
-    try {
-        const response = await fetch('/api/reservas');
-        const reservas = await response.json();
-        
-        const hoy = new Date();
-        const proximasReservas = reservas
-            .filter(r => new Date(r.start) >= hoy)
-            .sort((a, b) => new Date(a.start) - new Date(b.start))
-            .slice(0, 5);
-        
-        const tbody = document.getElementById('proximas-reservas-table');
-        const cardsContainer = document.getElementById('proximas-reservas-cards');
+function mostrarProximasReservas(proximasReservas) {
+    const tbody = document.getElementById('proximas-reservas-table');
+    const cardsContainer = document.getElementById('proximas-reservas-cards');
+    
+    if (proximasReservas.length === 0) {
+        // Tabla desktop
+        tbody.innerHTML = '<tr><td colspan="5" class="text-center text-muted">No hay próximas reservas</td></tr>';
         
-        if (proximasReservas.length === 0) {
-            // Tabla desktop
-            tbody.innerHTML = '<tr><td colspan="5" class="text-center text-muted">No hay próximas reservas</td></tr>';
-            
-            // Cards móvil
-            cardsContainer.innerHTML = `
-                <div class="card">
-                    <div class="card-body text-center text-muted py-5">
-                        <i class="bi bi-calendar-x" style="font-size: 3rem;"></i>
-                        <p class="mt-3 mb-0">No hay próximas reservas</p>
-                    </div>
+        // Cards móvil
+        cardsContainer.innerHTML = `
+            <div class="card">
+                <div class="card-body text-center text-muted py-5">
+                    <i class="bi bi-calendar-x" style="font-size: 3rem;"></i>
+                    <p class="mt-3 mb-0">No hay próximas reservas</p>
                 </div>
-            `;
-            return;
-        }
-        
-        // Generar filas para tabla (desktop)
-        tbody.innerHTML = proximasReservas.map(r => {
-            const fecha = new Date(r.start);
-            return `
-                <tr>
-                    <td><strong>${fecha.toLocaleDateString('es-ES')}</strong></td>
-                    <td><strong>${r.cliente}</strong></td>
-                    <td class="d-none d-lg-table-cell">${r.title.split(' - ')[1] || 'Evento'}</td>
-                    <td class="d-none d-lg-table-cell">${r.invitados || '-'}</td>
-                    <td><strong>${r.precio ? r.precio.toFixed(2) + '€' : '-'}</strong></td>
-                </tr>
-            `;
-        }).join('');
+            </div>
+        `;
+        return;
+    }
+    
+    // Generar filas para tabla (desktop)
+    tbody.innerHTML = proximasReservas.map(r => {
+        const fecha = new Date(r.start);
+        return `
+            <tr>
+                <td><strong>${fecha.toLocaleDateString('es-ES')}</strong></td>
+                <td><strong>${r.cliente}</strong></td>
+                <td class="d-none d-lg-table-cell">${r.title.split(' - ')[1] || 'Evento'}</td>
+                <td class="d-none d-lg-table-cell">${r.invitados || '-'}</td>
+                <td><strong>${r.precio ? r.precio.toFixed(2) + '€' : '-'}</strong></td>
+            </tr>
+        `;
+    }).join('');
+    
+    // Generar cards para móvil
+    cardsContainer.innerHTML = proximasReservas.map((r, index) => {
+        const fecha = new Date(r.start);
+        const tipo = r.title.split(' - ')[1] || 'Evento';
+        const estado = 'confirmada'; // Por defecto, ajustar según tu lógica
         
-        // Generar cards para móvil
-        cardsContainer.innerHTML = proximasReservas.map((r, index) => {
-            const fecha = new Date(r.start);
-            const tipo = r.title.split(' - ')[1] || 'Evento';
-            const estado = 'confirmada'; // Por defecto, ajustar según tu lógica
-            
-            return `
-                <div class="card mb-2 reserva-card" data-estado="${estado}">
-                    <div class="card-header" data-bs-toggle="collapse" data-bs-target="#proxima${index}" style="cursor: pointer;">
-                        <div class="d-flex justify-content-between align-items-center">
-                            <div class="flex-grow-1">
-                                <h6 class="mb-1">
-                                    <i class="bi bi-calendar-event"></i> ${fecha.toLocaleDateString('es-ES')}
-                                </h6>
-                                <div class="text-muted small">
-                                    <i class="bi bi-person"></i> ${r.cliente}
-                                </div>
-                            </div>
-                            <div class="text-end">
-                                <span class="badge bg-success mb-2">✓</span>
-                                <div class="small"><strong>${r.precio ? r.precio.toFixed(2) + '€' : '-'}</strong></div>
+        return `
+            <div class="card mb-2 reserva-card" data-estado="${estado}">
+                <div class="card-header" data-bs-toggle="collapse" data-bs-target="#proxima${index}" style="cursor: pointer;">
+                    <div class="d-flex justify-content-between align-items-center">
+                        <div class="flex-grow-1">
+                            <h6 class="mb-1">
+                                <i class="bi bi-calendar-event"></i> ${fecha.toLocaleDateString('es-ES')}
+                            </h6>
+                            <div class="text-muted small">
+                                <i class="bi bi-person"></i> ${r.cliente}
                             </div>
                         </div>
+                        <div class="text-end">
+                            <span class="badge bg-success mb-2">✓</span>
+                            <div class="small"><strong>${r.precio ? r.precio.toFixed(2) + '€' : '-'}</strong></div>
+                        </div>
                     </div>
-                    <div class="collapse" id="proxima${index}">
-                        <div class="card-body">
-                            <div class="row g-2">
-                                <div class="col-6">
-                                    <small class="text-muted d-block">Tipo de Evento</small>
-                                    <strong>${tipo}</strong>
-                                </div>
-                                ${r.invitados ? `
-                                <div class="col-6">
-                                    <small class="text-muted d-block">Invitados</small>
-                                    <strong><i class="bi bi-people"></i> ${r.invitados}</strong>
-                                </div>
-                                ` : ''}
-                                <div class="col-12 mt-2">
-                                    <small class="text-muted d-block">Precio Total</small>
-                                    <h5 class="mb-0 text-success">${r.precio ? r.precio.toFixed(2) + '€' : '-'}</h5>
-                                </div>
+                </div>
+                <div class="collapse" id="proxima${index}">
+                    <div class="card-body">
+                        <div class="row g-2">
+                            <div class="col-6">
+                                <small class="text-muted d-block">Tipo de Evento</small>
+                                <strong>${tipo}</strong>
+                            </div>
+                            ${r.invitados ? `
+                            <div class="col-6">
+                                <small class="text-muted d-block">Invitados</small>
+                                <strong><i class="bi bi-people"></i> ${r.invitados}</strong>
+                            </div>
+                            ` : ''}
+                            <div class="col-12 mt-2">
+                                <small class="text-muted d-block">Precio Total</small>
+                                <h5 class="mb-0 text-success">${r.precio ? r.precio.toFixed(2) + '€' : '-'}</h5>
                             </div>
                         </div>
                     </div>
                 </div>
-            `;
-        }).join('');
-        
-    } catch (error) {
-        console.error('Error al cargar próximas reservas:', error);
-    }
+            </div>
+        `;
+    }).join('');
 }
 
-function crearGraficoTipos(reservas) {
-    const tipos = {};
-    reservas.forEach(r => {
-        const tipo = r.title.split(' - ')[1] || 'Otro';
-        tipos[tipo] = (tipos[tipo] || 0) + 1;
-    });
-    
+function crearGraficoTipos(tiposCelebracion) {
     const ctx = document.getElementById('tiposCelebracionChart');
     if (!ctx) return;
     
     new Chart(ctx, {
         type: 'doughnut',
         data: {
-            labels: Object.keys(tipos),
+            labels: tiposCelebracion.map(t => t.tipo),
             datasets: [{
-                data: Object.values(tipos),
+                data: tiposCelebracion.map(t => t.total),
                 backgroundColor: [
                     '#7a9d8d', // Verde pastel oscuro
                     '#6b8d7d', // Menta oscuro
@@ -438,11 +404,14 @@ async function guardarReserva() {
         // Esperar a que todas las reservas se creen
         const respuestas = await Promise.all(promesas);
         
-        // Verificar que todas fueron exitosas
-        const exitos = respuestas.filter(r => r.ok).length;
-        const fallos = respuestas.length - exitos;
-
-        if (fallos === 0) {
+        // Verificar que todas fueron exitosas (202: sin conexión, se enviarán al recuperarla)
+        const pendientes = respuestas.filter(r => r.status === 202).length;
+        const exitos = respuestas.filter(r => r.ok).length - pendientes;
+        const fallos = respuestas.length - exitos - pendientes;
+
+        if (pendientes > 0 && fallos === 0) {
+            alert(`📥 Sin conexión: ${pendientes} reserva(s) se guardarán al recuperar la conexión`);
+        } else if (fallos === 0) {
             alert(`✅ ${exitos} reserva(s) creada(s) correctamente`);
             location.reload();
         } else {
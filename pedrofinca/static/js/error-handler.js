@@ -102,7 +102,8 @@ class NotificationSystem {
     escapeHtml(text) {
         const div = document.createElement('div');
         div.textContent = text;
-        return div.innerHTML;
+        // innerHTML no escapa las comillas: hacen falta para usarlo en atributos
+        return div.innerHTML.replace(/"/g, '&quot;').replace(/'/g, '&#39;');
     }
 
     /**
@@ -558,7 +559,8 @@ class ConfirmDialog {
     static escapeHtml(text) {
         const div = document.createElement('div');
         div.textContent = text;
-        return div.innerHTML;
+        // innerHTML no escapa las comillas: hacen falta para usarlo en atributos
+        return div.innerHTML.replace(/"/g, '&quot;').replace(/'/g, '&#39;');
     }
 
     /**
@@ -648,7 +650,8 @@ class LoadingOverlay {
     static escapeHtml(text) {
         const div = document.createElement('div');
         div.textContent = text;
-        return div.innerHTML;
+        // innerHTML no escapa las comillas: hacen falta para usarlo en atributos
+        return div.innerHTML.replace(/"/g, '&quot;').replace(/'/g, '&#39;');
     }
 }
 
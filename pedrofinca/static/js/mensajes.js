@@ -3,14 +3,106 @@
 let conversacionActual = null;
 let intervalActualizacion = null;
 
+// Cursores de la conversación abierta (ids del primer y último mensaje cargados)
+let primerIdMensaje = null;
+let ultimoIdMensaje = null;
+let cargandoAnteriores = false;
+let hayMensajesAnteriores = true;
+const MENSAJES_POR_PAGINA = 50;
+
+// Canal de eventos en tiempo real (SSE). Mientras está conectado el polling
+// baja a una consulta de seguridad cada minuto: con EVENTOS_BACKEND=memoria y
+// varios workers, los eventos de otro worker no llegan a esta conexión
+let fuenteEventos = null;
+let eventosConectados = false;
+const POLLING_SEGURIDAD_MS = 60000;
+const REINTENTO_EVENTOS_MS = 60000;  // tras un rechazo del servidor (503 con el límite de conexiones)
+let ultimaRecargaConversaciones = 0;
+let ultimaRecargaMensajes = 0;
+let temporizadorConversaciones = null;
+
+// Búsqueda de texto completo: mientras hay una búsqueda no se refresca la lista
+let textoBusqueda = '';
+let resultadosBusqueda = [];
+let temporizadorBusqueda = null;
+
 document.addEventListener('DOMContentLoaded', function() {
     cargarConversaciones();
     configurarWebhookUrl();
     
-    // Actualizar conversaciones cada 10 segundos
-    setInterval(cargarConversaciones, 10000);
+    document.getElementById('buscarMensajes').addEventListener('input', function() {
+        clearTimeout(temporizadorBusqueda);
+        temporizadorBusqueda = setTimeout(() => buscarMensajes(this.value.trim()), 300);
+    });
+    
+    // Cargar mensajes anteriores al llegar arriba del todo
+    document.getElementById('areaConversacion').addEventListener('scroll', function() {
+        if (this.scrollTop === 0) {
+            cargarMensajesAnteriores();
+        }
+    });
+    
+    iniciarEventos();
+    
+    // Conversaciones más recientes que las que mostró la copia sin conexión
+    window.addEventListener('datos-actualizados', function(e) {
+        if (e.detail.url === '/api/mensajes/agrupados' || e.detail.url === '/api/whatsapp/enviar') {
+            cargarConversaciones();
+        }
+    });
+    
+    // Polling de respaldo cada 10 segundos (cada minuto si hay canal de eventos)
+    setInterval(() => {
+        if (!eventosConectados || Date.now() - ultimaRecargaConversaciones >= POLLING_SEGURIDAD_MS) {
+            ultimaRecargaConversaciones = Date.now();
+            cargarConversaciones();
+        }
+    }, 10000);
 });
 
+function iniciarEventos() {
+    if (!window.EventSource) return;
+    
+    fuenteEventos = new EventSource('/api/eventos');
+    
+    fuenteEventos.addEventListener('open', function() {
+        const reconexion = !eventosConectados;
+        eventosConectados = true;
+        
+        // Recuperar lo que haya llegado mientras estaba desconectado
+        if (reconexion) {
+            cargarConversaciones();
+            if (conversacionActual) cargarMensajesNuevos(conversacionActual);
+        }
+    });
+    
+    fuenteEventos.addEventListener('error', function() {
+        // EventSource reintenta solo; mientras tanto vuelve el polling
+        eventosConectados = false;
+        // Si el servidor rechazó la conexión no reintenta: volver a probar más tarde
+        if (fuenteEventos.readyState === EventSource.CLOSED) {
+            setTimeout(iniciarEventos, REINTENTO_EVENTOS_MS);
+        }
+    });
+    
+    fuenteEventos.addEventListener('mensaje', function(e) {
+        const evento = JSON.parse(e.data);
+        
+        if (conversacionActual && evento.telefono === conversacionActual) {
+            if (ultimoIdMensaje && evento.id <= ultimoIdMensaje) {
+                // Mensaje ya mostrado: solo cambia su estado (en cola -> enviado/fallido)
+                actualizarEstadoMensaje(evento.id, evento.estado);
+            } else {
+                cargarMensajesNuevos(conversacionActual);
+            }
+        }
+        
+        // Agrupar ráfagas de mensajes en una sola recarga de la lista
+        clearTimeout(temporizadorConversaciones);
+        temporizadorConversaciones = setTimeout(cargarConversaciones, 1000);
+    });
+}
+
 function configurarWebhookUrl() {
     const baseUrl = window.location.origin;
     const webhookUrl = `${baseUrl}/api/whatsapp/webhook`;
@@ -26,14 +118,9 @@ function copiarWebhook() {
 }
 
 async function cargarConversaciones() {
+    if (textoBusqueda) return;
+    
     try {
-        const response = await fetch('/mensajes');
-        const html = await response.text();
-        
-        // Extraer datos de mensajes del servidor
-        const parser = new DOMParser();
-        const doc = parser.parseFromString(html, 'text/html');
-        
         // Obtener todos los mensajes únicos por teléfono
         const mensajes = await fetch('/api/mensajes/agrupados');
         
@@ -78,6 +165,55 @@ function mostrarListaConversaciones(conversaciones) {
     `).join('');
 }
 
+async function buscarMensajes(texto) {
+    textoBusqueda = texto;
+    if (!texto) {
+        cargarConversaciones();
+        return;
+    }
+    
+    try {
+        const respuesta = await fetch('/api/buscar?' + new URLSearchParams({ q: texto, tipo: 'mensajes' }));
+        if (!respuesta.ok) return;
+        
+        const datos = await respuesta.json();
+        if (texto !== textoBusqueda) return;  // Respuesta antigua: ya se ha escrito otra cosa
+        
+        resultadosBusqueda = datos.mensajes.resultados;
+        mostrarResultadosBusqueda(datos.mensajes.hay_mas);
+        
+    } catch (error) {
+        console.error('Error al buscar mensajes:', error);
+    }
+}
+
+function mostrarResultadosBusqueda(hayMas) {
+    const lista = document.getElementById('listaConversaciones');
+    
+    if (resultadosBusqueda.length === 0) {
+        lista.innerHTML = '<div class="text-center p-3 text-muted">Sin resultados</div>';
+        return;
+    }
+    
+    // El fragmento llega con el HTML escapado y las coincidencias entre <mark>
+    lista.innerHTML = resultadosBusqueda.map((r, i) => `
+        <a href="#" class="list-group-item list-group-item-action ${r.telefono === conversacionActual ? 'active' : ''}"
+           onclick="abrirResultadoBusqueda(${i}); return false;">
+            <div class="d-flex w-100 justify-content-between">
+                <h6 class="mb-1">${notifications.escapeHtml(r.nombre)}</h6>
+                <small>${r.fecha}</small>
+            </div>
+            <p class="mb-1 small">${r.fragmento}</p>
+        </a>
+    `).join('') + (hayMas ? '<div class="text-center p-2 small text-muted">Hay más resultados: añade más palabras</div>' : '');
+}
+
+function abrirResultadoBusqueda(indice) {
+    const resultado = resultadosBusqueda[indice];
+    abrirConversacion(resultado.telefono, resultado.nombre);
+    mostrarResultadosBusqueda(false);
+}
+
 async function abrirConversacion(telefono, nombre) {
     conversacionActual = telefono;
     
@@ -92,18 +228,34 @@ async function abrirConversacion(telefono, nombre) {
     // Actualizar lista de conversaciones
     cargarConversaciones();
     
-    // Iniciar actualización automática cada 5 segundos
+    // Iniciar actualización automática cada 5 segundos (solo mensajes nuevos;
+    // cada minuto si hay canal de eventos)
     if (intervalActualizacion) {
         clearInterval(intervalActualizacion);
     }
-    intervalActualizacion = setInterval(() => cargarMensajes(telefono), 5000);
+    ultimaRecargaMensajes = Date.now();
+    intervalActualizacion = setInterval(() => {
+        if (!eventosConectados || Date.now() - ultimaRecargaMensajes >= POLLING_SEGURIDAD_MS) {
+            ultimaRecargaMensajes = Date.now();
+            cargarMensajesNuevos(telefono);
+        }
+    }, 5000);
+}
+
+function urlConversacion(telefono, parametros) {
+    const query = new URLSearchParams(parametros).toString();
+    return `/api/conversacion/${encodeURIComponent(telefono)}${query ? '?' + query : ''}`;
 }
 
 async function cargarMensajes(telefono) {
     try {
-        const response = await fetch(`/api/conversacion/${encodeURIComponent(telefono)}`);
+        const response = await fetch(urlConversacion(telefono, { limit: MENSAJES_POR_PAGINA }));
         const mensajes = await response.json();
         
+        primerIdMensaje = mensajes.length ? mensajes[0].id : null;
+        ultimoIdMensaje = mensajes.length ? mensajes[mensajes.length - 1].id : null;
+        hayMensajesAnteriores = mensajes.length === MENSAJES_POR_PAGINA;
+        
         mostrarMensajes(mensajes);
         
     } catch (error) {
@@ -113,6 +265,128 @@ async function cargarMensajes(telefono) {
     }
 }
 
+async function cargarMensajesNuevos(telefono) {
+    // Sin mensajes previos no hay cursor: recargar la última página
+    if (!ultimoIdMensaje) {
+        await cargarMensajes(telefono);
+        return;
+    }
+    
+    try {
+        const response = await fetch(urlConversacion(telefono, { after: ultimoIdMensaje }));
+        
+        // El último mensaje mostrado ya no existe (p. ej. se borró su reserva): recargar
+        if (response.status === 400) {
+            if (telefono === conversacionActual) await cargarMensajes(telefono);
+            return;
+        }
+        const mensajes = await response.json();
+        
+        // Ignorar respuestas de una conversación que ya no está abierta
+        if (telefono !== conversacionActual || mensajes.length === 0) return;
+        
+        ultimoIdMensaje = mensajes[mensajes.length - 1].id;
+        
+        const area = document.getElementById('areaConversacion');
+        area.insertAdjacentHTML('beforeend', mensajes.map(htmlMensaje).join(''));
+        area.scrollTop = area.scrollHeight;
+        
+    } catch (error) {
+        console.error('Error al cargar mensajes nuevos:', error);
+    }
+}
+
+async function cargarMensajesAnteriores() {
+    if (!conversacionActual || !primerIdMensaje || !hayMensajesAnteriores || cargandoAnteriores) return;
+    
+    cargandoAnteriores = true;
+    const telefono = conversacionActual;
+    
+    try {
+        const response = await fetch(urlConversacion(telefono, {
+            before: primerIdMensaje,
+            limit: MENSAJES_POR_PAGINA
+        }));
+        if (telefono !== conversacionActual) return;
+        
+        // El primer mensaje mostrado ya no existe: no se puede seguir retrocediendo
+        if (response.status === 400) {
+            hayMensajesAnteriores = false;
+            return;
+        }
+        const mensajes = await response.json();
+        
+        hayMensajesAnteriores = mensajes.length === MENSAJES_POR_PAGINA;
+        if (mensajes.length === 0) return;
+        
+        primerIdMensaje = mensajes[0].id;
+        
+        // Mantener la posición de lectura al insertar por arriba
+        const area = document.getElementById('areaConversacion');
+        const alturaAnterior = area.scrollHeight;
+        area.insertAdjacentHTML('afterbegin', mensajes.map(htmlMensaje).join(''));
+        area.scrollTop = area.scrollHeight - alturaAnterior;
+        
+    } catch (error) {
+        console.error('Error al cargar mensajes anteriores:', error);
+    } finally {
+        cargandoAnteriores = false;
+    }
+}
+
+function htmlMensaje(msg) {
+    const esSaliente = msg.direccion === 'saliente';
+    const claseAlineacion = esSaliente ? 'text-end' : 'text-start';
+    const claseBurbuja = esSaliente ? 'bg-success text-white' : 'bg-white';
+    
+    return `
+        <div class="${claseAlineacion} mb-2" data-mensaje-id="${msg.id}">
+            <div class="d-inline-block ${claseBurbuja} rounded px-3 py-2" style="max-width: 70%;">
+                ${htmlMultimedia(msg)}
+                <div style="white-space: pre-wrap;">${notifications.escapeHtml(msg.contenido || '')}</div>
+                <small class="d-block mt-1" style="font-size: 0.75rem; opacity: 0.8;">
+                    ${msg.fecha}
+                    <span class="estado-mensaje">${esSaliente ? getEstadoIcono(msg.estado) : ''}</span>
+                </small>
+            </div>
+        </div>
+    `;
+}
+
+// Solo se enlazan URLs https o copias locales (/media/...): las URLs llegan en el webhook
+function urlMultimediaSegura(url) {
+    if (typeof url !== 'string') return null;
+    if (url.startsWith('/media/')) return url;
+    try {
+        return new URL(url).protocol === 'https:' ? url : null;
+    } catch (error) {
+        return null;
+    }
+}
+
+function htmlMultimedia(msg) {
+    if (!msg.media_urls || msg.media_urls.length === 0) return '';
+    
+    return msg.media_urls.map((url, i) => {
+        // Preferir la copia local (caché del servidor) si ya está descargada
+        const local = msg.media_locales ? msg.media_locales[i] : null;
+        const original = urlMultimediaSegura(local ? local.url : url);
+        if (!original) return '';
+        const tipo = (msg.media_types && msg.media_types[i]) || '';
+        const href = notifications.escapeHtml(original);
+        
+        if (tipo.startsWith('image/')) {
+            const vista = notifications.escapeHtml(
+                (local && urlMultimediaSegura(local.miniatura)) || original
+            );
+            return `<a href="${href}" target="_blank" rel="noopener noreferrer">
+                        <img src="${vista}" loading="lazy" class="rounded mb-1 d-block" style="max-width: 200px;">
+                    </a>`;
+        }
+        return `<a href="${href}" target="_blank" rel="noopener noreferrer" class="d-block mb-1"><i class="bi bi-paperclip"></i> Archivo adjunto</a>`;
+    }).join('');
+}
+
 function mostrarMensajes(mensajes) {
     const area = document.getElementById('areaConversacion');
     
@@ -121,28 +395,19 @@ function mostrarMensajes(mensajes) {
         return;
     }
     
-    area.innerHTML = mensajes.map(msg => {
-        const esSaliente = msg.direccion === 'saliente';
-        const claseAlineacion = esSaliente ? 'text-end' : 'text-start';
-        const claseBurbuja = esSaliente ? 'bg-success text-white' : 'bg-white';
-        
-        return `
-            <div class="${claseAlineacion} mb-2">
-                <div class="d-inline-block ${claseBurbuja} rounded px-3 py-2" style="max-width: 70%;">
-                    <div>${msg.contenido}</div>
-                    <small class="d-block mt-1" style="font-size: 0.75rem; opacity: 0.8;">
-                        ${msg.fecha}
-                        ${esSaliente ? getEstadoIcono(msg.estado) : ''}
-                    </small>
-                </div>
-            </div>
-        `;
-    }).join('');
+    area.innerHTML = mensajes.map(htmlMensaje).join('');
     
     // Scroll al final
     area.scrollTop = area.scrollHeight;
 }
 
+function actualizarEstadoMensaje(id, estado) {
+    const elemento = document.querySelector(`[data-mensaje-id="${id}"] .estado-mensaje`);
+    if (elemento) {
+        elemento.innerHTML = getEstadoIcono(estado);
+    }
+}
+
 function getEstadoIcono(estado) {
     switch(estado) {
         case 'enviado':
@@ -150,6 +415,8 @@ function getEstadoIcono(estado) {
         case 'fallido':
             return '<i class="bi bi-exclamation-circle"></i>';
         case 'pendiente':
+        case 'en_cola':
+        case 'enviando':
             return '<i class="bi bi-clock"></i>';
         default:
             return '';
@@ -180,7 +447,11 @@ async function enviarMensajeRapido(event) {
         
         if (response.ok) {
             document.getElementById('nuevoMensaje').value = '';
-            await cargarMensajes(conversacionActual);
+            if (result.encolado) {
+                mostrarAlerta('warning', result.message);
+            } else {
+                await cargarMensajesNuevos(conversacionActual);
+            }
         } else {
             mostrarAlerta('danger', result.error || 'Error al enviar mensaje');
         }
@@ -211,7 +482,7 @@ function usarPlantilla(tipo) {
 
 async function actualizarConversacion() {
     if (conversacionActual) {
-        await cargarMensajes(conversacionActual);
+        await cargarMensajesNuevos(conversacionActual);
         mostrarAlerta('success', 'Conversación actualizada');
     }
 }
@@ -237,4 +508,7 @@ window.addEventListener('beforeunload', function() {
     if (intervalActualizacion) {
         clearInterval(intervalActualizacion);
     }
+    if (fuenteEventos) {
+        fuenteEventos.close();
+    }
 });
@@ -0,0 +1,44 @@
+// Registro del service worker (PWA) y avisos de las operaciones hechas sin conexión
+
+(function() {
+    if (!('serviceWorker' in navigator)) return;
+
+    navigator.serviceWorker.register('/sw.js')
+        .catch(error => console.log('Error en Service Worker', error));
+
+    function avisar(tipo, mensaje) {
+        if (window.notifications) {
+            notifications.show(mensaje, tipo);
+        } else if (typeof mostrarNotificacion === 'function') {
+            mostrarNotificacion(tipo === 'error' ? 'danger' : tipo, mensaje);
+        } else {
+            console.log(mensaje);
+        }
+    }
+
+    navigator.serviceWorker.addEventListener('message', function(evento) {
+        const datos = evento.data || {};
+
+        if (datos.tipo === 'datos-actualizados') {
+            // Las páginas escuchan este evento para volver a pedir los datos
+            window.dispatchEvent(new CustomEvent('datos-actualizados', { detail: { url: datos.url } }));
+        } else if (datos.tipo === 'reenviado') {
+            if (datos.ok) {
+                avisar('success', `✅ Operación pendiente completada: ${datos.mensaje}`);
+                window.dispatchEvent(new CustomEvent('datos-actualizados', { detail: { url: datos.url } }));
+            } else {
+                avisar('error', `❌ Operación pendiente rechazada: ${datos.mensaje}`);
+            }
+        }
+    });
+
+    // Enviar lo que quedó pendiente al recuperar la conexión (y al abrir cualquier página)
+    function pedirReenvio() {
+        navigator.serviceWorker.ready.then(registro => {
+            if (registro.active) registro.active.postMessage({ tipo: 'reenviar' });
+        });
+    }
+
+    window.addEventListener('online', pedirReenvio);
+    if (navigator.onLine) pedirReenvio();
+})();
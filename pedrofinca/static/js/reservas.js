@@ -1,59 +1,117 @@
 // Reservas functionality
 
+// Filtros y paginación en el servidor: la página solo trae 50 reservas
+let siguienteReserva = null;
+let cargandoReservas = false;
+let peticionReservas = 0;
+let temporizadorBusqueda = null;
+let observadorReservas = null;
+
 document.addEventListener('DOMContentLoaded', function() {
     configurarFiltros();
+    configurarScrollInfinito();
 });
 
 function configurarFiltros() {
     const buscar = document.getElementById('buscarReserva');
-    const filtroEstado = document.getElementById('filtroEstado');
-    const filtroTipo = document.getElementById('filtroTipo');
     
-    buscar.addEventListener('input', filtrarReservas);
-    filtroEstado.addEventListener('change', filtrarReservas);
-    filtroTipo.addEventListener('change', filtrarReservas);
+    // Esperar a que se deje de escribir antes de consultar
+    buscar.addEventListener('input', () => {
+        clearTimeout(temporizadorBusqueda);
+        temporizadorBusqueda = setTimeout(filtrarReservas, 300);
+    });
+    
+    ['filtroEstado', 'filtroTipo', 'filtroDesde', 'filtroHasta'].forEach(id => {
+        document.getElementById(id).addEventListener('change', filtrarReservas);
+    });
 }
 
-function filtrarReservas() {
-    const buscar = document.getElementById('buscarReserva').value.toLowerCase();
-    const estado = document.getElementById('filtroEstado').value;
-    const tipo = document.getElementById('filtroTipo').value;
+function configurarScrollInfinito() {
+    const fin = document.getElementById('finReservas');
+    siguienteReserva = fin.dataset.siguiente || null;
     
-    // Filtrar filas de tabla (desktop)
-    const filas = document.querySelectorAll('#tablaReservas tbody tr');
-    filas.forEach(fila => {
-        const texto = fila.textContent.toLowerCase();
-        const estadoFila = fila.dataset.estado;
-        const tipoFila = fila.dataset.tipo;
-        
-        const coincideBusqueda = texto.includes(buscar);
-        const coincideEstado = !estado || estadoFila === estado;
-        const coincideTipo = !tipo || tipoFila === tipo;
-        
-        if (coincideBusqueda && coincideEstado && coincideTipo) {
-            fila.style.display = '';
-        } else {
-            fila.style.display = 'none';
+    observadorReservas = new IntersectionObserver(entradas => {
+        if (entradas[0].isIntersecting) {
+            cargarMasReservas();
         }
+    }, { rootMargin: '300px' });
+    observadorReservas.observe(fin);
+}
+
+function vigilarFinReservas() {
+    // Volver a observar: si el final sigue visible (pantallas altas) se pide otra página
+    const fin = document.getElementById('finReservas');
+    observadorReservas.unobserve(fin);
+    observadorReservas.observe(fin);
+}
+
+function parametrosFiltro() {
+    const valores = {
+        q: document.getElementById('buscarReserva').value.trim(),
+        estado: document.getElementById('filtroEstado').value,
+        tipo: document.getElementById('filtroTipo').value,
+        desde: document.getElementById('filtroDesde').value,
+        hasta: document.getElementById('filtroHasta').value
+    };
+    
+    const params = new URLSearchParams();
+    Object.entries(valores).forEach(([clave, valor]) => {
+        if (valor) params.set(clave, valor);
     });
+    return params;
+}
+
+async function pedirPaginaReservas(params) {
+    params.set('formato', 'json');
+    const response = await fetch(`/reservas?${params}`);
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    return response.json();
+}
+
+async function filtrarReservas() {
+    const params = parametrosFiltro();
+    
+    // La URL refleja los filtros: recargar la página conserva la vista
+    const consulta = params.toString();
+    history.replaceState(null, '', location.pathname + (consulta ? `?${consulta}` : ''));
     
-    // Filtrar cards (móvil)
-    const cards = document.querySelectorAll('.reserva-card');
-    cards.forEach(card => {
-        const texto = card.textContent.toLowerCase();
-        const estadoCard = card.dataset.estado;
-        const tipoCard = card.dataset.tipo;
+    // Las respuestas de filtros anteriores que lleguen tarde se descartan
+    const peticion = ++peticionReservas;
+    try {
+        const pagina = await pedirPaginaReservas(params);
+        if (peticion !== peticionReservas) return;
         
-        const coincideBusqueda = texto.includes(buscar);
-        const coincideEstado = !estado || estadoCard === estado;
-        const coincideTipo = !tipo || tipoCard === tipo;
+        document.getElementById('listaReservas').innerHTML = pagina.html;
+        siguienteReserva = pagina.siguiente;
+        vigilarFinReservas();
+    } catch (error) {
+        console.error('Error al filtrar reservas:', error);
+        mostrarAlerta('danger', 'Error al cargar las reservas');
+    }
+}
+
+async function cargarMasReservas() {
+    if (!siguienteReserva || cargandoReservas) return;
+    
+    const params = parametrosFiltro();
+    params.set('despues', siguienteReserva);
+    
+    const peticion = peticionReservas;
+    cargandoReservas = true;
+    document.getElementById('finReservas').textContent = 'Cargando más reservas...';
+    try {
+        const pagina = await pedirPaginaReservas(params);
+        if (peticion !== peticionReservas) return;
         
-        if (coincideBusqueda && coincideEstado && coincideTipo) {
-            card.style.display = '';
-        } else {
-            card.style.display = 'none';
-        }
-    });
+        document.getElementById('listaReservas').insertAdjacentHTML('beforeend', pagina.html);
+        siguienteReserva = pagina.siguiente;
+        setTimeout(vigilarFinReservas, 0);
+    } catch (error) {
+        console.error('Error al cargar más reservas:', error);
+    } finally {
+        cargandoReservas = false;
+        document.getElementById('finReservas').textContent = '';
+    }
 }
 
 async function verDetalle(reservaId) {
@@ -133,6 +191,140 @@ async function enviarMensajeWhatsApp() {
     }
 }
 
+// ============= RECORDATORIOS MASIVOS =============
+
+let intervaloDifusion = null;
+
+function abrirDifusion() {
+    // Por defecto: eventos de los próximos 7 días
+    const hoy = new Date();
+    const enUnaSemana = new Date(hoy.getTime() + 7 * 24 * 60 * 60 * 1000);
+    document.getElementById('difusion_desde').value = hoy.toISOString().slice(0, 10);
+    document.getElementById('difusion_hasta').value = enUnaSemana.toISOString().slice(0, 10);
+    document.getElementById('difusionResultado').innerHTML = '';
+    document.getElementById('botonEnviarDifusion').disabled = false;
+    
+    const modal = new bootstrap.Modal(document.getElementById('difusionModal'));
+    modal.show();
+}
+
+function aplicarPlantillaDifusion() {
+    const plantillas = {
+        'recordatorio': 'Hola {cliente_nombre}, te recordamos que tu {tipo_celebracion} en nuestra finca será el {fecha_evento} a las {hora_inicio}. ¿Necesitas realizar algún cambio o tienes alguna pregunta?',
+        'recordatorio_24h': 'Hola {cliente_nombre}, ¡mañana es tu gran día! Te esperamos el {fecha_evento} a las {hora_inicio}. ¡Nos vemos pronto!',
+        'pago': 'Hola {cliente_nombre}, te recordamos que para tu evento del {fecha_evento} quedan pendientes {pendiente}€. Gracias.'
+    };
+    const tipo = document.getElementById('difusion_plantilla').value;
+    document.getElementById('difusion_mensaje').value = plantillas[tipo] || '';
+}
+
+function datosDifusion(simular) {
+    return {
+        fecha_desde: document.getElementById('difusion_desde').value,
+        fecha_hasta: document.getElementById('difusion_hasta').value,
+        estado: document.getElementById('difusion_estado').value,
+        plantilla: document.getElementById('difusion_mensaje').value,
+        simular: simular
+    };
+}
+
+async function previsualizarDifusion() {
+    try {
+        const response = await fetch('/api/whatsapp/difusion', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(datosDifusion(true))
+        });
+        const result = await response.json();
+        
+        if (!response.ok) {
+            mostrarAlerta('warning', result.error);
+            return;
+        }
+        
+        const filas = result.vista_previa.map(d => `
+            <li class="list-group-item">
+                <strong>${d.cliente}</strong> <small class="text-muted">${d.telefono}</small>
+                <div class="small">${d.mensaje}</div>
+            </li>
+        `).join('');
+        
+        document.getElementById('difusionResultado').innerHTML = `
+            <p class="mb-2"><strong>${result.total}</strong> destinatarios
+               ${result.omitidos.length ? `(${result.omitidos.length} sin teléfono válido)` : ''}</p>
+            <ul class="list-group" style="max-height: 250px; overflow-y: auto;">${filas}</ul>
+        `;
+    } catch (error) {
+        console.error('Error:', error);
+        mostrarAlerta('danger', 'Error al generar la vista previa');
+    }
+}
+
+async function enviarDifusion() {
+    if (!confirm('¿Enviar el mensaje a todas las reservas del filtro?')) return;
+    
+    try {
+        const response = await fetch('/api/whatsapp/difusion', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(datosDifusion(false))
+        });
+        const result = await response.json();
+        
+        if (response.status !== 202) {
+            mostrarAlerta('warning', result.message || result.error);
+            return;
+        }
+        
+        document.getElementById('botonEnviarDifusion').disabled = true;
+        mostrarAlerta('success', result.message);
+        seguirProgresoDifusion(result.id);
+    } catch (error) {
+        console.error('Error:', error);
+        mostrarAlerta('danger', 'Error al enviar los recordatorios');
+    }
+}
+
+function seguirProgresoDifusion(difusionId) {
+    if (intervaloDifusion) clearInterval(intervaloDifusion);
+    
+    const actualizar = async () => {
+        try {
+            const response = await fetch(`/api/whatsapp/difusion/${difusionId}`);
+            const progreso = await response.json();
+            mostrarProgresoDifusion(progreso);
+            if (progreso.completada) clearInterval(intervaloDifusion);
+        } catch (error) {
+            console.error('Error al consultar el progreso:', error);
+        }
+    };
+    
+    actualizar();
+    intervaloDifusion = setInterval(actualizar, 2000);
+}
+
+function mostrarProgresoDifusion(progreso) {
+    const enviados = progreso.resumen.enviado || 0;
+    const fallidos = progreso.resumen.fallido || 0;
+    const porcentaje = progreso.total ? Math.round((enviados + fallidos) * 100 / progreso.total) : 100;
+    const iconos = { enviado: '✅', fallido: '❌', en_cola: '⏳', enviando: '📤' };
+    
+    const filas = progreso.destinatarios.map(d => `
+        <li class="list-group-item d-flex justify-content-between">
+            <span>${d.cliente || d.telefono}</span>
+            <span title="${d.error || ''}">${iconos[d.estado] || ''} ${d.estado}</span>
+        </li>
+    `).join('');
+    
+    document.getElementById('difusionResultado').innerHTML = `
+        <div class="progress mb-2">
+            <div class="progress-bar bg-success" style="width: ${porcentaje}%">${porcentaje}%</div>
+        </div>
+        <p class="small mb-2">${enviados} enviados · ${fallidos} fallidos · ${progreso.total} en total</p>
+        <ul class="list-group" style="max-height: 250px; overflow-y: auto;">${filas}</ul>
+    `;
+}
+
 async function eliminarReserva(reservaId) {
     if (!confirm('¿Estás seguro de que deseas eliminar esta reserva?')) return;
     
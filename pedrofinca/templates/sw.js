@@ -0,0 +1,311 @@
+// Service worker de la PWA (se sirve desde /sw.js para controlar todas las páginas)
+//
+// - Páginas: red primero; sin conexión, la última copia guardada
+// - CSS y JS: caché primero; los paquetes de /static/dist y las librerías del CDN no cambian
+// - Lecturas de la API: stale-while-revalidate; si la respuesta nueva es distinta
+//   se avisa a las páginas con el evento 'datos-actualizados' para que la vuelvan a pedir
+// - Reservas y mensajes de WhatsApp creados sin conexión: se guardan en IndexedDB
+//   y se envían en orden al recuperar la conexión
+
+const VERSION = {{ version|tojson }};
+const PRECACHE = {{ precache|tojson }};
+const PAGINAS = {{ paginas|tojson }};
+
+const CACHE_ESTATICOS = 'finca-estaticos-' + VERSION;
+const CACHE_PAGINAS = 'finca-paginas';
+const CACHE_DATOS = 'finca-datos';
+const LECTURAS_API = ['/api/reservas', '/api/mensajes/agrupados', '/api/dashboard/stats'];
+const ESCRITURAS_EN_COLA = ['/api/reservas', '/api/whatsapp/enviar'];
+const ORIGENES_EXTERNOS = new Set(
+    PRECACHE.filter(url => url.startsWith('http')).map(url => new URL(url).origin)
+        .concat(['https://fonts.googleapis.com', 'https://fonts.gstatic.com'])
+);
+const FRESCURA_MS = 5000;  // una copia más reciente no se revalida (la página la pide tras el aviso)
+const CABECERA_FECHA = 'X-SW-Guardado';
+
+
+// ============= CICLO DE VIDA =============
+
+self.addEventListener('install', event => {
+    event.waitUntil((async () => {
+        const estaticos = await caches.open(CACHE_ESTATICOS);
+        // Uno a uno: un recurso que falle no impide instalar los demás
+        await Promise.all(PRECACHE.map(url => estaticos.add(url).catch(() => null)));
+        const paginas = await caches.open(CACHE_PAGINAS);
+        await Promise.all(PAGINAS.map(url => fetch(url).then(respuesta => guardarPagina(paginas, url, respuesta)).catch(() => null)));
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        for (const nombre of await caches.keys()) {
+            if (nombre.startsWith('finca-estaticos-') && nombre !== CACHE_ESTATICOS) {
+                await caches.delete(nombre);
+            }
+        }
+        await self.clients.claim();
+    })());
+});
+
+
+// ============= PETICIONES =============
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+
+    if (url.origin !== self.location.origin) {
+        if (request.method === 'GET' && ORIGENES_EXTERNOS.has(url.origin)) {
+            event.respondWith(cachePrimero(request));
+        }
+        return;
+    }
+
+    if (request.method === 'POST' && ESCRITURAS_EN_COLA.includes(url.pathname)) {
+        event.respondWith(enviarOEncolar(request));
+    } else if (request.method !== 'GET') {
+        event.respondWith(escribir(request));
+    } else if (url.pathname === '/logout') {
+        event.respondWith(cerrarSesion(request));
+    } else if (request.mode === 'navigate') {
+        event.respondWith(redPrimero(request));
+    } else if (esLecturaApi(url)) {
+        event.respondWith(leerConRevalidacion(event));
+    } else if (url.pathname.startsWith('/static/dist/')) {
+        event.respondWith(cachePrimero(request));
+    } else if (url.pathname.startsWith('/static/')) {
+        event.respondWith(cacheYActualizar(request));
+    }
+    // El resto (eventos SSE, multimedia, búsqueda...) va directo a la red
+});
+
+function esLecturaApi(url) {
+    if (LECTURAS_API.includes(url.pathname)) return true;
+    // Solo la última página de una conversación; los cursores piden mensajes nuevos o anteriores
+    return url.pathname.startsWith('/api/conversacion/')
+        && !url.searchParams.has('after') && !url.searchParams.has('before');
+}
+
+async function guardarPagina(cache, request, respuesta) {
+    // Las redirecciones (p. ej. al login) no se guardan
+    if (respuesta.ok && !respuesta.redirected && respuesta.type === 'basic') {
+        await cache.put(request, respuesta.clone());
+    }
+    return respuesta;
+}
+
+async function redPrimero(request) {
+    const cache = await caches.open(CACHE_PAGINAS);
+    try {
+        return await guardarPagina(cache, request, await fetch(request));
+    } catch (error) {
+        const guardada = await cache.match(request, {ignoreSearch: true}) || await cache.match('/');
+        return guardada || new Response(
+            '<h1>Sin conexión</h1><p>Vuelve a intentarlo cuando tengas cobertura.</p>',
+            {status: 503, headers: {'Content-Type': 'text/html; charset=utf-8'}}
+        );
+    }
+}
+
+async function cachePrimero(request) {
+    const cache = await caches.open(CACHE_ESTATICOS);
+    const guardada = await cache.match(request);
+    if (guardada) return guardada;
+    const respuesta = await fetch(request);
+    if (respuesta.ok || respuesta.type === 'opaque') {
+        await cache.put(request, respuesta.clone());
+    }
+    return respuesta;
+}
+
+async function cacheYActualizar(request) {
+    const cache = await caches.open(CACHE_ESTATICOS);
+    const guardada = await cache.match(request);
+    const red = fetch(request).then(async respuesta => {
+        if (respuesta.ok) await cache.put(request, respuesta.clone());
+        return respuesta;
+    });
+    return guardada || red;
+}
+
+
+// ============= LECTURAS DE LA API =============
+
+async function leerConRevalidacion(event) {
+    const request = event.request;
+    const cache = await caches.open(CACHE_DATOS);
+    const guardada = await cache.match(request);
+    if (guardada && Date.now() - Number(guardada.headers.get(CABECERA_FECHA)) < FRESCURA_MS) {
+        return guardada;
+    }
+
+    const anterior = guardada ? guardada.clone() : null;
+    const red = fetch(request).then(async respuesta => {
+        if (respuesta.ok && !respuesta.redirected) {
+            const cambiado = anterior && await haCambiado(anterior, respuesta.clone());
+            await cache.put(request, await conFecha(respuesta.clone()));
+            if (cambiado) {
+                const url = new URL(request.url);
+                avisarPaginas({tipo: 'datos-actualizados', url: url.pathname + url.search});
+            }
+        }
+        return respuesta;
+    });
+
+    if (!guardada) return red;
+    event.waitUntil(red.catch(() => null));
+    return guardada;
+}
+
+async function haCambiado(anterior, nueva) {
+    const etagAnterior = anterior.headers.get('ETag');
+    const etagNueva = nueva.headers.get('ETag');
+    if (etagAnterior && etagNueva) return etagAnterior !== etagNueva;
+    return await anterior.text() !== await nueva.text();
+}
+
+async function conFecha(respuesta) {
+    // El cuerpo ya está descomprimido: se quitan las cabeceras de la versión comprimida
+    const cabeceras = new Headers(respuesta.headers);
+    cabeceras.delete('Content-Encoding');
+    cabeceras.delete('Content-Length');
+    cabeceras.set(CABECERA_FECHA, String(Date.now()));
+    return new Response(await respuesta.blob(), {
+        status: respuesta.status, statusText: respuesta.statusText, headers: cabeceras
+    });
+}
+
+async function escribir(request) {
+    const respuesta = await fetch(request);
+    // Tras cualquier cambio, las lecturas guardadas pueden estar obsoletas
+    await caches.delete(CACHE_DATOS);
+    return respuesta;
+}
+
+async function cerrarSesion(request) {
+    // Los datos y las operaciones pendientes son del usuario que sale
+    await caches.delete(CACHE_DATOS);
+    await caches.delete(CACHE_PAGINAS);
+    await operarCola('readwrite', almacen => almacen.clear());
+    return fetch(request);
+}
+
+
+// ============= COLA DE ESCRITURAS SIN CONEXIÓN =============
+
+function abrirCola() {
+    return new Promise((resolver, rechazar) => {
+        const peticion = indexedDB.open('finca-pwa', 1);
+        peticion.onupgradeneeded = () => {
+            peticion.result.createObjectStore('pendientes', {keyPath: 'id', autoIncrement: true});
+        };
+        peticion.onsuccess = () => resolver(peticion.result);
+        peticion.onerror = () => rechazar(peticion.error);
+    });
+}
+
+async function operarCola(modo, operacion) {
+    const bd = await abrirCola();
+    return new Promise((resolver, rechazar) => {
+        const transaccion = bd.transaction('pendientes', modo);
+        const peticion = operacion(transaccion.objectStore('pendientes'));
+        transaccion.oncomplete = () => {
+            bd.close();
+            resolver(peticion.result);
+        };
+        transaccion.onerror = () => {
+            bd.close();
+            rechazar(transaccion.error);
+        };
+    });
+}
+
+async function enviarOEncolar(request) {
+    const copia = request.clone();
+    try {
+        return await escribir(request);
+    } catch (error) {
+        // Sin conexión: guardar la petición y contestar que se enviará más tarde
+        const pendiente = {
+            url: copia.url,
+            tipo: copia.headers.get('Content-Type') || 'application/json',
+            cuerpo: await copia.text(),
+            fecha: Date.now()
+        };
+        await operarCola('readwrite', almacen => almacen.add(pendiente));
+        if (self.registration.sync) {
+            self.registration.sync.register('finca-pendientes').catch(() => null);
+        }
+        const mensaje = new URL(copia.url).pathname === '/api/whatsapp/enviar'
+            ? 'Sin conexión: el mensaje se enviará al recuperar la conexión'
+            : 'Sin conexión: la reserva se guardará al recuperar la conexión';
+        return new Response(JSON.stringify({message: mensaje, encolado: true}), {
+            status: 202, headers: {'Content-Type': 'application/json'}
+        });
+    }
+}
+
+let reenvioEnCurso = null;
+
+function reenviarPendientes() {
+    // Un solo reenvío a la vez para mantener el orden
+    if (!reenvioEnCurso) {
+        reenvioEnCurso = reenviar().finally(() => { reenvioEnCurso = null; });
+    }
+    return reenvioEnCurso;
+}
+
+async function reenviar() {
+    // Devuelve true si la cola quedó vacía
+    const pendientes = await operarCola('readonly', almacen => almacen.getAll());
+    for (const pendiente of pendientes) {
+        let respuesta;
+        try {
+            respuesta = await fetch(pendiente.url, {
+                method: 'POST',
+                headers: {'Content-Type': pendiente.tipo},
+                body: pendiente.cuerpo,
+                credentials: 'same-origin'
+            });
+        } catch (error) {
+            return false;  // sigue sin conexión
+        }
+        if (respuesta.redirected) {
+            return false;  // sesión caducada: se reenvía después de iniciar sesión
+        }
+
+        // Un error del servidor (p. ej. 409 por un horario ya ocupado) no se reintenta: se avisa
+        await operarCola('readwrite', almacen => almacen.delete(pendiente.id));
+        await caches.delete(CACHE_DATOS);
+        const datos = await respuesta.json().catch(() => ({}));
+        avisarPaginas({
+            tipo: 'reenviado',
+            url: new URL(pendiente.url).pathname,
+            ok: respuesta.ok,
+            mensaje: datos.error || datos.message || ''
+        });
+    }
+    return true;
+}
+
+self.addEventListener('sync', event => {
+    if (event.tag === 'finca-pendientes') {
+        // Si queda algo pendiente, el navegador lo vuelve a intentar más tarde
+        event.waitUntil(reenviarPendientes().then(vacia => {
+            if (!vacia) throw new Error('Operaciones pendientes sin enviar');
+        }));
+    }
+});
+
+self.addEventListener('message', event => {
+    if (event.data && event.data.tipo === 'reenviar') {
+        event.waitUntil(reenviarPendientes());
+    }
+});
+
+async function avisarPaginas(mensaje) {
+    for (const cliente of await self.clients.matchAll({type: 'window'})) {
+        cliente.postMessage(mensaje);
+    }
+}
@@ -0,0 +1,54 @@
+"""Funciones comunes de las pruebas (la aplicación ya está configurada por conftest.py)"""
+
+import re
+
+from twilio.request_validator import RequestValidator
+
+import app as aplicacion
+from conftest import TOKEN_TWILIO
+
+
+def crear_reserva(fecha_evento, hora_inicio, hora_fin, **campos):
+    """Guardar una reserva (dentro de un contexto de aplicación) y devolver su id"""
+    datos = {
+        'cliente_nombre': 'Cliente de pruebas',
+        'cliente_telefono': '600111222',
+        'tipo_celebracion': 'cumpleaños',
+        'estado': 'confirmada',
+        'precio': 100.0,
+        'anticipo': 20.0,
+        'num_invitados': 10,
+    }
+    datos.update(campos)
+    reserva = aplicacion.Reserva(
+        fecha_evento=fecha_evento, hora_inicio=hora_inicio, hora_fin=hora_fin, **datos
+    )
+    aplicacion.db.session.add(reserva)
+    aplicacion.db.session.commit()
+    return reserva.id
+
+
+def datos_reserva(fecha_evento, hora_inicio, hora_fin, **campos):
+    """Cuerpo JSON de POST /api/reservas"""
+    return {
+        'cliente_nombre': 'Cliente de pruebas',
+        'cliente_telefono': '600111222',
+        'fecha_evento': fecha_evento,
+        'hora_inicio': hora_inicio,
+        'hora_fin': hora_fin,
+        'tipo_celebracion': 'boda',
+        'precio': 500,
+        **campos,
+    }
+
+
+def firmar_webhook(datos, url='http://localhost/api/whatsapp/webhook'):
+    """Cabecera X-Twilio-Signature que Twilio enviaría con estos datos"""
+    return {'X-Twilio-Signature': RequestValidator(TOKEN_TWILIO).compute_signature(url, datos)}
+
+
+def consultas_sql(respuesta):
+    """Consultas SQL de la petición, de la cabecera Server-Timing"""
+    coincidencia = re.search(r'desc="(\d+) consultas"', respuesta.headers.get('Server-Timing', ''))
+    assert coincidencia, 'La respuesta no trae el número de consultas en Server-Timing'
+    return int(coincidencia.group(1))
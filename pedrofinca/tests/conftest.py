@@ -0,0 +1,84 @@
+"""
+Aplicación de pruebas sobre una base de datos SQLite temporal
+
+La configuración se lee de variables de entorno al importar app.py, así
+que se fijan aquí antes de importarla: base de datos temporal, sin hilos
+en segundo plano (webhook, multimedia, cola de envío) y con la cabecera
+Server-Timing, que lleva el número de consultas SQL de cada petición.
+Las peticiones al webhook van firmadas con un token de prueba. Cada prueba
+empieza con las tablas y las cachés vacías.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+DIRECTORIO_PRUEBAS = tempfile.mkdtemp(prefix='finca_pruebas_')
+TOKEN_TWILIO = 'token-de-pruebas'
+TOKEN_METRICAS = 'token-de-metricas'
+
+os.environ.update(
+    DATABASE_URL=f'sqlite:///{os.path.join(DIRECTORIO_PRUEBAS, "pruebas.db")}',
+    MEDIA_DIR=os.path.join(DIRECTORIO_PRUEBAS, 'media'),
+    TWILIO_ACCOUNT_SID='',
+    TWILIO_AUTH_TOKEN=TOKEN_TWILIO,
+    WEBHOOK_VALIDAR_FIRMA='1',
+    PROCESADOR_WEBHOOK_ACTIVO='0',
+    MEDIA_ACTIVO='0',
+    COLA_ENVIO_ACTIVA='0',
+    METRICAS_TOKEN=TOKEN_METRICAS,
+    METRICAS_CABECERA='1',
+    SQL_LENTA_MS='60000',
+    EVENTOS_BACKEND='memoria',
+    CACHE_BACKEND='memoria',
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as aplicacion  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    with aplicacion.app.app_context():
+        aplicacion.db.create_all()
+    aplicacion.app.config['TESTING'] = True
+    return aplicacion.app
+
+
+@pytest.fixture(autouse=True)
+def base_vacia(app):
+    """Vaciar las tablas (los triggers limpian los índices de búsqueda) y las cachés"""
+    with app.app_context():
+        db = aplicacion.db
+        for tabla in reversed(db.metadata.sorted_tables):
+            db.session.execute(tabla.delete())
+        db.session.execute(db.text('DELETE FROM mensaje_archivado_fts'))
+        db.session.commit()
+    for cache in (aplicacion.cache_datos, aplicacion.cache_fragmentos):
+        cache._borrar(list(cache._datos))
+    aplicacion.invalidar_estadisticas()
+    yield
+
+
+@pytest.fixture
+def cliente(app):
+    """Cliente de pruebas con la sesión de un usuario iniciada"""
+    with app.app_context():
+        usuario = aplicacion.User(username='pruebas', email='pruebas@finca.test')
+        usuario.set_password('clave')
+        aplicacion.db.session.add(usuario)
+        aplicacion.db.session.commit()
+    cliente = app.test_client()
+    respuesta = cliente.post('/login', data={'username': 'pruebas', 'password': 'clave'})
+    assert respuesta.status_code == 302
+    return cliente
+
+
+@pytest.fixture
+def contexto(app):
+    """Contexto de aplicación para usar los modelos directamente"""
+    with app.app_context():
+        yield
+        aplicacion.db.session.remove()
@@ -0,0 +1,75 @@
+"""
+Presupuesto de consultas SQL por petición de los escenarios del benchmark
+(benchmarks/rendimiento_api.py): con muchas filas, un N+1 lo supera enseguida
+"""
+
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+from ayudas import aplicacion, consultas_sql, crear_reserva, firmar_webhook
+
+# Consultas como máximo por petición, con las cachés ya cargadas
+PRESUPUESTO_CONSULTAS = {
+    'calendario': 2,
+    'listado_reservas': 1,
+    'conversaciones': 2,
+    'conversacion': 1,
+    'busqueda': 2,
+    'webhook': 1,
+}
+
+TELEFONOS = [f'+346001000{i:02d}' for i in range(20)]
+
+
+@pytest.fixture
+def datos(app):
+    with app.app_context():
+        for i, telefono in enumerate(TELEFONOS):
+            crear_reserva(date(2027, 5, 1) + timedelta(days=i), time(12), time(16),
+                          cliente_nombre=f'Cliente {i}', cliente_telefono=telefono)
+        inicio = datetime(2026, 1, 1)
+        aplicacion.db.session.add_all(aplicacion.Mensaje(
+            telefono_origen=f'whatsapp:{telefono}',
+            telefono_destino='whatsapp:+14155238886',
+            contenido=f'¿Está la finca disponible el sábado? ({j})',
+            direccion='entrante',
+            estado='recibido',
+            enviado_at=inicio + timedelta(minutes=i * 100 + j),
+        ) for i, telefono in enumerate(TELEFONOS) for j in range(30))
+        aplicacion.db.session.commit()
+        aplicacion.db.session.remove()
+
+
+def peticion_webhook(cliente):
+    peticion_webhook.numero += 1
+    datos = {
+        'MessageSid': f'SMpresupuesto{peticion_webhook.numero}',
+        'From': f'whatsapp:{TELEFONOS[0]}',
+        'To': 'whatsapp:+14155238886',
+        'Body': 'Hola',
+        'NumMedia': '0',
+    }
+    return cliente.post('/api/whatsapp/webhook', data=datos, headers=firmar_webhook(datos))
+
+
+peticion_webhook.numero = 0
+
+PETICIONES = {
+    'calendario': lambda cliente: cliente.get('/api/reservas?start=2027-05-01&end=2027-06-01'),
+    'listado_reservas': lambda cliente: cliente.get('/reservas?formato=json'),
+    'conversaciones': lambda cliente: cliente.get('/api/mensajes/agrupados'),
+    'conversacion': lambda cliente: cliente.get(f'/api/conversacion/{TELEFONOS[3]}'),
+    'busqueda': lambda cliente: cliente.get('/api/buscar?q=finca sabado'),
+    'webhook': peticion_webhook,
+}
+
+
+@pytest.mark.parametrize('escenario', sorted(PRESUPUESTO_CONSULTAS))
+def test_presupuesto_de_consultas(cliente, datos, escenario):
+    peticion = PETICIONES[escenario]
+    peticion(cliente)  # calentar las cachés
+
+    respuesta = peticion(cliente)
+    assert respuesta.status_code == 200
+    assert consultas_sql(respuesta) <= PRESUPUESTO_CONSULTAS[escenario]
@@ -0,0 +1,40 @@
+"""Canal de eventos (SSE): límite de conexiones por proceso y workers de gunicorn"""
+
+import threading
+
+import pytest
+
+from ayudas import aplicacion
+
+
+def test_conexiones_de_eventos_por_encima_del_limite_responden_503(cliente, monkeypatch):
+    monkeypatch.setattr(aplicacion, 'conexiones_eventos', threading.BoundedSemaphore(1))
+
+    primera = cliente.get('/api/eventos', buffered=False)
+    assert primera.status_code == 200
+    segunda = cliente.get('/api/eventos', buffered=False)
+    assert segunda.status_code == 503
+    assert segunda.headers['Retry-After'] == '60'
+
+    # Al cerrarse la primera queda sitio otra vez
+    primera.close()
+    tercera = cliente.get('/api/eventos', buffered=False)
+    assert tercera.status_code == 200
+    tercera.close()
+
+
+@pytest.mark.parametrize('entorno, argv, workers', [
+    ({}, ['pytest'], 1),
+    ({}, ['/venv/bin/gunicorn', '--workers', '3', 'app:app'], 3),
+    ({}, ['gunicorn', '-w4', 'app:app'], 4),
+    ({'WEB_CONCURRENCY': '2'}, ['gunicorn', 'app:app'], 2),
+    ({'WEB_CONCURRENCY': '2', 'GUNICORN_CMD_ARGS': '--workers=5'}, ['gunicorn', '-w', '1', 'app:app'], 1),
+    ({'GUNICORN_CMD_ARGS': '--workers=5'}, ['python', 'startup.py', '-w', '3'], 5),
+])
+def test_workers_gunicorn(monkeypatch, entorno, argv, workers):
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    monkeypatch.delenv('GUNICORN_CMD_ARGS', raising=False)
+    for nombre, valor in entorno.items():
+        monkeypatch.setenv(nombre, valor)
+    monkeypatch.setattr(aplicacion.sys, 'argv', argv)
+    assert aplicacion.workers_gunicorn() == workers
@@ -0,0 +1,82 @@
+"""Resumen diario de los informes: se mantiene al crear, cambiar de estado y borrar reservas"""
+
+from datetime import date, time
+
+from sqlalchemy import event
+
+from ayudas import aplicacion, crear_reserva
+from informes import recalcular_rango
+
+
+def filas_resumen():
+    return sorted(
+        (fila.fecha, fila.tipo_celebracion, fila.estado, fila.reservas, fila.ingresos, fila.anticipos, fila.invitados)
+        for fila in aplicacion.ResumenDiario.query
+    )
+
+
+def resumen_recalculado():
+    """El resumen calculado desde cero con todas las reservas"""
+    with aplicacion.db.engine.connect() as conn:
+        tabla = aplicacion.ResumenDiario.__table__
+        recalcular_rango(conn, aplicacion.Reserva.__table__, tabla, date(2000, 1, 1), date(2100, 1, 1))
+        filas = conn.execute(tabla.select()).all()
+        conn.rollback()
+    return sorted(
+        (fila.fecha, fila.tipo_celebracion, fila.estado, fila.reservas, fila.ingresos, fila.anticipos, fila.invitados)
+        for fila in filas
+    )
+
+
+def test_resumen_tras_cambiar_de_estado(cliente, contexto):
+    primera = crear_reserva(date(2027, 5, 1), time(10), time(12), precio=300.0, anticipo=50.0, num_invitados=40)
+    crear_reserva(date(2027, 5, 1), time(18), time(20), precio=200.0, anticipo=0.0, num_invitados=20)
+    assert filas_resumen() == [(date(2027, 5, 1), 'cumpleaños', 'confirmada', 2, 500.0, 50.0, 60)]
+
+    respuesta = cliente.put(f'/api/reservas/{primera}/estado', json={'estado': 'cancelada'})
+    assert respuesta.status_code == 200
+    aplicacion.db.session.expire_all()
+    assert filas_resumen() == [
+        (date(2027, 5, 1), 'cumpleaños', 'cancelada', 1, 300.0, 50.0, 40),
+        (date(2027, 5, 1), 'cumpleaños', 'confirmada', 1, 200.0, 0.0, 20),
+    ]
+    assert filas_resumen() == resumen_recalculado()
+
+    ingresos = cliente.get('/api/informes/ingresos?desde=2027-01-01&hasta=2027-12-31').get_json()
+    assert ingresos['total']['reservas'] == 1
+    assert ingresos['total']['ingresos'] == 200.0
+
+
+def test_resumen_tras_borrar_y_cambiar_de_fecha(cliente, contexto):
+    primera = crear_reserva(date(2027, 5, 1), time(10), time(12))
+    segunda = crear_reserva(date(2027, 5, 2), time(10), time(12), tipo_celebracion='boda')
+
+    assert cliente.delete(f'/api/reservas/{primera}').status_code == 200
+    reserva = aplicacion.db.session.get(aplicacion.Reserva, segunda)
+    reserva.fecha_evento = date(2027, 6, 1)
+    aplicacion.db.session.commit()
+
+    aplicacion.db.session.expire_all()
+    assert filas_resumen() == [(date(2027, 6, 1), 'boda', 'confirmada', 1, 100.0, 20.0, 10)]
+    assert filas_resumen() == resumen_recalculado()
+
+
+def test_resumen_se_agrega_con_las_reservas_bloqueadas(contexto):
+    reserva_id = crear_reserva(date(2027, 5, 1), time(10), time(12))
+    sentencias = []
+
+    def registrar(conn, cursor, sentencia, *args):
+        sentencias.append(' '.join(sentencia.split()).upper())
+
+    motor = aplicacion.db.engine
+    event.listen(motor, 'before_cursor_execute', registrar)
+    try:
+        reserva = aplicacion.db.session.get(aplicacion.Reserva, reserva_id)
+        reserva.precio = 150.0
+        aplicacion.db.session.commit()
+    finally:
+        event.remove(motor, 'before_cursor_execute', registrar)
+
+    bloqueo = next(i for i, s in enumerate(sentencias) if s.startswith('UPDATE VERSION_TABLA'))
+    agregado = next(i for i, s in enumerate(sentencias) if s.startswith('DELETE FROM RESUMEN_DIARIO'))
+    assert bloqueo < agregado
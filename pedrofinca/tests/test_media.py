@@ -0,0 +1,28 @@
+"""Almacén multimedia: solo se descargan (y reciben las credenciales) los orígenes de Twilio"""
+
+import pytest
+
+from media import AlmacenMedia, ErrorDescarga, url_permitida
+
+ORIGENES = ('https://api.twilio.com', 'https://*.twiliocdn.com')
+
+
+@pytest.mark.parametrize('url, permitida', [
+    ('https://api.twilio.com/2010-04-01/Accounts/AC1/Messages/MM1/Media/ME1', True),
+    ('https://media.twiliocdn.com/AC1/archivo', True),
+    ('http://api.twilio.com/2010-04-01/Media/ME1', False),
+    ('https://api.twilio.com:8443/Media/ME1', False),
+    ('https://api.twilio.com.ejemplo.com/Media/ME1', False),
+    ('https://twiliocdn.com.ejemplo.com/archivo', False),
+    ('http://169.254.169.254/latest/meta-data/', False),
+    ('https://api.twilio.com:puerto/Media/ME1', False),
+])
+def test_url_permitida(url, permitida):
+    assert url_permitida(url, ORIGENES) is permitida
+
+
+def test_no_se_pide_una_url_fuera_de_los_origenes(tmp_path):
+    almacen = AlmacenMedia(str(tmp_path), ORIGENES)
+    with pytest.raises(ErrorDescarga):
+        almacen.descargar('http://localhost:8080/interno', auth=('AC1', 'secreto'))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,113 @@
+"""Webhook de Twilio (firma y reintentos) y paginación de conversaciones por cursor, también en el archivo"""
+
+from datetime import datetime, timedelta
+
+from ayudas import aplicacion, firmar_webhook
+
+
+def datos_webhook(sid, texto='Hola, ¿está libre el sábado?', telefono='+34600111222'):
+    return {
+        'MessageSid': sid,
+        'From': f'whatsapp:{telefono}',
+        'To': 'whatsapp:+14155238886',
+        'Body': texto,
+        'NumMedia': '0',
+    }
+
+
+def test_webhook_sin_firma_valida_no_guarda_nada(cliente, contexto):
+    datos = datos_webhook('SM1')
+    assert cliente.post('/api/whatsapp/webhook', data=datos).status_code == 403
+    otros = dict(datos, Body='texto cambiado')
+    assert cliente.post('/api/whatsapp/webhook', data=otros, headers=firmar_webhook(datos)).status_code == 403
+    assert aplicacion.EntradaWebhook.query.count() == 0
+
+
+def test_reintentos_del_webhook_crean_un_solo_mensaje(cliente, contexto):
+    datos = datos_webhook('SM1')
+    for _ in range(3):
+        respuesta = cliente.post('/api/whatsapp/webhook', data=datos, headers=firmar_webhook(datos))
+        assert respuesta.status_code == 200
+    assert aplicacion.EntradaWebhook.query.count() == 1
+
+    aplicacion.procesador_webhook.procesar_pendientes()
+    # Un reintento que llega después de procesar la entrada tampoco duplica el mensaje
+    cliente.post('/api/whatsapp/webhook', data=datos, headers=firmar_webhook(datos))
+    aplicacion.procesador_webhook.procesar_pendientes()
+
+    mensajes = aplicacion.Mensaje.query.filter_by(twilio_sid='SM1').all()
+    assert len(mensajes) == 1
+    assert (mensajes[0].direccion, mensajes[0].telefono_norm) == ('entrante', '+34600111222')
+
+
+def crear_conversacion(total, telefono='+34600111222'):
+    """Mensajes de una conversación, uno por minuto; devuelve los ids en orden cronológico"""
+    inicio = datetime(2026, 1, 1, 10)
+    mensajes = [aplicacion.Mensaje(
+        telefono_origen=f'whatsapp:{telefono}',
+        telefono_destino='whatsapp:+14155238886',
+        contenido=f'mensaje {i}',
+        direccion='entrante',
+        estado='recibido',
+        enviado_at=inicio + timedelta(minutes=i),
+    ) for i in range(total)]
+    aplicacion.db.session.add_all(mensajes)
+    aplicacion.db.session.commit()
+    return [m.id for m in mensajes]
+
+
+def test_conversacion_hacia_atras_por_cursor(cliente, contexto):
+    ids = crear_conversacion(23)
+
+    pagina = cliente.get('/api/conversacion/+34600111222?limit=10').get_json()
+    vistos = [m['id'] for m in pagina]
+    assert vistos == ids[-10:]
+    while pagina:
+        pagina = cliente.get(f'/api/conversacion/+34600111222?limit=10&before={vistos[0]}').get_json()
+        vistos = [m['id'] for m in pagina] + vistos
+    assert vistos == ids
+
+
+def test_conversacion_hacia_atras_continua_en_el_archivo(cliente, contexto):
+    ids = crear_conversacion(30)
+    archivados = aplicacion.archivar_conversacion('+34600111222', datetime(2027, 1, 1), conservar=8, lote=5)
+    assert archivados == 22
+    assert aplicacion.Mensaje.query.count() == 8
+
+    pagina = cliente.get('/api/conversacion/+34600111222?limit=7').get_json()
+    vistos = [m['id'] for m in pagina]
+    while pagina:
+        pagina = cliente.get(f'/api/conversacion/+34600111222?limit=7&before={vistos[0]}').get_json()
+        vistos = [m['id'] for m in pagina] + vistos
+    assert vistos == ids
+
+    # Los archivados se siguen encontrando
+    resultados = cliente.get('/api/buscar?q=mensaje&tipo=mensajes&limite=50').get_json()['mensajes']['resultados']
+    assert sorted(r['id'] for r in resultados) == ids
+    assert sum(r['archivado'] for r in resultados) == 22
+
+
+def test_conversacion_solo_mensajes_nuevos(cliente, contexto):
+    ids = crear_conversacion(12)
+    nuevos = cliente.get(f'/api/conversacion/+34600111222?after={ids[8]}').get_json()
+    assert [m['id'] for m in nuevos] == ids[9:]
+
+
+def test_conversacion_limita_el_tamano_de_pagina(cliente, contexto):
+    ids = crear_conversacion(5)
+    assert [m['id'] for m in cliente.get('/api/conversacion/+34600111222?limit=-1').get_json()] == ids[-1:]
+    assert [m['id'] for m in cliente.get('/api/conversacion/+34600111222?limit=0').get_json()] == ids[-1:]
+
+
+def test_conversacion_con_cursor_desconocido_responde_400(cliente, contexto):
+    ids = crear_conversacion(30)
+    otra = crear_conversacion(3, telefono='+34600999888')
+    aplicacion.archivar_conversacion('+34600111222', datetime(2027, 1, 1), conservar=8, lote=5)
+
+    for parametros in (f'after={ids[-1] + 100}', f'before={ids[-1] + 100}',
+                       f'after={otra[0]}', f'before={otra[0]}', f'after={ids[0]}'):
+        respuesta = cliente.get(f'/api/conversacion/+34600111222?{parametros}')
+        assert respuesta.status_code == 400, parametros
+
+    # Un mensaje archivado sí vale como cursor para retroceder
+    assert cliente.get(f'/api/conversacion/+34600111222?before={ids[5]}').status_code == 200
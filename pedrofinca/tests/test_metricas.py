@@ -0,0 +1,32 @@
+"""/metrics: solo con sesión iniciada o con el token de Prometheus; avisos de consultas lentas"""
+
+import logging
+
+from ayudas import aplicacion
+from conftest import TOKEN_METRICAS
+
+
+def test_metricas_sin_sesion_ni_token_responde_401(app):
+    cliente = app.test_client()
+    assert cliente.get('/metrics').status_code == 401
+    respuesta = cliente.get('/metrics', headers={'Authorization': 'Bearer otro-token'})
+    assert respuesta.status_code == 401
+
+
+def test_metricas_con_el_token_de_prometheus(app):
+    respuesta = app.test_client().get('/metrics', headers={'Authorization': f'Bearer {TOKEN_METRICAS}'})
+    assert respuesta.status_code == 200
+    assert b'# TYPE' in respuesta.data
+
+
+def test_metricas_con_sesion(cliente):
+    assert cliente.get('/metrics').status_code == 200
+
+
+def test_consultas_lentas_van_al_log_de_la_aplicacion(cliente, monkeypatch, caplog):
+    monkeypatch.setattr(aplicacion, 'SQL_LENTA_MS', 0)
+    with caplog.at_level(logging.WARNING, logger=aplicacion.app.logger.name):
+        assert cliente.get('/api/dashboard/stats').status_code == 200
+    avisos = [r for r in caplog.records if r.name == aplicacion.app.logger.name]
+    assert avisos and all(r.levelno == logging.WARNING for r in avisos)
+    assert 'Consulta lenta' in avisos[0].getMessage()
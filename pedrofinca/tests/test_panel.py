@@ -0,0 +1,16 @@
+"""Estadísticas del panel: caché compartida por los workers a través de la versión de la tabla reserva"""
+
+from datetime import date, time, timedelta
+
+from ayudas import crear_reserva
+
+
+def test_estadisticas_del_panel_ven_cambios_de_otros_workers(app, cliente):
+    assert cliente.get('/api/dashboard/stats').get_json()['proximas_reservas'] == []
+
+    # Guardada sin pasar por las rutas, como si la creara otro worker: no llama a invalidar_estadisticas
+    with app.app_context():
+        reserva_id = crear_reserva(date.today() + timedelta(days=10), time(12), time(16))
+
+    proximas = cliente.get('/api/dashboard/stats').get_json()['proximas_reservas']
+    assert [r['id'] for r in proximas] == [reserva_id]
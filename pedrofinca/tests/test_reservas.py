@@ -0,0 +1,141 @@
+"""Reservas: solapes, reservas que pasan de medianoche o duran 24 horas, calendario con ETag y listado por cursor"""
+
+from datetime import date, datetime, time
+
+from ayudas import aplicacion, crear_reserva, datos_reserva
+
+
+def contacto(telefono):
+    return aplicacion.Contacto.query.filter_by(telefono_norm=aplicacion.normalizar_telefono(telefono)).one()
+
+
+def test_cambiar_el_telefono_desvincula_el_contacto_anterior(contexto):
+    reserva_id = crear_reserva(date(2027, 5, 1), time(12), time(16), cliente_telefono='600111222')
+    assert contacto('600111222').reserva_id == reserva_id
+    anterior = aplicacion.normalizar_telefono('600111222')
+    assert aplicacion.contactos_por_telefono([anterior])[anterior]['reserva_id'] == reserva_id
+
+    reserva = aplicacion.db.session.get(aplicacion.Reserva, reserva_id)
+    reserva.cliente_telefono = '600333444'
+    aplicacion.db.session.commit()
+
+    aplicacion.db.session.expire_all()
+    assert contacto('600111222').reserva_id is None
+    assert contacto('600333444').reserva_id == reserva_id
+    # La caché del teléfono anterior también se invalida
+    assert aplicacion.contactos_por_telefono([anterior])[anterior]['reserva_id'] is None
+
+
+def test_reserva_solapada_responde_409(cliente):
+    respuesta = cliente.post('/api/reservas', json=datos_reserva('2027-05-01', '12:00', '16:00'))
+    assert respuesta.status_code == 201
+    reserva_id = respuesta.get_json()['id']
+
+    respuesta = cliente.post('/api/reservas', json=datos_reserva('2027-05-01', '15:00', '18:00'))
+    assert respuesta.status_code == 409
+    assert [c['id'] for c in respuesta.get_json()['conflictos']] == [reserva_id]
+
+    # Justo a continuación no se solapa
+    respuesta = cliente.post('/api/reservas', json=datos_reserva('2027-05-01', '16:00', '18:00'))
+    assert respuesta.status_code == 201
+
+
+def test_reserva_cancelada_no_ocupa(cliente, contexto):
+    crear_reserva(date(2027, 5, 1), time(12), time(16), estado='cancelada')
+    respuesta = cliente.post('/api/reservas', json=datos_reserva('2027-05-01', '12:00', '16:00'))
+    assert respuesta.status_code == 201
+
+
+def test_confirmar_reserva_solapada_responde_409(cliente, contexto):
+    crear_reserva(date(2027, 5, 1), time(12), time(16))
+    pendiente = crear_reserva(date(2027, 5, 1), time(14), time(18), estado='pendiente')
+
+    respuesta = cliente.put(f'/api/reservas/{pendiente}/estado', json={'estado': 'confirmada'})
+    assert respuesta.status_code == 409
+    assert aplicacion.db.session.get(aplicacion.Reserva, pendiente).estado == 'pendiente'
+
+
+def test_reserva_nocturna_acaba_al_dia_siguiente(cliente, contexto):
+    reserva_id = crear_reserva(date(2027, 5, 1), time(22), time(3))
+    reserva = aplicacion.db.session.get(aplicacion.Reserva, reserva_id)
+    assert (reserva.inicio_at, reserva.fin_at) == (datetime(2027, 5, 1, 22), datetime(2027, 5, 2, 3))
+
+    # Ocupa la madrugada del día siguiente, pero no después de las 3:00
+    respuesta = cliente.post('/api/reservas', json=datos_reserva('2027-05-02', '01:00', '02:00'))
+    assert respuesta.status_code == 409
+    respuesta = cliente.post('/api/reservas', json=datos_reserva('2027-05-02', '03:00', '05:00'))
+    assert respuesta.status_code == 201
+
+    eventos = cliente.get('/api/reservas?start=2027-05-01&end=2027-05-02').get_json()
+    assert [(e['start'], e['end']) for e in eventos] == [('2027-05-01T22:00:00', '2027-05-02T03:00:00')]
+
+
+def test_reserva_de_24_horas_solo_si_se_pide(cliente, contexto):
+    respuesta = cliente.post('/api/reservas', json=datos_reserva('2027-05-01', '12:00', '12:00'))
+    assert respuesta.status_code == 400
+    assert aplicacion.Reserva.query.count() == 0
+
+    respuesta = cliente.post('/api/reservas', json=datos_reserva('2027-05-01', '12:00', '12:00', dia_completo=True))
+    assert respuesta.status_code == 201
+    reserva = aplicacion.db.session.get(aplicacion.Reserva, respuesta.get_json()['id'])
+    assert (reserva.inicio_at, reserva.fin_at) == (datetime(2027, 5, 1, 12), datetime(2027, 5, 2, 12))
+
+
+def test_comprobar_disponibilidad_no_cambia_la_version(contexto):
+    crear_reserva(date(2027, 5, 1), time(12), time(16))
+    version = aplicacion.version_tabla('reserva')
+    conflictos = aplicacion.comprobar_disponibilidad(datetime(2027, 5, 1, 15), datetime(2027, 5, 1, 18))
+    assert len(conflictos) == 1
+    assert aplicacion.version_tabla('reserva') == version
+    aplicacion.db.session.rollback()
+
+
+def test_disponibilidad_con_reserva_nocturna(cliente, contexto):
+    crear_reserva(date(2027, 5, 1), time(22), time(3))
+    dias = cliente.get('/api/disponibilidad?desde=2027-05-01&hasta=2027-05-02').get_json()['dias']
+    huecos = {dia['fecha']: dia['huecos'] for dia in dias}
+    assert huecos['2027-05-01'] == [{'inicio': '00:00', 'fin': '22:00'}]
+    assert huecos['2027-05-02'] == [{'inicio': '03:00', 'fin': '24:00'}]
+
+
+def test_calendario_responde_304_hasta_que_cambian_las_reservas(cliente, contexto):
+    crear_reserva(date(2027, 5, 1), time(12), time(16))
+    url = '/api/reservas?start=2027-05-01&end=2027-06-01'
+
+    respuesta = cliente.get(url)
+    assert respuesta.status_code == 200
+    etag = respuesta.headers['ETag']
+
+    respuesta = cliente.get(url, headers={'If-None-Match': etag})
+    assert respuesta.status_code == 304
+    assert respuesta.data == b''
+
+    crear_reserva(date(2027, 5, 8), time(12), time(16))
+    respuesta = cliente.get(url, headers={'If-None-Match': etag})
+    assert respuesta.status_code == 200
+    assert respuesta.headers['ETag'] != etag
+    assert len(respuesta.get_json()) == 2
+
+
+def test_listado_por_cursor_recorre_todas_las_reservas(cliente, contexto):
+    # Más de dos páginas, con varias reservas el mismo día: el cursor desempata por id
+    total = aplicacion.RESERVAS_POR_PAGINA * 2 + 5
+    ids = [crear_reserva(date(2027, 1, 1 + i // 4), time(8 + i % 4), time(9 + i % 4)) for i in range(total)]
+
+    vistos = []
+    despues = None
+    paginas = 0
+    while True:
+        url = '/reservas?formato=json' + (f'&despues={despues}' if despues else '')
+        pagina = cliente.get(url).get_json()
+        vistos.extend(r['id'] for r in pagina['reservas'])
+        paginas += 1
+        despues = pagina['siguiente']
+        if not despues:
+            break
+
+    assert paginas == 3
+    # De la fecha más reciente a la más antigua y, dentro del día, del id mayor al menor
+    esperado = [reserva_id for _, reserva_id in sorted(((i // 4, reserva_id) for i, reserva_id in enumerate(ids)),
+                                                       reverse=True)]
+    assert vistos == esperado
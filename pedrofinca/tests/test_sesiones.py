@@ -0,0 +1,27 @@
+"""Sesiones de usuario: la cookie solo lleva el id y se revoca al cambiar la contraseña"""
+
+from ayudas import aplicacion
+
+
+def test_la_sesion_no_guarda_el_email(cliente):
+    with cliente.session_transaction() as sesion:
+        assert set(sesion['usuario']) == {'id', 'version', 'expira'}
+        assert 'pruebas@finca.test' not in str(dict(sesion))
+
+
+def test_cambiar_la_contrasena_cierra_las_sesiones(app, cliente):
+    assert cliente.get('/api/dashboard/stats').status_code == 200
+
+    # Contexto propio: con el del fixture 'contexto' el cliente compartiría g (y current_user)
+    with app.app_context():
+        usuario = aplicacion.User.query.filter_by(username='pruebas').one()
+        usuario.set_password('otra clave')
+        aplicacion.db.session.commit()
+
+    respuesta = cliente.get('/api/dashboard/stats')
+    assert respuesta.status_code == 302
+
+    # Con la contraseña nueva se vuelve a entrar
+    respuesta = cliente.post('/login', data={'username': 'pruebas', 'password': 'otra clave'})
+    assert respuesta.status_code == 302
+    assert cliente.get('/api/dashboard/stats').status_code == 200
@@ -0,0 +1,80 @@
+"""
+Cliente HTTP reutilizable para enviar mensajes de WhatsApp con la API REST de Twilio
+
+Mantiene una única sesión (pool de conexiones keep-alive) por proceso y
+permite apuntar a un servidor Twilio falso local con TWILIO_API_URL.
+"""
+
+import threading
+import time
+
+import requests
+
+
+class ErrorEnvio(Exception):
+    """Error al enviar un mensaje; reintentable indica si merece otro intento"""
+
+    def __init__(self, mensaje, reintentable=True):
+        super().__init__(mensaje)
+        self.reintentable = reintentable
+
+
+class ClienteTwilio:
+    """Envío de mensajes con una sesión HTTP compartida entre hilos"""
+
+    def __init__(self, account_sid, auth_token, api_url='https://api.twilio.com', timeout=10):
+        self.account_sid = account_sid
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = (account_sid, auth_token)
+        adaptador = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=10)
+        self.session.mount('https://', adaptador)
+        self.session.mount('http://', adaptador)
+
+    def enviar(self, cuerpo, origen, destino):
+        """Enviar un mensaje y devolver su SID de Twilio"""
+        url = f'{self.api_url}/2010-04-01/Accounts/{self.account_sid}/Messages.json'
+        try:
+            respuesta = self.session.post(url, data={
+                'Body': cuerpo,
+                'From': origen,
+                'To': destino
+            }, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ErrorEnvio(f'Error de conexión con Twilio: {e}')
+
+        if respuesta.status_code in (200, 201):
+            return respuesta.json().get('sid')
+
+        try:
+            detalle = respuesta.json().get('message', respuesta.text)
+        except ValueError:
+            detalle = respuesta.text
+
+        # 429 y 5xx son transitorios; el resto de 4xx no se arregla reintentando
+        reintentable = respuesta.status_code == 429 or respuesta.status_code >= 500
+        raise ErrorEnvio(f'Twilio {respuesta.status_code}: {detalle}', reintentable=reintentable)
+
+
+class LimitadorTasa:
+    """Token bucket: como máximo `tasa` envíos por segundo dentro del proceso"""
+
+    def __init__(self, tasa):
+        self.tasa = float(tasa)
+        self.tokens = self.tasa
+        self.ultima = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self):
+        """Bloquear hasta que haya un token disponible"""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self.tokens = min(self.tasa, self.tokens + (ahora - self.ultima) * self.tasa)
+                self.ultima = ahora
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = (1 - self.tokens) / self.tasa
+            time.sleep(espera)